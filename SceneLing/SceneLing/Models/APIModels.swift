@@ -208,9 +208,20 @@ struct NoteCreateRequest: Codable {
 
 // MARK: - TTS
 
+/// 音频交付方式：url 时服务端返回音频库地址（/api/tts/audio/...），由 AVPlayer 流式播放，
+/// 不再在 JSON / SSE 里内联 base64
+let preferredAudioDelivery = "url"
+
 struct TTSRequest: Codable {
     let text: String
     let voice: String
+    var audioDelivery: String? = preferredAudioDelivery
+
+    enum CodingKeys: String, CodingKey {
+        case text
+        case voice
+        case audioDelivery = "audio_delivery"
+    }
 }
 
 struct TTSResponse: Codable {
@@ -247,16 +258,19 @@ struct ChatMessage: Codable {
     }
 }
 
+/// 服务端按 session_id 保存场景信息和历史：
+/// 首轮（或会话过期后）带上场景字段和 history，之后每轮只发送 message + session_id（nil 字段不编码）
 struct ChatRequest: Codable {
     let message: String
-    let sceneTag: String
-    let sceneTagCn: String
-    let category: String
-    let roles: [String]
-    let userRole: String
-    let aiRole: String
-    let history: [ChatMessage]
+    var sceneTag: String?
+    var sceneTagCn: String?
+    var category: String?
+    var roles: [String]?
+    var userRole: String?
+    var aiRole: String?
+    var history: [ChatMessage]?
     let sessionId: String?
+    var audioDelivery: String? = preferredAudioDelivery
 
     enum CodingKeys: String, CodingKey {
         case message
@@ -268,18 +282,34 @@ struct ChatRequest: Codable {
         case aiRole = "ai_role"
         case history
         case sessionId = "session_id"
+        case audioDelivery = "audio_delivery"
     }
 }
 
 struct ChatResponse: Codable {
     let reply: String
     let translation: String?
+    let audioUrl: String?  // 缓存的开场白会直接带上音频
+
+    enum CodingKeys: String, CodingKey {
+        case reply
+        case translation
+        case audioUrl = "audio_url"
+    }
 }
 
 struct FreeChatRequest: Codable {
     let message: String
-    let history: [ChatMessage]
+    var history: [ChatMessage]?  // 仅首轮（或会话过期后）发送
     let sessionId: String?
+    var audioDelivery: String? = preferredAudioDelivery
+
+    enum CodingKeys: String, CodingKey {
+        case message
+        case history
+        case sessionId = "session_id"
+        case audioDelivery = "audio_delivery"
+    }
 }
 
 // MARK: - ASR (语音识别 / 标点分句)
@@ -194,12 +194,14 @@ class APIService {
     func textToSpeech(text: String, voice: String = "en-US-female") async throws -> URL {
         let request = TTSRequest(text: text, voice: voice)
         let response: TTSResponse = try await post("/tts", body: request)
-        guard let url = URL(string: response.audioUrl) else {
+        // url 模式下为相对路径 /api/tts/audio/...，按当前 API 环境补全
+        guard let url = URL(string: response.audioUrl, relativeTo: URL(string: baseURL))?.absoluteURL else {
             throw APIError.invalidURL
         }
         return url
     }
 
+    /// 返回 data URL 或音频库地址，均可直接交给 AudioQueuePlayer
     func textToSpeechDataURL(text: String, voice: String = "en-US-female") async throws -> String {
         let request = TTSRequest(text: text, voice: voice)
         let response: TTSResponse = try await post("/tts", body: request)
@@ -227,15 +229,41 @@ class APIService {
 
     // MARK: - Chat
 
-    func chat(
+    /// 服务端已保存会话的 session_id：之后每轮只发送 message + session_id，不再上传历史
+    private var establishedSessions = Set<String>()
+    private let sessionLock = NSLock()
+
+    private func isEstablished(_ sessionId: String?) -> Bool {
+        guard let sessionId = sessionId else { return false }
+        sessionLock.lock()
+        defer { sessionLock.unlock() }
+        return establishedSessions.contains(sessionId)
+    }
+
+    private func markEstablished(_ sessionId: String?) {
+        guard let sessionId = sessionId else { return }
+        sessionLock.lock()
+        establishedSessions.insert(sessionId)
+        sessionLock.unlock()
+    }
+
+    private func forgetSession(_ sessionId: String?) {
+        guard let sessionId = sessionId else { return }
+        sessionLock.lock()
+        establishedSessions.remove(sessionId)
+        sessionLock.unlock()
+    }
+
+    /// 首轮（或会话过期后）的完整请求：场景信息 + 历史
+    private func fullChatRequest(
         message: String,
         sceneContext: SceneAnalyzeResponse,
         userRole: Role,
         aiRole: Role,
         history: [(String, Bool)],
         sessionId: String?
-    ) async throws -> String {
-        let request = ChatRequest(
+    ) -> ChatRequest {
+        ChatRequest(
             message: message,
             sceneTag: sceneContext.sceneTag,
             sceneTagCn: sceneContext.sceneTagCn,
@@ -246,7 +274,24 @@ class APIService {
             history: history.map { ChatMessage(content: $0.0, isUser: $0.1) },
             sessionId: sessionId
         )
-        let response: ChatResponse = try await post("/chat", body: request)
+    }
+
+    func chat(
+        message: String,
+        sceneContext: SceneAnalyzeResponse,
+        userRole: Role,
+        aiRole: Role,
+        history: [(String, Bool)],
+        sessionId: String?
+    ) async throws -> String {
+        let response = try await chatResponse(
+            message: message,
+            sceneContext: sceneContext,
+            userRole: userRole,
+            aiRole: aiRole,
+            history: history,
+            sessionId: sessionId
+        )
         return response.reply
     }
 
@@ -258,18 +303,26 @@ class APIService {
         history: [(String, Bool)],
         sessionId: String?
     ) async throws -> ChatResponse {
-        let request = ChatRequest(
+        if isEstablished(sessionId) {
+            do {
+                return try await post("/chat", body: ChatRequest(message: message, sessionId: sessionId))
+            } catch APIError.serverError(400, _) {
+                // 服务端会话已过期，带上完整场景信息和历史重发
+                forgetSession(sessionId)
+            }
+        }
+
+        let request = fullChatRequest(
             message: message,
-            sceneTag: sceneContext.sceneTag,
-            sceneTagCn: sceneContext.sceneTagCn,
-            category: sceneContext.category,
-            roles: sceneContext.expressions.roles.map { "\($0.roleEn) (\($0.roleCn))" },
-            userRole: "\(userRole.roleEn) (\(userRole.roleCn))",
-            aiRole: "\(aiRole.roleEn) (\(aiRole.roleCn))",
-            history: history.map { ChatMessage(content: $0.0, isUser: $0.1) },
+            sceneContext: sceneContext,
+            userRole: userRole,
+            aiRole: aiRole,
+            history: history,
             sessionId: sessionId
         )
-        return try await post("/chat", body: request)
+        let response: ChatResponse = try await post("/chat", body: request)
+        markEstablished(sessionId)
+        return response
     }
 
     func chatStream(
@@ -282,27 +335,35 @@ class APIService {
         onEvent: @escaping (SSEEvent) -> Void,
         onComplete: @escaping () -> Void
     ) -> SSEClient {
-        let request = ChatRequest(
+        let fullRequest = fullChatRequest(
             message: message,
-            sceneTag: sceneContext.sceneTag,
-            sceneTagCn: sceneContext.sceneTagCn,
-            category: sceneContext.category,
-            roles: sceneContext.expressions.roles.map { "\($0.roleEn) (\($0.roleCn))" },
-            userRole: "\(userRole.roleEn) (\(userRole.roleCn))",
-            aiRole: "\(aiRole.roleEn) (\(aiRole.roleCn))",
-            history: history.map { ChatMessage(content: $0.0, isUser: $0.1) },
+            sceneContext: sceneContext,
+            userRole: userRole,
+            aiRole: aiRole,
+            history: history,
             sessionId: sessionId
         )
-
-        let url = URL(string: "\(baseURL)/chat/stream")!
-        let body = try! JSONEncoder().encode(request)
+        let fullBody = try! JSONEncoder().encode(fullRequest)
 
         let client = SSEClient()
+        var body = fullBody
+        if isEstablished(sessionId) {
+            body = try! JSONEncoder().encode(ChatRequest(message: message, sessionId: sessionId))
+            // 会话过期时服务端返回 400，改发完整请求
+            client.fallbackBody = fullBody
+        }
+
+        let url = URL(string: "\(baseURL)/chat/stream")!
         client.connect(
             url: url,
             body: body,
             token: token,
-            onEvent: onEvent,
+            onEvent: { [weak self] event in
+                if case .done = event {
+                    self?.markEstablished(sessionId)
+                }
+                onEvent(event)
+            },
             onComplete: onComplete
         )
 
@@ -317,21 +378,31 @@ class APIService {
         onEvent: @escaping (SSEEvent) -> Void,
         onComplete: @escaping () -> Void
     ) -> SSEClient {
-        let request = FreeChatRequest(
+        let fullRequest = FreeChatRequest(
             message: message,
             history: history.map { ChatMessage(content: $0.0, isUser: $0.1) },
             sessionId: sessionId
         )
-
-        let url = URL(string: "\(baseURL)/chat/free/stream")!
-        let body = try! JSONEncoder().encode(request)
+        let fullBody = try! JSONEncoder().encode(fullRequest)
 
         let client = SSEClient()
+        var body = fullBody
+        if isEstablished(sessionId) {
+            body = try! JSONEncoder().encode(FreeChatRequest(message: message, sessionId: sessionId))
+            client.fallbackBody = fullBody
+        }
+
+        let url = URL(string: "\(baseURL)/chat/free/stream")!
         client.connect(
             url: url,
             body: body,
             token: token,
-            onEvent: onEvent,
+            onEvent: { [weak self] event in
+                if case .done = event {
+                    self?.markEstablished(sessionId)
+                }
+                onEvent(event)
+            },
             onComplete: onComplete
         )
 
@@ -32,6 +32,12 @@ class AudioQueuePlayer: ObservableObject {
     func enqueue(dataURL: String) {
         print("[AudioQueuePlayer] enqueue dataURL, length: \(dataURL.count)")
 
+        // 服务端以 url 模式返回音频库地址时直接交给 AVPlayer 流式播放
+        if let remoteURL = remoteAudioURL(dataURL) {
+            enqueue(url: remoteURL)
+            return
+        }
+
         guard let (audioData, fileExtension) = decodeDataURL(dataURL) else {
             print("[AudioQueuePlayer] Failed to decode data URL")
             print("[AudioQueuePlayer] URL prefix: \(String(dataURL.prefix(100)))")
@@ -60,6 +66,11 @@ class AudioQueuePlayer: ObservableObject {
         // 先停止当前播放
         stop()
 
+        if let remoteURL = remoteAudioURL(dataURL) {
+            playNow(url: remoteURL)
+            return
+        }
+
         guard let (audioData, fileExtension) = decodeDataURL(dataURL) else {
             print("[AudioQueuePlayer] Failed to decode data URL")
             return
@@ -207,6 +218,16 @@ class AudioQueuePlayer: ObservableObject {
         }
     }
 
+    /// 音频库地址（/api/tts/audio/...），相对路径按当前 API 环境补全
+    private func remoteAudioURL(_ string: String) -> URL? {
+        guard !string.hasPrefix("data:") else { return nil }
+        if string.hasPrefix("http://") || string.hasPrefix("https://") {
+            return URL(string: string)
+        }
+        guard string.hasPrefix("/"), let base = URL(string: APIEnvironment.current.baseURL) else { return nil }
+        return URL(string: string, relativeTo: base)?.absoluteURL
+    }
+
     private func decodeDataURL(_ dataURL: String) -> (Data, String)? {
         guard dataURL.hasPrefix("data:") else { return nil }
 
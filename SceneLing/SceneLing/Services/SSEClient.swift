@@ -16,6 +16,11 @@ class SSEClient: NSObject, URLSessionDataDelegate {
     private var session: URLSession?
     private var dataTask: URLSessionDataTask?
     private var buffer = Data()
+    private var request: URLRequest?
+    private var statusCode = 200
+
+    /// 服务端返回 400（如会话已过期）时改用该请求体重连一次，不向调用方报告失败
+    var fallbackBody: Data?
 
     private var onEvent: ((SSEEvent) -> Void)?
     private var onComplete: (() -> Void)?
@@ -47,6 +52,7 @@ class SSEClient: NSObject, URLSessionDataDelegate {
 
         request.httpBody = body
 
+        self.request = request
         dataTask = session?.dataTask(with: request)
         dataTask?.resume()
     }
@@ -110,12 +116,43 @@ class SSEClient: NSObject, URLSessionDataDelegate {
 
     // MARK: - URLSessionDataDelegate
 
+    func urlSession(
+        _ session: URLSession,
+        dataTask: URLSessionDataTask,
+        didReceive response: URLResponse,
+        completionHandler: @escaping (URLSession.ResponseDisposition) -> Void
+    ) {
+        statusCode = (response as? HTTPURLResponse)?.statusCode ?? 200
+        completionHandler(.allow)
+    }
+
     func urlSession(_ session: URLSession, dataTask: URLSessionDataTask, didReceive data: Data) {
         buffer.append(data)
+        // 非 2xx 响应是 JSON 错误体，结束时再统一处理
+        guard 200...299 ~= statusCode else { return }
         processBuffer()
     }
 
     func urlSession(_ session: URLSession, task: URLSessionTask, didCompleteWithError error: Error?) {
+        if error == nil, statusCode == 400, let body = fallbackBody, var request = request {
+            fallbackBody = nil
+            buffer = Data()
+            statusCode = 200
+            request.httpBody = body
+            self.request = request
+            dataTask = session.dataTask(with: request)
+            dataTask?.resume()
+            return
+        }
+
+        if error == nil, !(200...299 ~= statusCode) {
+            let detail = (try? JSONSerialization.jsonObject(with: buffer) as? [String: Any])?["detail"] as? String
+            let message = detail ?? "服务器错误（\(statusCode)）"
+            DispatchQueue.main.async {
+                self.onEvent?(.error(message))
+            }
+        }
+
         if let error = error {
             DispatchQueue.main.async {
                 self.onEvent?(.error(error.localizedDescription))
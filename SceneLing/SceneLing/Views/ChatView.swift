@@ -9,6 +9,7 @@ class LocalChatMessage: Identifiable, ObservableObject {
     let timestamp = Date()
     var roleName: String = ""
     var cachedAudioURL: String?  // 缓存TTS音频URL (AI消息)
+    var audioSegmentCount = 0  // 已收到的按句音频数量
     var recordedAudioData: Data?  // 缓存录音数据 (用户消息)
     @Published var translation: String?  // 中文翻译
     @Published var showTranslation: Bool = false
@@ -24,6 +25,12 @@ class LocalChatMessage: Identifiable, ObservableObject {
     func append(_ text: String) {
         content += text
     }
+
+    /// 服务端按句推送音频：单句回复直接缓存，多句回复重放时重新合成整段
+    func receiveAudioSegment(_ url: String) {
+        audioSegmentCount += 1
+        cachedAudioURL = audioSegmentCount == 1 ? url : nil
+    }
 }
 
 struct ChatView: View {
@@ -324,6 +331,12 @@ struct ChatView: View {
                 await MainActor.run {
                     aiMessage.content = response.reply
                     aiMessage.translation = response.translation
+                    if let audioURL = response.audioUrl {
+                        aiMessage.cachedAudioURL = audioURL
+                        if self.enableTTS {
+                            self.audioPlayer.enqueue(dataURL: audioURL)
+                        }
+                    }
                     self.isLoading = false
                 }
             } catch {
@@ -361,15 +374,15 @@ struct ChatView: View {
                     aiMessage?.append(text)
 
                 case .textFull(let text):
-                    aiMessage?.append(text)
+                    // 完整文本覆盖已逐字追加的 text_delta
+                    aiMessage?.content = text
 
                 case .translation(let text):
                     aiMessage?.translation = text
 
                 case .audio(let url, _):
-                    // 缓存音频URL到消息对象
                     print("[ChatView] Received audio event, URL length: \(url.count)")
-                    aiMessage?.cachedAudioURL = url
+                    aiMessage?.receiveAudioSegment(url)
                     if self.enableTTS {
                         print("[ChatView] TTS enabled, enqueueing audio")
                         self.audioPlayer.enqueue(dataURL: url)
@@ -434,14 +447,15 @@ struct ChatView: View {
                     aiMessage?.append(text)
 
                 case .textFull(let text):
-                    aiMessage?.append(text)
+                    // 完整文本覆盖已逐字追加的 text_delta
+                    aiMessage?.content = text
 
                 case .translation(let text):
                     aiMessage?.translation = text
 
                 case .audio(let url, _):
                     print("[ChatView] Received audio event (voice), URL length: \(url.count)")
-                    aiMessage?.cachedAudioURL = url
+                    aiMessage?.receiveAudioSegment(url)
                     if self.enableTTS {
                         print("[ChatView] TTS enabled, enqueueing audio (voice)")
                         self.audioPlayer.enqueue(dataURL: url)
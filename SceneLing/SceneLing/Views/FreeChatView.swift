@@ -266,13 +266,14 @@ struct FreeChatView: View {
                     aiMessage?.append(text)
 
                 case .textFull(let text):
-                    aiMessage?.append(text)
+                    // 完整文本覆盖已逐字追加的 text_delta
+                    aiMessage?.content = text
 
                 case .translation(let text):
                     aiMessage?.translation = text
 
                 case .audio(let url, _):
-                    aiMessage?.cachedAudioURL = url
+                    aiMessage?.receiveAudioSegment(url)
                     if self.enableTTS {
                         self.audioPlayer.enqueue(dataURL: url)
                     }
@@ -324,13 +325,14 @@ struct FreeChatView: View {
                     aiMessage?.append(text)
 
                 case .textFull(let text):
-                    aiMessage?.append(text)
+                    // 完整文本覆盖已逐字追加的 text_delta
+                    aiMessage?.content = text
 
                 case .translation(let text):
                     aiMessage?.translation = text
 
                 case .audio(let url, _):
-                    aiMessage?.cachedAudioURL = url
+                    aiMessage?.receiveAudioSegment(url)
                     if self.enableTTS {
                         self.audioPlayer.enqueue(dataURL: url)
                     }
@@ -0,0 +1,10 @@
+"""
+SSE（Server-Sent Events）工具：流式接口（对话、场景识别、语音合成）共用
+"""
+import json
+from typing import Any, Dict
+
+
+def sse_event(payload: Dict[str, Any]) -> str:
+    """一个 SSE 事件：data 为 JSON（保留中文，不转义）"""
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
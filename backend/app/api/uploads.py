@@ -0,0 +1,87 @@
+"""
+图片上传处理
+
+Starlette 接收 multipart 时已把文件写入 SpooledTemporaryFile，
+这里不再 read() 整张图片，而是让它落盘后做只读 mmap：
+- 内存占用由页缓存承担，不随并发上传线性增长
+- mmap 持有自己的文件描述符，响应结束、上传文件关闭后仍可继续使用
+单张图片的接口用 mapped_image_upload，预处理完成后即关闭映射
+"""
+import asyncio
+import mmap
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List
+
+from fastapi import HTTPException, UploadFile, status
+
+from app.core.config import settings
+from app.services.image_preprocess import release_buffer
+
+
+def validate_image_upload(image: UploadFile) -> None:
+    """校验上传文件类型"""
+    if not image.content_type or not image.content_type.startswith("image/"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="只支持图片文件"
+        )
+
+
+def _map_upload(image: UploadFile) -> mmap.mmap:
+    file = image.file
+    file.flush()
+    # SpooledTemporaryFile.fileno() 会把内存中的部分写入磁盘
+    fd = file.fileno()
+    size = os.fstat(fd).st_size
+
+    if size == 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="图片为空"
+        )
+    if size > settings.MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"图片过大，最大 {settings.MAX_UPLOAD_BYTES // (1024 * 1024)} MB"
+        )
+
+    return mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+
+
+async def map_image_upload(image: UploadFile) -> mmap.mmap:
+    """
+    校验并映射上传图片，返回只读 mmap
+
+    Raises:
+        HTTPException: 类型不对（400）、空文件（400）、超过 MAX_UPLOAD_BYTES（413）
+    """
+    validate_image_upload(image)
+    return await asyncio.to_thread(_map_upload, image)
+
+
+@asynccontextmanager
+async def mapped_image_upload(image: UploadFile) -> AsyncIterator[mmap.mmap]:
+    """map_image_upload 的上下文管理器形式，退出时关闭映射"""
+    buffer = await map_image_upload(image)
+    try:
+        yield buffer
+    finally:
+        release_buffer(buffer)
+
+
+async def map_image_uploads(images: List[UploadFile]) -> List[mmap.mmap]:
+    """批量映射；其中一张失败（400 / 413）时关闭已映射的文件后再抛出"""
+    buffers: List[mmap.mmap] = []
+    try:
+        for image in images:
+            buffers.append(await map_image_upload(image))
+    except BaseException:
+        release_buffers(buffers)
+        raise
+    return buffers
+
+
+def release_buffers(buffers: List[mmap.mmap]) -> None:
+    for buffer in buffers:
+        release_buffer(buffer)
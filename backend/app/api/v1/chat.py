@@ -1,56 +1,220 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, status
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, ValidationError
+from contextlib import aclosing
+from typing import Any, AsyncGenerator, Dict, List, Literal, Optional
+import asyncio
 import json
+import uuid
 
+from app.api.sse import sse_event
+from app.core.config import settings
+from app.services.aliyun_tts import output_format
+from app.services.audio_store import DELIVERY_BYTES, decode_data_url, extension_for, redeliver_audio
 from app.services.chat import chat_with_scene, chat_with_scene_stream, free_chat_stream
-from app.services.aliyun_tts import text_to_speech
+from app.services.chat_openers import get_opener, is_opener_request
+from app.services.chat_pipeline import reply_events
+from app.services.chat_sessions import load_session, prompt_history, record_turn
 from app.services.translation import translate_to_zh
 
 router = APIRouter()
 
+CHAT_FAILED_REPLY = "Sorry, something went wrong. (抱歉，出了点问题。)"
+
 
 class ChatMessage(BaseModel):
     content: str
     is_user: bool
 
 
+AudioDelivery = Literal["data_url", "url"]
+AudioCodec = Literal["wav", "mp3", "opus"]
+
+
 class ChatRequest(BaseModel):
+    """
+    场景对话请求
+
+    带 session_id 时服务端保存场景信息和历史，之后每轮只需发送 message；
+    首轮（或会话过期后）需带上完整场景信息
+
+    audio_delivery: 音频事件的 url 是 data URL 还是音频库地址，默认见 TTS_AUDIO_DELIVERY
+    audio_format: 语音格式（mp3 / opus 比 WAV 小数倍），默认见 TTS_OUTPUT_FORMAT
+    """
     message: str
-    scene_tag: str
-    scene_tag_cn: str
-    category: str
-    roles: List[str]
-    user_role: str
-    ai_role: str
-    history: Optional[List[ChatMessage]] = []
+    scene_tag: Optional[str] = None
+    scene_tag_cn: Optional[str] = None
+    category: Optional[str] = None
+    roles: Optional[List[str]] = None
+    user_role: Optional[str] = None
+    ai_role: Optional[str] = None
+    history: Optional[List[ChatMessage]] = None
     session_id: Optional[str] = None
+    audio_delivery: Optional[AudioDelivery] = None
+    audio_format: Optional[AudioCodec] = None
+
+
+_SCENE_FIELDS = ("scene_tag", "scene_tag_cn", "category", "roles", "user_role", "ai_role")
+
+
+def _history(messages: Optional[List[ChatMessage]]) -> List[Dict[str, Any]]:
+    return [
+        {"content": msg.content, "is_user": msg.is_user}
+        for msg in (messages or [])
+    ]
+
+
+async def _load_scene_session(request: ChatRequest) -> Dict[str, Any]:
+    """合并请求与服务端会话，缺少场景信息时返回 400"""
+    context = None
+    if all(getattr(request, field) is not None for field in _SCENE_FIELDS):
+        context = {field: getattr(request, field) for field in _SCENE_FIELDS}
+
+    session = await load_session(
+        request.session_id, context, _history(request.history), request.message
+    )
+    if session["context"] is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="缺少场景信息或会话已过期，请重新开始对话"
+        )
+    return session
 
 
 class ChatResponse(BaseModel):
     reply: str
     translation: Optional[str] = None
+    audio_url: Optional[str] = None  # 仅缓存的开场白带音频
+
+
+async def _cached_opener(
+    request: ChatRequest,
+    session: Dict[str, Any],
+    audio_delivery: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """首轮开场白走缓存（同一场景 + 角色组合共享），命中后记入会话；音频按请求的 audio_format 返回"""
+    if not is_opener_request(request.message, session["history"]):
+        return None
+    opener = await get_opener(session["context"], output_format(request.audio_format))
+    if not opener:
+        return None
+
+    await record_turn(request.session_id, session, request.message, opener["reply"])
+    if audio_delivery == DELIVERY_BYTES:
+        return opener
+    return {**opener, "audio_url": await redeliver_audio(opener.get("audio_url"), audio_delivery)}
+
+
+def _opener_events(opener: Dict[str, Any]) -> List[Dict[str, Any]]:
+    events: List[Dict[str, Any]] = [{"type": "text_full", "content": opener["reply"]}]
+    if opener.get("translation"):
+        events.append({"type": "translation", "content": opener["translation"]})
+    if opener.get("audio_url"):
+        events.append({"type": "audio", "url": opener["audio_url"], "text": opener["reply"], "index": 0})
+    events.append({"type": "done"})
+    return events
+
+
+async def _recorded(
+    events: AsyncGenerator[Dict[str, Any], None],
+    session_id: Optional[str],
+    session: Dict[str, Any],
+    message: str
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """透传事件，完整回复生成后记入会话"""
+    # 客户端断开时关闭事件流，取消进行中的模型、翻译和 TTS 调用
+    async with aclosing(events):
+        async for event in events:
+            if event["type"] == "text_full":
+                await record_turn(session_id, session, message, event["content"])
+            yield event
+
+
+async def _scene_turn_events(
+    request: ChatRequest,
+    session: Dict[str, Any],
+    audio_delivery: Optional[str] = None
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """场景对话一轮的事件（SSE 与 WebSocket 共用）"""
+    audio_delivery = audio_delivery or request.audio_delivery
+    opener = await _cached_opener(request, session, audio_delivery)
+    if opener:
+        for event in _opener_events(opener):
+            yield event
+        return
+
+    combined = settings.CHAT_COMBINED_TRANSLATION
+    summary, history = prompt_history(session)
+    reply = chat_with_scene_stream(
+        message=request.message,
+        history=history,
+        summary=summary,
+        with_translation=combined,
+        **session["context"]
+    )
+    events = _recorded(
+        reply_events(
+            reply, request.session_id,
+            audio_delivery=audio_delivery, translation_in_reply=combined,
+            audio_format=output_format(request.audio_format)
+        ),
+        request.session_id, session, request.message
+    )
+    async with aclosing(events):
+        async for event in events:
+            yield event
+
+
+async def _free_turn_events(
+    request: "FreeChatRequest",
+    session: Dict[str, Any],
+    audio_delivery: Optional[str] = None
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """自由对话一轮的事件（SSE 与 WebSocket 共用）"""
+    audio_delivery = audio_delivery or request.audio_delivery
+    combined = settings.CHAT_COMBINED_TRANSLATION
+    summary, history = prompt_history(session)
+    reply = free_chat_stream(
+        message=request.message,
+        history=history,
+        summary=summary,
+        with_translation=combined
+    )
+    events = _recorded(
+        reply_events(
+            reply, request.session_id,
+            audio_delivery=audio_delivery, translation_in_reply=combined,
+            audio_format=output_format(request.audio_format)
+        ),
+        request.session_id, session, request.message
+    )
+    async with aclosing(events):
+        async for event in events:
+            yield event
 
 
 @router.post("", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """AI对话接口 - 非流式"""
-    history = [
-        {"content": msg.content, "is_user": msg.is_user}
-        for msg in (request.history or [])
-    ]
+    session = await _load_scene_session(request)
+
+    opener = await _cached_opener(request, session, request.audio_delivery)
+    if opener:
+        return ChatResponse(**opener)
+
+    summary, history = prompt_history(session)
 
     reply = await chat_with_scene(
         message=request.message,
-        scene_tag=request.scene_tag,
-        scene_tag_cn=request.scene_tag_cn,
-        category=request.category,
-        roles=request.roles,
-        user_role=request.user_role,
-        ai_role=request.ai_role,
-        history=history
+        history=history,
+        summary=summary,
+        **session["context"]
     )
+    if reply is None:
+        # 失败的兜底回复不记入会话，否则之后每轮都会作为助手消息发给模型
+        return ChatResponse(reply=CHAT_FAILED_REPLY)
+
+    await record_turn(request.session_id, session, request.message, reply)
     translation = await translate_to_zh(reply, request.session_id)
 
     return ChatResponse(reply=reply, translation=translation)
@@ -62,77 +226,25 @@ async def chat_stream(request: ChatRequest):
     AI对话接口 - 流式 SSE
 
     返回事件格式:
+    - {"type": "text_delta", "content": "新增文本"} - 逐 token 推送
+    - {"type": "audio", "url": "...", "text": "句子", "index": 0} - 按句合成，按顺序推送
     - {"type": "text_full", "content": "完整文本"}
-    - {"type": "audio", "url": "...", "text": "完整文本"}
+    - {"type": "translation", "content": "中文翻译"}
     - {"type": "done"}
     - {"type": "error", "content": "错误信息"}
     """
-    history = [
-        {"content": msg.content, "is_user": msg.is_user}
-        for msg in (request.history or [])
-    ]
+    session = await _load_scene_session(request)
 
     async def event_generator():
         """SSE 事件生成器"""
         try:
-            async for event_type, content in chat_with_scene_stream(
-                message=request.message,
-                scene_tag=request.scene_tag,
-                scene_tag_cn=request.scene_tag_cn,
-                category=request.category,
-                roles=request.roles,
-                user_role=request.user_role,
-                ai_role=request.ai_role,
-                history=history
-            ):
-                if event_type == "final":
-                    # 发送完整文本
-                    data = json.dumps({
-                        "type": "text_full",
-                        "content": content
-                    }, ensure_ascii=False)
-                    yield f"data: {data}\n\n"
-
-                    translation = await translate_to_zh(content, request.session_id)
-                    if translation:
-                        data = json.dumps({
-                            "type": "translation",
-                            "content": translation
-                        }, ensure_ascii=False)
-                        yield f"data: {data}\n\n"
-
-                    # 生成整段 TTS（等待文本完全生成后再发音）
-                    english_text = _extract_english(content)
-                    if english_text and len(english_text) > 3:
-                        try:
-                            audio_url = await text_to_speech(english_text, "en-US-female")
-                            if audio_url:
-                                data = json.dumps({
-                                    "type": "audio",
-                                    "url": audio_url,
-                                    "text": english_text
-                                }, ensure_ascii=False)
-                                yield f"data: {data}\n\n"
-                        except Exception as tts_err:
-                            print(f"[TTS] Error: {tts_err}")
-
-                elif event_type == "done":
-                    data = json.dumps({"type": "done"})
-                    yield f"data: {data}\n\n"
-
-                elif event_type == "error":
-                    data = json.dumps({
-                        "type": "error",
-                        "content": content
-                    }, ensure_ascii=False)
-                    yield f"data: {data}\n\n"
+            events = _scene_turn_events(request, session)
+            async with aclosing(events):
+                async for event in events:
+                    yield sse_event(event)
 
         except Exception as e:
-            error_data = json.dumps({
-                "type": "error",
-                "content": str(e)
-            }, ensure_ascii=False)
-            yield f"data: {error_data}\n\n"
+            yield sse_event({"type": "error", "content": str(e)})
 
     return StreamingResponse(
         event_generator(),
@@ -146,9 +258,32 @@ async def chat_stream(request: ChatRequest):
 
 
 class FreeChatRequest(BaseModel):
+    """
+    自由对话请求，带 session_id 时历史保存在服务端，之后每轮只需发送 message
+
+    首轮（或会话过期后）带上 history（可为空列表）；
+    省略 history 而服务端没有该会话时返回 400，客户端应带上完整历史重试
+    """
     message: str
-    history: Optional[List[ChatMessage]] = []
+    history: Optional[List[ChatMessage]] = None
     session_id: Optional[str] = None
+    audio_delivery: Optional[AudioDelivery] = None
+    audio_format: Optional[AudioCodec] = None
+
+
+async def _load_free_session(request: FreeChatRequest) -> Dict[str, Any]:
+    """合并请求与服务端会话，会话已过期且请求未带历史时返回 400"""
+    session = await load_session(
+        request.session_id, history=_history(request.history), message=request.message
+    )
+    # 保存过的会话至少有一轮消息或摘要，两者都没有说明会话不存在
+    expired = not session["history"] and not session["summary"]
+    if request.session_id and request.history is None and expired:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="会话已过期，请重新开始对话"
+        )
+    return session
 
 
 @router.post("/free/stream")
@@ -157,71 +292,25 @@ async def free_chat_stream_endpoint(request: FreeChatRequest):
     自由对话接口 - 流式 SSE（无场景限制）
 
     返回事件格式:
+    - {"type": "text_delta", "content": "新增文本"} - 逐 token 推送
+    - {"type": "audio", "url": "...", "text": "句子", "index": 0} - 按句合成，按顺序推送
     - {"type": "text_full", "content": "完整文本"}
-    - {"type": "audio", "url": "...", "text": "完整文本"}
+    - {"type": "translation", "content": "中文翻译"}
     - {"type": "done"}
     - {"type": "error", "content": "错误信息"}
     """
-    history = [
-        {"content": msg.content, "is_user": msg.is_user}
-        for msg in (request.history or [])
-    ]
+    session = await _load_free_session(request)
 
     async def event_generator():
         """SSE 事件生成器"""
         try:
-            async for event_type, content in free_chat_stream(
-                message=request.message,
-                history=history
-            ):
-                if event_type == "final":
-                    # 发送完整文本
-                    data = json.dumps({
-                        "type": "text_full",
-                        "content": content
-                    }, ensure_ascii=False)
-                    yield f"data: {data}\n\n"
-
-                    translation = await translate_to_zh(content, request.session_id)
-                    if translation:
-                        data = json.dumps({
-                            "type": "translation",
-                            "content": translation
-                        }, ensure_ascii=False)
-                        yield f"data: {data}\n\n"
-
-                    # 生成整段 TTS
-                    english_text = _extract_english(content)
-                    if english_text and len(english_text) > 3:
-                        try:
-                            audio_url = await text_to_speech(english_text, "en-US-female")
-                            if audio_url:
-                                data = json.dumps({
-                                    "type": "audio",
-                                    "url": audio_url,
-                                    "text": english_text
-                                }, ensure_ascii=False)
-                                yield f"data: {data}\n\n"
-                        except Exception as tts_err:
-                            print(f"[TTS] Error: {tts_err}")
-
-                elif event_type == "done":
-                    data = json.dumps({"type": "done"})
-                    yield f"data: {data}\n\n"
-
-                elif event_type == "error":
-                    data = json.dumps({
-                        "type": "error",
-                        "content": content
-                    }, ensure_ascii=False)
-                    yield f"data: {data}\n\n"
+            events = _free_turn_events(request, session)
+            async with aclosing(events):
+                async for event in events:
+                    yield sse_event(event)
 
         except Exception as e:
-            error_data = json.dumps({
-                "type": "error",
-                "content": str(e)
-            }, ensure_ascii=False)
-            yield f"data: {error_data}\n\n"
+            yield sse_event({"type": "error", "content": str(e)})
 
     return StreamingResponse(
         event_generator(),
@@ -234,13 +323,186 @@ async def free_chat_stream_endpoint(request: FreeChatRequest):
     )
 
 
-def _extract_english(text: str) -> str:
+class _ChatSocket:
     """
-    从混合文本中提取英文部分
-    例如: "Hello! (你好！)" -> "Hello!"
+    一条 /chat/ws 连接：一个练习会话，多轮对话复用同一连接
+
+    同一时间只有一轮回复在发送；回复过程中收到新消息或 cancel 时，
+    先取消当前一轮（模型、翻译、TTS 一起停止）再处理
     """
-    import re
-    # 移除括号及其内容（中文翻译）
-    result = re.sub(r'\([^)]*[\u4e00-\u9fff][^)]*\)', '', text)
-    result = re.sub(r'（[^）]*[\u4e00-\u9fff][^）]*）', '', result)
-    return result.strip()
+
+    def __init__(self, websocket: WebSocket, session_id: str, free: bool) -> None:
+        self.websocket = websocket
+        self.session_id = session_id
+        self.free = free
+        self._send_lock = asyncio.Lock()
+        self._turn: Optional[asyncio.Task] = None
+        self._closed = False
+
+    async def _send_frames(self, *frames: Any) -> None:
+        """
+        在同一把锁内依次发送文本 / 二进制帧
+        连接已断开时统一抛出 WebSocketDisconnect，由调用方按断开处理
+        """
+        async with self._send_lock:
+            if self._closed:
+                raise WebSocketDisconnect()
+            try:
+                for frame in frames:
+                    if isinstance(frame, bytes):
+                        await self.websocket.send_bytes(frame)
+                    else:
+                        await self.websocket.send_text(frame)
+            except WebSocketDisconnect:
+                self._closed = True
+                raise
+            except Exception as e:
+                # 客户端已断开时不同服务器抛出的异常不同（RuntimeError、ConnectionClosed 等）
+                self._closed = True
+                raise WebSocketDisconnect() from e
+
+    async def send_json(self, payload: Dict[str, Any]) -> None:
+        await self._send_frames(json.dumps(payload, ensure_ascii=False))
+
+    async def send_event(self, event: Dict[str, Any]) -> None:
+        """
+        发送一个对话事件；音频拆成 JSON 描述帧 + 紧随其后的二进制 WAV 帧，
+        两帧在同一把锁内发送，中间不会插入其他帧
+        """
+        if event["type"] != "audio":
+            await self.send_json(event)
+            return
+
+        audio = event.get("data")
+        codec = event.get("format")
+        decoded = decode_data_url(event.get("url") or "")
+        if audio is None and decoded is not None:
+            # 缓存的开场白音频是数据 URL，解码后按二进制发送
+            audio, codec = decoded[0], extension_for(decoded[1])
+        if audio is None:
+            await self.send_json(event)
+            return
+
+        meta = {
+            "type": "audio",
+            "text": event["text"],
+            "index": event["index"],
+            "format": codec or "wav",
+            "size": len(audio),
+        }
+        await self._send_frames(json.dumps(meta, ensure_ascii=False), audio)
+
+    async def cancel_turn(self) -> None:
+        if self._turn is not None and not self._turn.done():
+            self._turn.cancel()
+            await asyncio.gather(self._turn, return_exceptions=True)
+        self._turn = None
+
+    async def _run_turn(self, data: Dict[str, Any]) -> None:
+        try:
+            payload = {**data, "session_id": self.session_id}
+            if self.free:
+                request = FreeChatRequest.model_validate(payload)
+                # session_id 可能由服务端生成，首轮不带 history，这里不做过期判断
+                session = await load_session(
+                    self.session_id, history=_history(request.history), message=request.message
+                )
+                events = _free_turn_events(request, session, DELIVERY_BYTES)
+            else:
+                request = ChatRequest.model_validate(payload)
+                session = await _load_scene_session(request)
+                events = _scene_turn_events(request, session, DELIVERY_BYTES)
+
+            async with aclosing(events):
+                async for event in events:
+                    await self.send_event(event)
+
+        except asyncio.CancelledError:
+            raise
+        except WebSocketDisconnect:
+            pass
+        except HTTPException as e:
+            await self._send_error(e.detail)
+        except ValidationError as e:
+            await self._send_error(f"消息格式错误: {e.errors()[0]['msg']}")
+        except Exception as e:
+            await self._send_error(str(e))
+
+    async def _send_error(self, content: str) -> None:
+        try:
+            await self.send_json({"type": "error", "content": content})
+        except WebSocketDisconnect:
+            # 连接已断开，无需再通知
+            pass
+
+    async def handle(self, data: Dict[str, Any]) -> None:
+        frame_type = data.get("type", "message")
+        if frame_type == "cancel":
+            await self.cancel_turn()
+            await self.send_json({"type": "cancelled"})
+        elif frame_type == "ping":
+            await self.send_json({"type": "pong"})
+        elif frame_type == "message":
+            # 打断：新消息到达时取消仍在进行的回复
+            await self.cancel_turn()
+            self._turn = asyncio.create_task(self._run_turn(data))
+        else:
+            await self.send_json({"type": "error", "content": f"未知的消息类型: {frame_type}"})
+
+    async def serve(self) -> None:
+        try:
+            await self.send_json({"type": "session", "session_id": self.session_id})
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                text = message.get("text")
+                if text is None:
+                    await self.send_json({"type": "error", "content": "仅支持文本帧（JSON）"})
+                    continue
+                try:
+                    data = json.loads(text)
+                except ValueError:
+                    data = None
+                if not isinstance(data, dict):
+                    await self.send_json({"type": "error", "content": "消息必须是 JSON 对象"})
+                    continue
+                await self.handle(data)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self._closed = True
+            await self.cancel_turn()
+
+
+@router.websocket("/ws")
+async def chat_websocket(
+    websocket: WebSocket,
+    session_id: Optional[str] = None,
+    mode: str = "scene"
+):
+    """
+    AI对话接口 - WebSocket（一个练习会话一条连接）
+
+    连接: /api/chat/ws?session_id=...&mode=scene|free
+    未带 session_id 时服务端生成，连接建立后先下发
+    {"type": "session", "session_id": "..."}；断线重连时带上即可继续对话
+
+    客户端发送（文本帧，JSON）:
+    - {"type": "message", "message": "...", 场景字段...} - 字段同 POST /chat/stream，
+      场景信息只需在第一轮（或会话过期后）发送
+    - {"type": "cancel"} - 打断当前回复
+    - {"type": "ping"}
+
+    服务端发送:
+    - 文本帧: 与 /chat/stream 相同的 text_delta / text_full / translation / done / error 事件
+    - 音频: 先发文本帧 {"type": "audio", "text": "句子", "index": 0, "format": "wav", "size": 字节数}，
+      紧接着一个二进制帧为该句的音频数据（不再 base64 编码）；消息带 audio_format 时可为 mp3 / opus
+    """
+    await websocket.accept()
+    connection = _ChatSocket(
+        websocket,
+        session_id=session_id or uuid.uuid4().hex,
+        free=(mode == "free"),
+    )
+    await connection.serve()
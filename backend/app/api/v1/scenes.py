@@ -1,15 +1,29 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, status, Query
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, HTTPException, status, Query, Response
 from fastapi.responses import StreamingResponse
-from typing import Optional
+from starlette.background import BackgroundTask
+from contextlib import aclosing
+from typing import List, Optional
 from uuid import UUID
-import json
 
 from app.api.deps import DBSession, CurrentUser
+from app.api.sse import sse_event
+from app.api.uploads import (
+    map_image_uploads, mapped_image_upload, release_buffers, validate_image_upload
+)
+from app.core.config import settings
 from app.models.scene import Scene
 from app.schemas.scene import (
-    SceneCreate, SceneResponse, SceneListItem, SceneAnalyzeResponse
+    SceneCreate, SceneResponse, SceneListItem, SceneAnalyzeResponse, AnalysisJobResponse
+)
+from app.services.analysis_cache import CACHE_HEADER, cache_status, upload_digest
+from app.services.analysis_jobs import (
+    find_analysis_job, get_analysis_job, stream_analysis_job, submit_analysis_job
+)
+from app.services.chat_openers import prewarm_openers, scene_contexts
+from app.services.scene_analysis import (
+    analyze_batch, analyze_scene as run_scene_analysis, cached_upload, full_result,
+    load_cached_stages, prepare_upload, stream_scene_analysis_shared
 )
-from app.services.qwen_vl import analyze_image, analyze_image_basic, generate_expressions
 from sqlalchemy import select, desc
 
 router = APIRouter()
@@ -17,28 +31,30 @@ router = APIRouter()
 
 @router.post("/analyze", response_model=SceneAnalyzeResponse)
 async def analyze_scene(
+    response: Response,
     image: UploadFile = File(...),
     cefr_level: Optional[str] = "B1"
 ):
     """上传图片，AI 分析生成学习内容（完整，一次性返回）"""
-    # 验证文件类型
-    if not image.content_type or not image.content_type.startswith("image/"):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="只支持图片文件"
-        )
-
-    # 读取图片内容
-    image_data = await image.read()
+    # 校验并映射上传图片（不整张读入内存）
+    async with mapped_image_upload(image) as buffer:
+        # 同一文件重复上传且结果已缓存时直接返回，不再解码压缩
+        raw_digest = await upload_digest(buffer)
+        _, cached = await cached_upload(raw_digest, cefr_level)
+        result, hit = full_result(cached), True
+        if result is None:
+            prepared, _ = await prepare_upload(buffer, image.content_type, raw_digest)
 
-    # 调用千问 VL 分析
-    result = await analyze_image(image_data, cefr_level)
+    if result is None:
+        # 视觉识别结果按图片缓存，切换等级只重新生成文本
+        result, hit = await run_scene_analysis(prepared, cefr_level)
     if not result:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="图片分析失败，请重试"
         )
 
+    response.headers[CACHE_HEADER] = cache_status(hit)
     return result
 
 
@@ -51,67 +67,162 @@ async def analyze_scene_stream(
     上传图片，AI 分析生成学习内容（流式，两阶段返回）
 
     返回 SSE 事件:
+    - {"type": "scene_tag", "data": "..."} - 视觉识别字段，模型输出到即推送
+      （同样的还有 scene_tag_cn / category）
+    - {"type": "object_tag", "index": 0, "data": {...}} - 每生成完一个词汇推送一次
+    - {"type": "description", "data": {...}} - 场景描述
     - {"type": "basic", "data": {...}} - 第一阶段：基础信息（场景、词汇、描述）
     - {"type": "expressions", "data": {...}} - 第二阶段：口语例句
     - {"type": "done"} - 完成
     - {"type": "error", "message": "..."} - 错误
     """
-    # 验证文件类型
-    if not image.content_type or not image.content_type.startswith("image/"):
+    # 校验并映射上传图片（不整张读入内存），预处理后即关闭映射
+    async with mapped_image_upload(image) as buffer:
+        # 同一文件重复上传且结果已缓存时直接回放，不再解码压缩
+        raw_digest = await upload_digest(buffer)
+        digest, cached = await cached_upload(raw_digest, cefr_level)
+        prepared = None
+        if "expressions" not in cached:
+            prepared, digest = await prepare_upload(buffer, image.content_type, raw_digest)
+            cached = await load_cached_stages(digest, cefr_level)
+
+    async def event_generator():
+        try:
+            # 同一图片的重复请求会挂到进行中的分析上，共享同一组事件；
+            # 客户端断开时立即退订，全部断开后上游分析随之取消
+            events = stream_scene_analysis_shared(prepared, cefr_level, digest, cached)
+            async with aclosing(events):
+                async for event in events:
+                    yield sse_event(event)
+
+        except Exception as e:
+            yield sse_event({"type": "error", "message": str(e)})
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+            CACHE_HEADER: cache_status("expressions" in cached)
+        }
+    )
+
+
+@router.post("/analyze/batch")
+async def analyze_scene_batch(
+    images: List[UploadFile] = File(...),
+    cefr_level: Optional[str] = "B1"
+):
+    """
+    相册批量导入：一次上传多张图片，服务端有界并发分析（流式）
+
+    返回 SSE 事件（按完成顺序，index 为图片在请求中的序号）:
+    - {"type": "result", "index": 0, "data": {...}, "cached": false} - 单张完整结果
+    - {"type": "error", "index": 0, "message": "..."} - 单张失败
+    - {"type": "progress", "completed": 1, "failed": 0, "total": N} - 总体进度
+    - {"type": "done"} - 全部完成
+    """
+    if len(images) > settings.ANALYSIS_BATCH_MAX_IMAGES:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="只支持图片文件"
+            detail=f"单次最多上传 {settings.ANALYSIS_BATCH_MAX_IMAGES} 张图片"
         )
 
-    # 读取图片内容
-    image_data = await image.read()
+    # 验证文件类型
+    for image in images:
+        validate_image_upload(image)
+
+    # 响应开始前上传文件就会被关闭，先做只读映射，分析时逐张解码，避免整批读入内存
+    buffers = await map_image_uploads(images)
+    files = [(buffer, image.content_type) for buffer, image in zip(buffers, images)]
 
     async def event_generator():
         try:
-            # 第一阶段：分析基础信息
-            basic_result = await analyze_image_basic(image_data, cefr_level)
-
-            if not basic_result:
-                error_data = json.dumps({
-                    "type": "error",
-                    "message": "图片分析失败，请重试"
-                }, ensure_ascii=False)
-                yield f"data: {error_data}\n\n"
-                return
-
-            # 发送基础信息
-            basic_data = json.dumps({
-                "type": "basic",
-                "data": basic_result
-            }, ensure_ascii=False)
-            yield f"data: {basic_data}\n\n"
-
-            # 第二阶段：生成口语例句（使用纯文本模型，更快）
-            expressions_result = await generate_expressions(
-                scene_tag=basic_result.get("scene_tag", ""),
-                scene_tag_cn=basic_result.get("scene_tag_cn", ""),
-                category=basic_result.get("category", ""),
-                description_en=basic_result.get("description", {}).get("en", ""),
-                cefr_level=cefr_level
-            )
-
-            if expressions_result:
-                expressions_data = json.dumps({
-                    "type": "expressions",
-                    "data": {"expressions": expressions_result}
-                }, ensure_ascii=False)
-                yield f"data: {expressions_data}\n\n"
-
-            # 完成
-            done_data = json.dumps({"type": "done"})
-            yield f"data: {done_data}\n\n"
+            async for event in analyze_batch(
+                files, cefr_level, settings.ANALYSIS_BATCH_CONCURRENCY
+            ):
+                yield sse_event(event)
 
         except Exception as e:
-            error_data = json.dumps({
-                "type": "error",
-                "message": str(e)
-            }, ensure_ascii=False)
-            yield f"data: {error_data}\n\n"
+            yield sse_event({"type": "error", "message": str(e)})
+
+    # 分析完成时已逐张关闭；客户端在开始读取前断开时生成器不会运行，由后台任务兜底关闭
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        },
+        background=BackgroundTask(release_buffers, buffers)
+    )
+
+
+@router.post("/jobs", response_model=AnalysisJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_analysis_job(
+    image: UploadFile = File(...),
+    cefr_level: Optional[str] = "B1"
+):
+    """
+    提交异步分析任务，立即返回 job_id
+
+    分析在后台 worker 中运行，客户端断开（App 切到后台）不影响任务；
+    同一图片 + 等级的未失败任务直接复用
+    """
+    async with mapped_image_upload(image) as buffer:
+        # 同一文件的任务已存在时直接返回，不再预处理
+        raw_digest = await upload_digest(buffer)
+        job_id = await find_analysis_job(raw_digest, cefr_level)
+        if job_id is None:
+            prepared, _ = await prepare_upload(buffer, image.content_type, raw_digest)
+
+    if job_id is None:
+        job_id, _ = await submit_analysis_job(prepared, cefr_level, raw_digest)
+    job = await get_analysis_job(job_id)
+    return AnalysisJobResponse(
+        job_id=job_id, status=job.status, result=job.result, error=job.error
+    )
+
+
+@router.get("/jobs/{job_id}", response_model=AnalysisJobResponse)
+async def get_analysis_job_status(job_id: str):
+    """查询分析任务状态，完成后 result 为完整分析结果"""
+    job = await get_analysis_job(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="任务不存在"
+        )
+
+    return AnalysisJobResponse(
+        job_id=job.id, status=job.status, result=job.result, error=job.error
+    )
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_analysis_job_events(job_id: str):
+    """
+    订阅分析任务事件（SSE），事件与 /analyze/stream 相同；
+    先重放已产生的事件再跟随，任务已结束时直接返回结果。另有:
+    - {"type": "status", "status": "queued"} - 任务排队中
+    """
+    job = await get_analysis_job(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="任务不存在"
+        )
+
+    async def event_generator():
+        try:
+            async for event in stream_analysis_job(job_id):
+                yield sse_event(event)
+
+        except Exception as e:
+            yield sse_event({"type": "error", "message": str(e)})
 
     return StreamingResponse(
         event_generator(),
@@ -128,9 +239,10 @@ async def analyze_scene_stream(
 async def create_scene(
     scene_data: SceneCreate,
     current_user: CurrentUser,
-    db: DBSession
+    db: DBSession,
+    background_tasks: BackgroundTasks
 ):
-    """保存场景"""
+    """保存场景，并在后台预热该场景各角色组合的对话开场白"""
     scene = Scene(
         user_id=current_user.id,
         local_photo_id=scene_data.local_photo_id,
@@ -145,6 +257,16 @@ async def create_scene(
     db.add(scene)
     await db.commit()
     await db.refresh(scene)
+
+    background_tasks.add_task(
+        prewarm_openers,
+        scene_contexts(
+            scene_data.scene_tag,
+            scene_data.scene_tag_cn,
+            scene_data.category,
+            scene_data.expressions.model_dump()
+        )
+    )
     return scene
 
 
@@ -1,14 +1,82 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Header, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from contextlib import aclosing
+from typing import List, Literal, Optional, Tuple
+import asyncio
+import time
 
-from app.services.aliyun_tts import text_to_speech
+from app.api.sse import sse_event
+from app.core.config import settings
+from app.services.aliyun_tts import (
+    TtsOutputFormat,
+    output_format,
+    text_to_speech,
+    text_to_speech_batch,
+    text_to_speech_stream,
+)
+from app.services.audio_store import AUDIO_MIME_TYPES, audio_path, verify_audio_url
+from app.services.tts_cache import tts_cache_stats
 
 router = APIRouter()
 
 
+AudioCodec = Literal["wav", "mp3", "opus"]
+SampleRate = Literal[8000, 16000, 24000, 48000]
+
+# Accept 中的音频类型 -> 输出格式
+_ACCEPT_CODECS = {
+    "audio/wav": "wav",
+    "audio/x-wav": "wav",
+    "audio/wave": "wav",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/opus": "opus",
+    "audio/ogg": "opus",
+}
+
+
+def _negotiate_codec(accept: Optional[str]) -> Optional[str]:
+    """按 Accept 头（含 q 值）选择音频格式；没有可识别的音频类型时返回 None"""
+    best, best_q = None, 0.0
+    for item in (accept or "").split(","):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        codec = _ACCEPT_CODECS.get(media_type.lower())
+        if codec is None:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > best_q:
+            best, best_q = codec, q
+    return best
+
+
+def _resolve_format(
+    codec: Optional[str],
+    sample_rate: Optional[int],
+    accept: Optional[str]
+) -> TtsOutputFormat:
+    """请求字段优先，其次 Accept 头，最后为 TTS_OUTPUT_FORMAT"""
+    try:
+        return output_format(codec or _negotiate_codec(accept), sample_rate)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
 class TTSRequest(BaseModel):
     text: str
     voice: str = "en-US-female"
+    # data_url: 内联 base64；url: 音频库地址 /api/tts/audio/{audio_id}；默认见 TTS_AUDIO_DELIVERY
+    audio_delivery: Optional[Literal["data_url", "url"]] = None
+    # 不指定时按 Accept 头协商（如 audio/mpeg），再退回 TTS_OUTPUT_FORMAT
+    format: Optional[AudioCodec] = None
+    sample_rate: Optional[SampleRate] = None
 
 
 class TTSResponse(BaseModel):
@@ -17,20 +85,334 @@ class TTSResponse(BaseModel):
 
 @router.post("", response_model=TTSResponse)
 async def synthesize_speech(
-    request: TTSRequest
+    request: TTSRequest,
+    accept: Optional[str] = Header(None)
 ):
-    """文本转语音"""
-    if not request.text or len(request.text) > 1000:
+    """
+    文本转语音
+
+    输出格式: format / sample_rate 字段，或 Accept 头中的 audio/mpeg、audio/opus 等；
+    mp3 / opus 比 24kHz WAV 小数倍，适合蜂窝网络
+    """
+    _validate_text(request.text)
+    audio_format = _resolve_format(request.format, request.sample_rate, accept)
+
+    audio_url = await text_to_speech(
+        request.text, request.voice, request.audio_delivery, audio_format
+    )
+    if not audio_url:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="语音合成失败"
+        )
+
+    return TTSResponse(audio_url=audio_url)
+
+
+StreamFormat = Literal["wav", "pcm", "mp3", "opus"]
+
+
+class TTSStreamRequest(BaseModel):
+    text: str
+    voice: str = "en-US-female"
+    # wav: 流式 WAV（头部长度未知）；pcm: 裸 PCM，16-bit / 单声道；mp3 / opus: 压缩格式
+    # 不指定时按 Accept 头协商，再退回 TTS_OUTPUT_FORMAT
+    format: Optional[StreamFormat] = None
+    sample_rate: Optional[SampleRate] = None
+
+
+def _validate_text(text: str) -> None:
+    if not text or len(text) > 1000:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="文本长度需在 1-1000 字符之间"
         )
 
-    audio_url = await text_to_speech(request.text, request.voice)
-    if not audio_url:
+
+async def _stream_speech(
+    text: str,
+    voice: str,
+    stream_format: Optional[str],
+    sample_rate: Optional[int],
+    accept: Optional[str]
+) -> StreamingResponse:
+    _validate_text(text)
+    raw_pcm = stream_format == "pcm"
+    audio_format = _resolve_format("wav" if raw_pcm else stream_format, sample_rate, accept)
+    chunks = text_to_speech_stream(text, voice, audio_format, with_header=not raw_pcm)
+
+    # 先取到第一段音频再返回响应：首段之前失败仍可返回 500
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except Exception as e:
+        print(f"TTS stream failed: {e}")
+        first = None
+    if first is None:
+        await chunks.aclose()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="语音合成失败"
         )
 
-    return TTSResponse(audio_url=audio_url)
+    async def body():
+        # 客户端断开时关闭合成流，取消服务端合成
+        async with aclosing(chunks):
+            yield first
+            try:
+                async for chunk in chunks:
+                    yield chunk
+            except Exception as e:
+                print(f"TTS stream interrupted: {e}")
+
+    if raw_pcm:
+        media_type = f"audio/L16; rate={audio_format.sample_rate}; channels=1"
+    else:
+        media_type = audio_format.mime_type
+    return StreamingResponse(
+        body(),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/stream")
+async def synthesize_speech_stream(
+    request: TTSStreamRequest,
+    accept: Optional[str] = Header(None)
+):
+    """
+    文本转语音 - 流式（分块传输）
+
+    合成的音频数据一到就转发，首字节延迟为首个音频分片的延迟，而不是整段合成时间
+    """
+    return await _stream_speech(
+        request.text, request.voice, request.format, request.sample_rate, accept
+    )
+
+
+@router.get("/stream")
+async def synthesize_speech_stream_get(
+    text: str,
+    voice: str = "en-US-female",
+    format: Optional[StreamFormat] = None,
+    # 查询参数是字符串，Literal[int] 不做转换；取值由 output_format 校验
+    sample_rate: Optional[int] = None,
+    accept: Optional[str] = Header(None)
+):
+    """文本转语音 - 流式，GET 形式，可直接作为播放器的音频地址"""
+    return await _stream_speech(text, voice, format, sample_rate, accept)
+
+
+class TTSBatchItem(BaseModel):
+    text: str
+    voice: Optional[str] = None  # 不指定时使用批量请求的 voice
+
+
+class TTSBatchRequest(BaseModel):
+    items: List[TTSBatchItem]
+    voice: str = "en-US-female"
+    # 条目较多时建议 url，避免一次返回十几段 base64 音频
+    audio_delivery: Optional[Literal["data_url", "url"]] = None
+    format: Optional[AudioCodec] = None
+    sample_rate: Optional[SampleRate] = None
+
+
+class TTSBatchResult(BaseModel):
+    index: int
+    text: str
+    voice: str
+    audio_url: Optional[str] = None  # 合成失败时为 None
+
+
+class TTSBatchResponse(BaseModel):
+    format: str
+    items: List[TTSBatchResult]
+
+
+def _batch_items(request: TTSBatchRequest) -> List[Tuple[str, str]]:
+    if not request.items or len(request.items) > settings.TTS_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"条目数量需在 1-{settings.TTS_BATCH_MAX_ITEMS} 之间"
+        )
+    for item in request.items:
+        _validate_text(item.text)
+    return [(item.text, item.voice or request.voice) for item in request.items]
+
+
+@router.post("/batch", response_model=TTSBatchResponse)
+async def synthesize_speech_batch(
+    request: TTSBatchRequest,
+    accept: Optional[str] = Header(None)
+):
+    """
+    批量文本转语音：一次请求合成整张场景卡片（角色句子 + 词汇）
+
+    有限并发合成，全部完成后返回清单，items 与请求顺序一致；
+    单条失败时其 audio_url 为 None，全部失败时返回 500
+    """
+    items = _batch_items(request)
+    audio_format = _resolve_format(request.format, request.sample_rate, accept)
+
+    urls: List[Optional[str]] = [None] * len(items)
+    results = text_to_speech_batch(items, request.audio_delivery, audio_format)
+    async with aclosing(results):
+        async for index, url in results:
+            urls[index] = url
+
+    if not any(urls):
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="语音合成失败"
+        )
+
+    return TTSBatchResponse(
+        format=audio_format.codec,
+        items=[
+            TTSBatchResult(index=index, text=text, voice=voice, audio_url=url)
+            for index, ((text, voice), url) in enumerate(zip(items, urls))
+        ]
+    )
+
+
+@router.post("/batch/stream")
+async def synthesize_speech_batch_stream(
+    request: TTSBatchRequest,
+    accept: Optional[str] = Header(None)
+):
+    """
+    批量文本转语音 - 流式（SSE），每条合成完立即推送，不必等最慢的一条
+
+    返回事件格式:
+    - {"type": "audio", "index": 0, "text": "句子", "voice": "en-US-female", "url": "..."} - 按完成顺序推送
+    - {"type": "error", "index": 0, "text": "句子", "content": "语音合成失败"} - 单条失败
+    - {"type": "done", "format": "wav", "failed": 0}
+    """
+    items = _batch_items(request)
+    audio_format = _resolve_format(request.format, request.sample_rate, accept)
+
+    async def event_generator():
+        failed = 0
+        try:
+            # 客户端断开时关闭生成器，取消尚未完成的合成
+            results = text_to_speech_batch(items, request.audio_delivery, audio_format)
+            async with aclosing(results):
+                async for index, url in results:
+                    text, voice = items[index]
+                    if url is None:
+                        failed += 1
+                        yield sse_event({"type": "error", "index": index, "text": text, "content": "语音合成失败"})
+                    else:
+                        yield sse_event({"type": "audio", "index": index, "text": text, "voice": voice, "url": url})
+            yield sse_event({"type": "done", "format": audio_format.codec, "failed": failed})
+
+        except Exception as e:
+            yield sse_event({"type": "error", "content": str(e)})
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单段 Range 头，返回闭区间 (start, end)
+    格式不支持时返回 None（按完整内容返回），区间无法满足时抛出 416
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_text, _, end_text = spec.strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            # bytes=-500：最后 500 字节
+            start = max(size - int(end_text), 0)
+            end = size - 1
+    except ValueError:
+        return None
+
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, min(end, size - 1)
+
+
+def _read_slice(path, start: int, length: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(length)
+
+
+@router.api_route("/audio/{audio_id}", methods=["GET", "HEAD"])
+async def get_audio(
+    audio_id: str,
+    request: Request,
+    expires: Optional[int] = None,
+    sig: Optional[str] = None
+):
+    """
+    音频库文件（url 交付模式）
+
+    地址须带 audio_url 生成的 expires / sig，过期或签名不符返回 403；
+    audio_id 为内容哈希，内容不会变化：ETag 即 audio_id，在地址有效期内可缓存；
+    支持 If-None-Match 与单段 Range（AVPlayer 会先请求 bytes=0-1）
+    """
+    if not verify_audio_url(audio_id, expires, sig):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="音频链接无效或已过期")
+
+    path = audio_path(audio_id)
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="音频不存在或已过期")
+
+    etag = f'"{audio_id}"'
+    max_age = max(int(expires - time.time()), 0)
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": f"private, max-age={max_age}, immutable",
+    }
+    media_type = AUDIO_MIME_TYPES[audio_id.rsplit(".", 1)[1]]
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in if_none_match or if_none_match.strip() == "*":
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    size = path.stat().st_size
+    byte_range = None
+    range_header = request.headers.get("range")
+    # If-Range 与当前 ETag 不一致时忽略 Range，返回完整内容
+    if range_header and request.headers.get("if-range", etag) == etag:
+        byte_range = _parse_range(range_header, size)
+
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, status.HTTP_200_OK
+    else:
+        (start, end), status_code = byte_range, status.HTTP_206_PARTIAL_CONTENT
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    length = end - start + 1
+    headers["Content-Length"] = str(length)
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+
+    body = await asyncio.to_thread(_read_slice, path, start, length)
+    return Response(content=body, status_code=status_code, headers=headers, media_type=media_type)
+
+
+@router.get("/cache/stats")
+async def get_tts_cache_stats():
+    """TTS 缓存命中统计"""
+    return tts_cache_stats()
@@ -0,0 +1,382 @@
+"""
+通用缓存组件
+
+- LRUCache: 进程内 LRU，按条目数和总字节数限制，支持 TTL
+- SQLiteCache: 可选的持久化层，按 TTL 和总字节数淘汰
+- TieredCache: 内存 + SQLite 两级缓存，值为可 JSON 序列化对象
+- FileCache: 目录型持久层，值为 bytes（音频等较大的二进制内容）
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Generic, Optional, Tuple, TypeVar
+
+
+V = TypeVar("V")
+
+
+class LRUCache(Generic[V]):
+    def __init__(
+        self,
+        max_items: int,
+        max_bytes: int = 0,
+        ttl_sec: float = 0,
+        sizeof: Callable[[V], int] = lambda value: 0,
+    ) -> None:
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl_sec = ttl_sec
+        self._sizeof = sizeof
+        self._items: "OrderedDict[str, Tuple[V, int, float]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, key: str) -> Optional[V]:
+        item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+
+        value, _, expires_at = item
+        if expires_at and expires_at < time.time():
+            self.pop(key)
+            self.misses += 1
+            return None
+
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: V, size: Optional[int] = None) -> None:
+        if size is None:
+            size = self._sizeof(value)
+        if self.max_bytes and size > self.max_bytes:
+            return
+
+        self.pop(key)
+        expires_at = time.time() + self.ttl_sec if self.ttl_sec else 0
+        self._items[key] = (value, size, expires_at)
+        self._bytes += size
+        self._evict()
+
+    def pop(self, key: str) -> Optional[V]:
+        item = self._items.pop(key, None)
+        if item is None:
+            return None
+        self._bytes -= item[1]
+        return item[0]
+
+    def clear(self) -> None:
+        self._items.clear()
+        self._bytes = 0
+
+    def _evict(self) -> None:
+        while self._items and (
+            len(self._items) > self.max_items
+            or (self.max_bytes and self._bytes > self.max_bytes)
+        ):
+            _, (_, size, _) = self._items.popitem(last=False)
+            self._bytes -= size
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "items": len(self._items),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class SQLiteCache:
+    """
+    持久化 KV 缓存，所有 sqlite3 调用在线程池中执行
+    """
+
+    def __init__(self, path: str, max_bytes: int, ttl_sec: float = 0) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_sec = ttl_sec
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (accessed_at)")
+            self._conn = conn
+        return self._conn
+
+    def _get_sync(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            value, expires_at = row
+            if expires_at and expires_at < now:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                conn.commit()
+                return None
+
+            conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            return value
+
+    def _set_sync(self, key: str, value: bytes) -> None:
+        now = time.time()
+        expires_at = now + self.ttl_sec if self.ttl_sec else 0
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), expires_at, now),
+            )
+            self._evict_sync(conn, now)
+            conn.commit()
+
+    def _evict_sync(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM cache WHERE expires_at > 0 AND expires_at < ?", (now,))
+        if not self.max_bytes:
+            return
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # 按最近访问时间从旧到新淘汰，直到总大小回到上限以内
+        overflow = total - self.max_bytes
+        freed = 0
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM cache ORDER BY accessed_at"):
+            victims.append((key,))
+            freed += size
+            if freed >= overflow:
+                break
+        conn.executemany("DELETE FROM cache WHERE key = ?", victims)
+
+    def _delete_sync(self, key: str) -> None:
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            conn.commit()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._get_sync, key)
+
+    async def set(self, key: str, value: bytes) -> None:
+        await asyncio.to_thread(self._set_sync, key, value)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._delete_sync, key)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class FileCache:
+    """
+    目录 KV 缓存，每个键一个文件，值为 bytes；文件 mtime 即最近访问时间，
+    超过 TTL 未访问或总大小超过上限时从最久未访问的开始淘汰
+
+    键需可直接作为文件名（如十六进制哈希）
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl_sec: float = 0, suffix: str = "") -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_sec = ttl_sec
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self._bytes: Optional[int] = None  # 首次访问时扫描目录得到
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{self.suffix}")
+
+    def _scan(self) -> list:
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.is_file() or entry.name.startswith("."):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _ensure_dir(self) -> None:
+        if self._bytes is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._bytes = sum(size for _, size, _ in self._scan())
+
+    def _get_sync(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        with self._lock:
+            self._ensure_dir()
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                self.misses += 1
+                return None
+
+            if self.ttl_sec and stat.st_mtime + self.ttl_sec < time.time():
+                os.remove(path)
+                self._bytes -= stat.st_size
+                self.misses += 1
+                return None
+
+            with open(path, "rb") as f:
+                value = f.read()
+            os.utime(path)
+            self.hits += 1
+            return value
+
+    def _set_sync(self, key: str, value: bytes) -> None:
+        path = self._path(key)
+        tmp_path = os.path.join(self.directory, f".{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with self._lock:
+            self._ensure_dir()
+            try:
+                old_size = os.stat(path).st_size
+            except FileNotFoundError:
+                old_size = 0
+            with open(tmp_path, "wb") as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+            self._bytes += len(value) - old_size
+            self._evict_sync()
+
+    def _evict_sync(self) -> None:
+        if not self.max_bytes or self._bytes <= self.max_bytes:
+            return
+        now = time.time()
+        entries = sorted(self._scan())
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            expired = self.ttl_sec and mtime + self.ttl_sec < now
+            if not expired and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._bytes = total
+
+    def _delete_sync(self, key: str) -> None:
+        with self._lock:
+            self._ensure_dir()
+            try:
+                size = os.stat(self._path(key)).st_size
+                os.remove(self._path(key))
+                self._bytes -= size
+            except FileNotFoundError:
+                pass
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._get_sync, key)
+
+    async def set(self, key: str, value: bytes) -> None:
+        await asyncio.to_thread(self._set_sync, key, value)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._delete_sync, key)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "bytes": self._bytes or 0,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def close(self) -> None:
+        pass
+
+
+class TieredCache:
+    """
+    内存 LRU + 可选 SQLite 两级缓存，值需可 JSON 序列化
+    """
+
+    def __init__(self, memory: LRUCache, disk: Optional[SQLiteCache] = None) -> None:
+        self.memory = memory
+        self.disk = disk
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+
+        if self.disk is None:
+            return None
+
+        try:
+            raw = await self.disk.get(key)
+        except Exception as e:
+            print(f"[Cache] SQLite read failed: {e}")
+            return None
+        if raw is None:
+            return None
+
+        value = json.loads(raw)
+        self.memory.set(key, value, size=len(raw))
+        return value
+
+    async def set(self, key: str, value: Any) -> None:
+        raw = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        self.memory.set(key, value, size=len(raw))
+
+        if self.disk is None:
+            return
+
+        try:
+            await self.disk.set(key, raw)
+        except Exception as e:
+            print(f"[Cache] SQLite write failed: {e}")
+
+    async def delete(self, key: str) -> None:
+        self.memory.pop(key)
+        if self.disk is not None:
+            await self.disk.delete(key)
+
+    def close(self) -> None:
+        if self.disk is not None:
+            self.disk.close()
@@ -26,10 +26,106 @@ class Settings(BaseSettings):
     # Qwen VL (通义千问多模态)
     DASHSCOPE_API_KEY: str = ""
 
+    # DashScope HTTP 客户端（连接池 / 并发 / 超时）
+    DASHSCOPE_BASE_URL: str = "https://dashscope.aliyuncs.com/api/v1"
+    DASHSCOPE_MAX_CONNECTIONS: int = 64
+    DASHSCOPE_MAX_KEEPALIVE: int = 32
+    DASHSCOPE_CONNECT_TIMEOUT: float = 10.0
+    DASHSCOPE_READ_TIMEOUT: float = 120.0
+    DASHSCOPE_DEFAULT_CONCURRENCY: int = 16
+    DASHSCOPE_MODEL_CONCURRENCY: dict[str, int] = {"qwen-vl-max": 8}
+
+    # 图片预处理（上传给千问 VL 前压缩）
+    IMAGE_MAX_EDGE: int = 1536
+    IMAGE_OUTPUT_FORMAT: str = "JPEG"  # JPEG / WEBP
+    IMAGE_QUALITY: int = 85
+    IMAGE_PREPROCESS_WORKERS: int = 4
+
+    # 上传大小限制（超过直接返回 413）
+    MAX_UPLOAD_BYTES: int = 20 * 1024 * 1024
+    MAX_BATCH_UPLOAD_BYTES: int = 300 * 1024 * 1024
+
+    # 场景分析缓存（内存 LRU + 可选 SQLite 持久层）
+    ANALYSIS_CACHE_MAX_ITEMS: int = 512
+    ANALYSIS_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    ANALYSIS_CACHE_TTL_SEC: int = 7 * 24 * 60 * 60
+    ANALYSIS_CACHE_SQLITE_PATH: str = ""  # 为空则只用内存缓存，例如 ./cache/analysis.db
+    ANALYSIS_CACHE_SQLITE_MAX_BYTES: int = 256 * 1024 * 1024
+
+    # 相册批量分析
+    ANALYSIS_BATCH_MAX_IMAGES: int = 50
+    ANALYSIS_BATCH_CONCURRENCY: int = 6
+
+    # 异步分析任务（SQLite 队列 + 后台 worker）
+    ANALYSIS_JOB_DB_PATH: str = "./analysis_jobs.db"
+    ANALYSIS_JOB_WORKERS: int = 4
+    ANALYSIS_JOB_TTL_SEC: int = 24 * 60 * 60  # 已结束任务的保留时间
+    ANALYSIS_JOB_LEASE_SEC: float = 60.0  # running 任务超过该时间没有心跳则重新入队
+
+    # 对话会话存储（内存 LRU + 可选 SQLite 持久层）
+    CHAT_SESSION_MAX_ITEMS: int = 2000
+    CHAT_SESSION_MAX_BYTES: int = 64 * 1024 * 1024
+    CHAT_SESSION_TTL_SEC: int = 2 * 60 * 60
+    CHAT_SESSION_MAX_MESSAGES: int = 200
+    CHAT_SESSION_SQLITE_PATH: str = ""  # 为空则只用内存，例如 ./cache/chat_sessions.db
+    CHAT_SESSION_SQLITE_MAX_BYTES: int = 128 * 1024 * 1024
+
+    # 长对话压缩（最近消息原样保留，较早消息后台折叠成摘要）
+    CHAT_HISTORY_TOKEN_BUDGET: int = 1500  # 每轮原样发送的历史 token 上限
+    CHAT_HISTORY_KEEP_RECENT: int = 8  # 折叠时保留的最近消息条数
+    CHAT_HISTORY_COMPACT_BATCH: int = 6  # 未折叠消息超出保留条数这么多时触发折叠
+    CHAT_SUMMARY_MAX_WORDS: int = 150
+
+    # 对话开场白缓存（保存场景时预热）
+    OPENER_CACHE_MAX_ITEMS: int = 2000
+    OPENER_CACHE_MAX_BYTES: int = 128 * 1024 * 1024  # 含音频 data URL
+    OPENER_CACHE_TTL_SEC: int = 30 * 24 * 60 * 60
+    OPENER_CACHE_SQLITE_PATH: str = ""  # 为空则只用内存，例如 ./cache/openers.db
+    OPENER_CACHE_SQLITE_MAX_BYTES: int = 512 * 1024 * 1024
+    OPENER_PREWARM_MAX_PAIRS: int = 6
+    OPENER_PREWARM_CONCURRENCY: int = 2
+
+    # 对话回复按句合成语音
+    CHAT_TTS_CONCURRENCY: int = 3
+    CHAT_TTS_MIN_SENTENCE_CHARS: int = 12  # 更短的句子与下一句合并
+    CHAT_TTS_TIMEOUT_SEC: float = 15.0  # 单句合成超时，超时的句子不推送音频
+    CHAT_TRANSLATION_TIMEOUT_SEC: float = 8.0
+    # 合并模式：回复与中文翻译一次生成，省去一次翻译调用（模型未按格式输出时回退到单独翻译）
+    CHAT_COMBINED_TRANSLATION: bool = False
+
+    # 合成音频交付方式（请求可单独指定）
+    # data_url: 内联 base64；url: 存入本地音频库，返回 /api/tts/audio/{audio_id}
+    TTS_AUDIO_DELIVERY: str = "data_url"
+    TTS_AUDIO_STORE_DIR: str = "./audio_store"
+    TTS_AUDIO_STORE_MAX_BYTES: int = 1024 * 1024 * 1024
+    TTS_AUDIO_STORE_TTL_SEC: int = 7 * 24 * 60 * 60
+    TTS_AUDIO_URL_TTL_SEC: int = 60 * 60  # 音频地址（HMAC 签名）的有效期，过期后需重新合成或请求
+    PUBLIC_BASE_URL: str = ""  # 音频地址前缀，例如 https://api.sceneling.com；为空时返回相对路径
+
     # Qwen TTS (通义千问语音合成)
     QWEN_TTS_MODEL: str = "qwen3-tts-flash-realtime"
     QWEN_TTS_WS_URL: str = "wss://dashscope.aliyuncs.com/api-ws/v1/realtime"
 
+    # TTS 音频缓存（按 文本 + 音色 + 模型 + 格式 寻址；内存 LRU + 可选磁盘目录）
+    TTS_CACHE_MAX_ITEMS: int = 5000
+    TTS_CACHE_MAX_BYTES: int = 128 * 1024 * 1024
+    TTS_CACHE_TTL_SEC: int = 30 * 24 * 60 * 60
+    TTS_CACHE_DIR: str = ""  # 为空则只用内存，例如 ./cache/tts
+    TTS_CACHE_DISK_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+
+    # TTS 默认输出格式（wav / mp3 / opus；采样率 8000 / 16000 / 24000 / 48000），请求可单独指定
+    TTS_OUTPUT_FORMAT: str = "wav"
+    TTS_OUTPUT_SAMPLE_RATE: int = 24000
+
+    # 批量合成（/api/tts/batch，如场景卡片的全部句子和单词）
+    TTS_BATCH_MAX_ITEMS: int = 30
+    TTS_BATCH_CONCURRENCY: int = 4  # 不超过 QWEN_TTS_POOL_MAX_IDLE_PER_KEY，连接可全部复用
+
+    # Qwen TTS 连接池（按音色 + 格式复用已配置会话的 websocket）
+    QWEN_TTS_POOL_MAX_IDLE_PER_KEY: int = 4  # 0 表示不复用
+    QWEN_TTS_POOL_IDLE_SEC: float = 60.0  # 空闲超过该时间的连接关闭
+    QWEN_TTS_POOL_MAX_AGE_SEC: float = 10 * 60  # 连接最长寿命，到期后重建
+
     # Aliyun TTS
     ALIYUN_ACCESS_KEY_ID: str = ""
     ALIYUN_ACCESS_KEY_SECRET: str = ""
@@ -0,0 +1,275 @@
+"""
+基于 SQLite 的本地任务队列
+
+任务落盘后与 HTTP 连接解耦：客户端断开、进程重启都不会丢失已提交的任务。
+所有 sqlite3 调用在线程池中执行（与 SQLiteCache 相同）。
+
+状态流转：queued -> running -> done / failed
+running 任务由运行它的进程定期刷新 updated_at（租约），
+租约过期的任务视为进程已退出，重新入队
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass
+class Job:
+    id: str
+    status: str
+    params: Dict[str, Any]
+    payload: Optional[bytes] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+
+
+class SQLiteJobQueue:
+    def __init__(self, path: str, ttl_sec: float = 0) -> None:
+        """
+        Args:
+            ttl_sec: 已结束任务的保留时间，0 表示不清理
+        """
+        self.path = path
+        self.ttl_sec = ttl_sec
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    dedupe_key TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    payload BLOB,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs (dedupe_key)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _row_to_job(row: Tuple[Any, ...]) -> Job:
+        job_id, status, params, payload, result, error = row
+        return Job(
+            id=job_id,
+            status=status,
+            params=json.loads(params),
+            payload=payload,
+            result=json.loads(result) if result is not None else None,
+            error=error,
+        )
+
+    @staticmethod
+    def _find_active(conn: sqlite3.Connection, dedupe_key: str) -> Optional[str]:
+        row = conn.execute(
+            "SELECT id FROM jobs WHERE dedupe_key = ? AND status != ? "
+            "ORDER BY created_at DESC LIMIT 1",
+            (dedupe_key, FAILED),
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def _find_sync(self, dedupe_key: str) -> Optional[str]:
+        with self._lock:
+            return self._find_active(self._connect(), dedupe_key)
+
+    def _enqueue_sync(
+        self,
+        dedupe_key: str,
+        params: Dict[str, Any],
+        payload: bytes
+    ) -> Tuple[str, bool]:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            # 未失败的同 key 任务直接复用：已完成的结果不会因重试被重新计算
+            existing = self._find_active(conn, dedupe_key)
+            if existing is not None:
+                return existing, False
+
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (id, dedupe_key, status, params, payload, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, dedupe_key, QUEUED, json.dumps(params), payload, now, now),
+            )
+            conn.commit()
+            return job_id, True
+
+    def _claim_sync(self) -> Optional[Job]:
+        with self._lock:
+            conn = self._connect()
+            while True:
+                row = conn.execute(
+                    "SELECT id, status, params, payload, result, error FROM jobs "
+                    "WHERE status = ? ORDER BY created_at LIMIT 1",
+                    (QUEUED,),
+                ).fetchone()
+                if row is None:
+                    return None
+
+                # 带状态条件的 UPDATE 是原子的：多个进程共用同一个库时只有一个能抢到
+                cursor = conn.execute(
+                    "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                    (RUNNING, time.time(), row[0], QUEUED),
+                )
+                conn.commit()
+                if cursor.rowcount == 0:
+                    # 被其他进程抢先，取下一个
+                    continue
+
+                job = self._row_to_job(row)
+                job.status = RUNNING
+                return job
+
+    def _finish_sync(self, job_id: str, status: str, result: Any, error: Optional[str]) -> None:
+        with self._lock:
+            conn = self._connect()
+            # 任务结束后不再需要图片，释放空间
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, payload = NULL, updated_at = ? "
+                "WHERE id = ?",
+                (
+                    status,
+                    json.dumps(result, ensure_ascii=False) if result is not None else None,
+                    error,
+                    time.time(),
+                    job_id,
+                ),
+            )
+            conn.commit()
+
+    def _get_sync(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT id, status, params, NULL, result, error FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        return self._row_to_job(row) if row is not None else None
+
+    def _heartbeat_sync(self, job_ids: List[str]) -> None:
+        if not job_ids:
+            return
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "UPDATE jobs SET updated_at = ? WHERE id = ? AND status = ?",
+                [(time.time(), job_id, RUNNING) for job_id in job_ids],
+            )
+            conn.commit()
+
+    def _requeue_sync(self, job_ids: List[str]) -> int:
+        if not job_ids:
+            return 0
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.executemany(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                [(QUEUED, time.time(), job_id, RUNNING) for job_id in job_ids],
+            )
+            conn.commit()
+            return cursor.rowcount
+
+    def _recover_sync(self, lease_sec: float) -> int:
+        """
+        租约过期（超过 lease_sec 没有心跳）的 running 任务重新入队：
+        运行它的进程已经退出；其他仍存活的 worker 在持续刷新 updated_at，不受影响
+        """
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND updated_at < ?",
+                (QUEUED, time.time(), RUNNING, time.time() - lease_sec),
+            )
+            conn.commit()
+            return cursor.rowcount
+
+    def _purge_sync(self) -> int:
+        if not self.ttl_sec:
+            return 0
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (DONE, FAILED, time.time() - self.ttl_sec),
+            )
+            conn.commit()
+            return cursor.rowcount
+
+    async def enqueue(
+        self,
+        dedupe_key: str,
+        params: Dict[str, Any],
+        payload: bytes
+    ) -> Tuple[str, bool]:
+        """
+        提交任务
+
+        Returns:
+            (job_id, 是否新建)
+        """
+        return await asyncio.to_thread(self._enqueue_sync, dedupe_key, params, payload)
+
+    async def find(self, dedupe_key: str) -> Optional[str]:
+        """同 key 的未失败任务 id"""
+        return await asyncio.to_thread(self._find_sync, dedupe_key)
+
+    async def claim(self) -> Optional[Job]:
+        """取出最早的排队任务并标记为 running"""
+        return await asyncio.to_thread(self._claim_sync)
+
+    async def complete(self, job_id: str, result: Any) -> None:
+        await asyncio.to_thread(self._finish_sync, job_id, DONE, result, None)
+
+    async def fail(self, job_id: str, error: str) -> None:
+        await asyncio.to_thread(self._finish_sync, job_id, FAILED, None, error)
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        """查询任务（不含 payload）"""
+        return await asyncio.to_thread(self._get_sync, job_id)
+
+    async def heartbeat(self, job_ids: List[str]) -> None:
+        """刷新运行中任务的租约"""
+        await asyncio.to_thread(self._heartbeat_sync, job_ids)
+
+    async def requeue(self, job_ids: List[str]) -> int:
+        """本进程未完成的任务放回队列（正常停机时调用）"""
+        return await asyncio.to_thread(self._requeue_sync, job_ids)
+
+    async def recover(self, lease_sec: float) -> int:
+        return await asyncio.to_thread(self._recover_sync, lease_sec)
+
+    async def purge(self) -> int:
+        return await asyncio.to_thread(self._purge_sync)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,124 @@
+"""
+Single-flight：相同 key 的并发请求共享同一次执行
+
+- do(): 协程结果共享，任一调用方取消不影响其他调用方
+- stream(): 异步生成器的事件广播，后加入的订阅者先重放已产生的事件再跟随后续事件；
+  cancel_when_idle=True 时所有订阅者都离开后取消执行
+执行结束后 key 自动移除，之后的请求会重新执行（通常会命中结果缓存）
+"""
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Generic, List, Optional, TypeVar
+
+
+T = TypeVar("T")
+
+
+class Broadcast(Generic[T]):
+    """
+    在后台任务中消费异步生成器，事件可被多个订阅者重放和跟随
+    订阅者离开不会取消后台任务
+    """
+
+    def __init__(
+        self,
+        source: AsyncIterator[T],
+        on_finish: Optional[Callable[[], None]] = None,
+        cancel_when_idle: bool = False
+    ) -> None:
+        """
+        Args:
+            cancel_when_idle: 最后一个订阅者离开且尚未结束时取消后台任务（客户端全部断开）
+        """
+        self.events: List[T] = []
+        self.cancel_when_idle = cancel_when_idle
+        self.finished = False
+        self.cancelled = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._on_finish = on_finish
+        self.task = asyncio.create_task(self._run(source))
+
+    async def _run(self, source: AsyncIterator[T]) -> None:
+        try:
+            async for event in source:
+                self.events.append(event)
+                self._notify()
+        except BaseException as e:
+            self.error = e
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            self.finished = True
+            self._notify()
+            if self._on_finish is not None:
+                self._on_finish()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator[T]:
+        index = 0
+        self.subscribers += 1
+        try:
+            while True:
+                while index < len(self.events):
+                    yield self.events[index]
+                    index += 1
+
+                if self.finished:
+                    if self.error is not None:
+                        raise self.error
+                    return
+
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.cancel_when_idle and self.subscribers == 0 and not self.finished:
+                # 先移出 SingleFlight 再取消，紧接着重试的请求会开始新的执行而不是收到 CancelledError
+                self.cancelled = True
+                if self._on_finish is not None:
+                    self._on_finish()
+                self.task.cancel()
+
+
+class SingleFlight:
+    def __init__(self) -> None:
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._streams: Dict[str, Broadcast] = {}
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._calls or key in self._streams
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[T]]) -> T:
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(factory())
+            self._calls[key] = future
+            future.add_done_callback(lambda _: self._forget(self._calls, key, future))
+        # shield：某个调用方断开时不取消共享的执行
+        return await asyncio.shield(future)
+
+    def stream(
+        self,
+        key: str,
+        factory: Callable[[], AsyncIterator[T]],
+        cancel_when_idle: bool = False
+    ) -> AsyncIterator[T]:
+        broadcast = self._streams.get(key)
+        if broadcast is None or broadcast.cancelled:
+            holder: Dict[str, Any] = {}
+            broadcast = Broadcast(
+                factory(),
+                on_finish=lambda: self._forget(self._streams, key, holder.get("broadcast")),
+                cancel_when_idle=cancel_when_idle,
+            )
+            holder["broadcast"] = broadcast
+            self._streams[key] = broadcast
+        return broadcast.subscribe()
+
+    @staticmethod
+    def _forget(registry: Dict[str, Any], key: str, value: Any) -> None:
+        if registry.get(key) is value:
+            registry.pop(key, None)
@@ -0,0 +1,95 @@
+"""
+上传大小限制中间件
+
+FastAPI 在调用路由函数之前就会把整个 multipart 表单解析落盘，
+路由里再检查大小为时已晚。这里在 ASGI 层拦截：
+- Content-Length 超限直接返回 413，不读取请求体
+- 分块上传（无 Content-Length）边接收边计数，超限立即中止
+"""
+import json
+from typing import Dict, Optional
+
+from starlette.exceptions import HTTPException
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+def _too_large_detail(limit: int) -> str:
+    return f"上传内容过大，最大 {limit // (1024 * 1024)} MB"
+
+
+class _PayloadTooLarge(HTTPException):
+    # 继承 HTTPException：FastAPI 解析表单时会把其他异常包装成 400
+    def __init__(self, limit: int) -> None:
+        super().__init__(status_code=413, detail=_too_large_detail(limit))
+
+
+class UploadSizeLimitMiddleware:
+    def __init__(self, app: ASGIApp, limits: Dict[str, int]) -> None:
+        """
+        Args:
+            limits: 路径前缀 -> 最大请求体字节数，按最长前缀匹配
+        """
+        self.app = app
+        self.limits = sorted(limits.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def _limit_for(self, path: str) -> Optional[int]:
+        for prefix, limit in self.limits:
+            if path.startswith(prefix):
+                return limit
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        limit = self._limit_for(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = None
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                content_length = value
+                break
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            await self._reject(send, limit)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise _PayloadTooLarge(limit)
+            return message
+
+        async def tracked_send(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except _PayloadTooLarge:
+            if not response_started:
+                await self._reject(send, limit)
+
+    @staticmethod
+    async def _reject(send: Send, limit: int) -> None:
+        body = json.dumps(
+            {"detail": _too_large_detail(limit)},
+            ensure_ascii=False,
+        ).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -4,7 +4,16 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.config import settings
 from app.core.database import engine, Base
+from app.core.upload_limit import UploadSizeLimitMiddleware
 from app.api.v1.router import api_router
+from app.services.analysis_cache import close_analysis_cache
+from app.services.analysis_jobs import start_analysis_workers, stop_analysis_workers
+from app.services.chat_openers import close_opener_cache
+from app.services.chat_sessions import close_chat_sessions
+from app.services.dashscope_client import close_dashscope_client
+from app.services.image_preprocess import shutdown_image_executor
+from app.services.tts_cache import close_tts_cache
+from app.services.tts_pool import close_tts_pool, start_tts_pool_reaper
 
 
 @asynccontextmanager
@@ -12,8 +21,18 @@ async def lifespan(app: FastAPI):
     # Startup: 创建数据库表（开发用，生产环境用 alembic）
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    await start_analysis_workers()
+    start_tts_pool_reaper()
     yield
     # Shutdown
+    await stop_analysis_workers()
+    await close_dashscope_client()
+    shutdown_image_executor()
+    close_analysis_cache()
+    close_chat_sessions()
+    close_opener_cache()
+    close_tts_pool()
+    close_tts_cache()
     await engine.dispose()
 
 
@@ -23,7 +42,18 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-# CORS 配置
+# 上传大小限制：在解析表单之前拒绝超大请求
+# 先注册、位于 CORS 内层：413 响应同样带上 CORS 头，浏览器能看到真实错误
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    limits={
+        "/api/scenes/analyze": settings.MAX_UPLOAD_BYTES,
+        "/api/scenes/analyze/batch": settings.MAX_BATCH_UPLOAD_BYTES,
+        "/api/scenes/jobs": settings.MAX_UPLOAD_BYTES,
+    },
+)
+
+# CORS 配置（最后注册的中间件在最外层）
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # 生产环境应限制来源
@@ -31,6 +31,26 @@ class Description(BaseModel):
     cn: str
 
 
+class VisionObject(BaseModel):
+    en: str
+    cn: str
+
+
+class SceneVision(BaseModel):
+    """千问 VL 视觉识别结果（与 CEFR 等级无关）"""
+    scene_tag: str
+    scene_tag_cn: str
+    objects: list[VisionObject]
+    description: str
+    category: str
+
+
+class SceneLevelContent(BaseModel):
+    """按 CEFR 等级生成的词汇和描述"""
+    object_tags: list[ObjectTag]
+    description: Description
+
+
 class SceneAnalyzeBasicResponse(BaseModel):
     """AI 分析返回的基础数据（第一阶段）"""
     scene_tag: str
@@ -50,6 +70,14 @@ class SceneAnalyzeResponse(BaseModel):
     category: str
 
 
+class AnalysisJobResponse(BaseModel):
+    """异步分析任务状态"""
+    job_id: str
+    status: str  # queued / running / done / failed
+    result: Optional[SceneAnalyzeResponse] = None
+    error: Optional[str] = None
+
+
 class SceneCreate(BaseModel):
     local_photo_id: str
     scene_tag: str
@@ -1,16 +1,20 @@
-from typing import Optional, List
+from dataclasses import dataclass
+from typing import AsyncGenerator, Callable, Dict, List, Optional, Tuple
 import hashlib
 import time
 import base64
 import asyncio
 import threading
 import io
+import struct
 import wave
 
-import dashscope
-from dashscope.audio.qwen_tts_realtime import QwenTtsRealtime, QwenTtsRealtimeCallback, AudioFormat
+from dashscope.audio.qwen_tts_realtime import QwenTtsRealtimeCallback
 
 from app.core.config import settings
+from app.services.audio_store import AUDIO_MIME_TYPES, deliver_audio
+from app.services.tts_cache import get_cached_audio, normalize_tts_text, set_cached_audio, tts_cache_key
+from app.services.tts_pool import get_tts_pool
 
 
 # 通义千问 TTS 音色映射
@@ -26,18 +30,84 @@ DEFAULT_VOICE = "Serena"
 DEFAULT_SAMPLE_RATE = 24000
 DEFAULT_CHANNELS = 1
 DEFAULT_SAMPLE_WIDTH = 2  # 16-bit
-DEFAULT_AUDIO_FORMAT = AudioFormat.PCM_24000HZ_MONO_16BIT
-DEFAULT_MODEL = settings.QWEN_TTS_MODEL
-DEFAULT_WS_URL = settings.QWEN_TTS_WS_URL
 DEFAULT_TIMEOUT_SEC = 60
 
+# 实时合成接口支持的输出格式与采样率
+SUPPORTED_CODECS = ("wav", "mp3", "opus")
+SUPPORTED_SAMPLE_RATES = (8000, 16000, 24000, 48000)
+
+
+@dataclass(frozen=True)
+class TtsOutputFormat:
+    """
+    TTS 输出格式
+
+    codec 为 wav 时向服务端请求 pcm 再在本地封装 WAV；mp3 / opus 由服务端直接编码。
+    SDK 的 AudioFormat 枚举只有 24kHz PCM，update_session 只读取
+    response_format.format 和 .sample_rate，这里直接传入本对象
+    """
+    codec: str = "wav"
+    sample_rate: int = DEFAULT_SAMPLE_RATE
+
+    @property
+    def format(self) -> str:
+        return "pcm" if self.codec == "wav" else self.codec
+
+    @property
+    def mime_type(self) -> str:
+        return AUDIO_MIME_TYPES[self.codec]
+
+    @property
+    def key(self) -> str:
+        """连接池和缓存按格式区分"""
+        return f"{self.codec}-{self.sample_rate}"
+
+
+DEFAULT_OUTPUT_FORMAT = TtsOutputFormat()
+
+
+def output_format(codec: Optional[str] = None, sample_rate: Optional[int] = None) -> TtsOutputFormat:
+    """
+    按请求解析输出格式，未指定的部分使用 TTS_OUTPUT_FORMAT / TTS_OUTPUT_SAMPLE_RATE
+
+    Raises:
+        ValueError: 格式或采样率不受支持
+    """
+    codec = codec or settings.TTS_OUTPUT_FORMAT
+    sample_rate = sample_rate or settings.TTS_OUTPUT_SAMPLE_RATE
+    if codec not in SUPPORTED_CODECS:
+        raise ValueError(f"不支持的音频格式: {codec}")
+    if sample_rate not in SUPPORTED_SAMPLE_RATES:
+        raise ValueError(f"不支持的采样率: {sample_rate}")
+    return TtsOutputFormat(codec, sample_rate)
+
 
 class _QwenTtsCollector(QwenTtsRealtimeCallback):
-    def __init__(self) -> None:
+    """
+    收集 response.audio.delta 的 PCM 数据
+
+    on_chunk: 每收到一段 PCM 就调用（在 SDK 的接收线程中），用于流式转发
+    """
+
+    def __init__(self, on_chunk: Optional[Callable[[bytes], None]] = None) -> None:
         super().__init__()
+        self.on_chunk = on_chunk
         self._chunks: List[bytes] = []
         self._done = threading.Event()
         self.error: Optional[str] = None
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        """调用方已放弃（如客户端断开），唤醒合成线程尽快退出"""
+        self.cancelled = True
+        self._done.set()
+
+    def reset(self) -> None:
+        """换连接重试前清空上一次的结果"""
+        self._chunks = []
+        self.error = None
+        if not self.cancelled:
+            self._done.clear()
 
     def on_close(self, close_status_code, close_msg) -> None:
         if close_status_code != 1000 and not self._done.is_set():
@@ -50,9 +120,15 @@ class _QwenTtsCollector(QwenTtsRealtimeCallback):
             if event_type == "response.audio.delta":
                 delta = response.get("delta")
                 if delta:
-                    self._chunks.append(base64.b64decode(delta))
+                    pcm = base64.b64decode(delta)
+                    self._chunks.append(pcm)
+                    if self.on_chunk is not None:
+                        self.on_chunk(pcm)
             elif event_type in ("response.done", "session.finished"):
                 self._done.set()
+            elif event_type == "error":
+                self.error = str(response.get("error") or response)
+                self._done.set()
         except Exception as e:
             self.error = str(e)
             self._done.set()
@@ -64,88 +140,219 @@ class _QwenTtsCollector(QwenTtsRealtimeCallback):
         return b"".join(self._chunks)
 
 
-def _pcm_to_wav(pcm_data: bytes) -> bytes:
+def _pcm_to_wav(pcm_data: bytes, sample_rate: int = DEFAULT_SAMPLE_RATE) -> bytes:
     with io.BytesIO() as buffer:
         with wave.open(buffer, "wb") as wf:
             wf.setnchannels(DEFAULT_CHANNELS)
             wf.setsampwidth(DEFAULT_SAMPLE_WIDTH)
-            wf.setframerate(DEFAULT_SAMPLE_RATE)
+            wf.setframerate(sample_rate)
             wf.writeframes(pcm_data)
         return buffer.getvalue()
 
 
-async def text_to_speech(text: str, voice: str = "en-US-female") -> Optional[str]:
+def _wav_header(sample_rate: int = DEFAULT_SAMPLE_RATE, data_size: int = 0xFFFFFFFF) -> bytes:
+    """
+    44 字节 WAV 头；流式输出时总长度未知，RIFF / data 长度填 0xFFFFFFFF，
+    播放器按“读到流结束为止”处理
     """
-    使用通义千问 TTS 合成语音，返回 Base64 编码的音频数据 URL
+    byte_rate = sample_rate * DEFAULT_CHANNELS * DEFAULT_SAMPLE_WIDTH
+    riff_size = 0xFFFFFFFF if data_size == 0xFFFFFFFF else data_size + 36
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", riff_size, b"WAVE",
+        b"fmt ", 16, 1, DEFAULT_CHANNELS, sample_rate, byte_rate,
+        DEFAULT_CHANNELS * DEFAULT_SAMPLE_WIDTH, DEFAULT_SAMPLE_WIDTH * 8,
+        b"data", data_size,
+    )
+
+
+def _wav_frames(wav_data: bytes) -> bytes:
+    with wave.open(io.BytesIO(wav_data), "rb") as wf:
+        return wf.readframes(wf.getnframes())
+
+
+def _finish_audio(raw: bytes, audio_format: TtsOutputFormat) -> bytes:
+    """服务端返回的数据 -> 完整音频文件（PCM 封装成 WAV，压缩格式原样返回）"""
+    if audio_format.codec == "wav":
+        return _pcm_to_wav(raw, audio_format.sample_rate)
+    return raw
+
+
+async def text_to_speech(
+    text: str,
+    voice: str = "en-US-female",
+    delivery: Optional[str] = None,
+    audio_format: Optional[TtsOutputFormat] = None
+) -> Optional[str]:
     """
+    使用通义千问 TTS 合成语音
+
+    audio_format 默认见 TTS_OUTPUT_FORMAT / TTS_OUTPUT_SAMPLE_RATE
+
+    Returns:
+        delivery 为 "data_url" 时为 Base64 编码的音频数据 URL，
+        为 "url" 时为音频库地址 /api/tts/audio/{audio_id}；默认见 TTS_AUDIO_DELIVERY
+    """
+    audio_format = audio_format or output_format()
     if not settings.DASHSCOPE_API_KEY:
         text_hash = hashlib.md5(text.encode()).hexdigest()[:8]
         timestamp = int(time.time())
         return f"https://tts.placeholder.com/audio/{text_hash}_{timestamp}.wav"
 
     try:
-        audio_data = await _qwen_tts(text, voice)
+        audio_data = await _synthesize(text, voice, audio_format)
         if audio_data:
-            audio_base64 = base64.b64encode(audio_data).decode("utf-8")
-            return f"data:audio/wav;base64,{audio_base64}"
+            return await deliver_audio(audio_data, delivery, audio_format.mime_type)
         return None
     except Exception as e:
         print(f"TTS failed: {e}")
         return None
 
 
-async def text_to_speech_bytes(text: str, voice: str = "en-US-female") -> Optional[bytes]:
+async def text_to_speech_bytes(
+    text: str,
+    voice: str = "en-US-female",
+    audio_format: Optional[TtsOutputFormat] = None
+) -> Optional[bytes]:
     """
-    使用通义千问 TTS 合成语音，返回原始音频字节
+    使用通义千问 TTS 合成语音，返回原始音频字节（完整的 WAV / MP3 / Opus 文件）
     """
     if not settings.DASHSCOPE_API_KEY:
         return None
 
     try:
-        return await _qwen_tts(text, voice)
+        return await _synthesize(text, voice, audio_format or output_format())
     except Exception as e:
         print(f"TTS bytes failed: {e}")
         return None
 
 
-async def _qwen_tts(text: str, voice: str) -> Optional[bytes]:
+async def text_to_speech_batch(
+    items: List[Tuple[str, str]],
+    delivery: Optional[str] = None,
+    audio_format: Optional[TtsOutputFormat] = None
+) -> AsyncGenerator[Tuple[int, Optional[str]], None]:
     """
-    使用 DashScope SDK 调用通义千问实时语音合成
-    """
-    def sync_tts():
-        dashscope.api_key = settings.DASHSCOPE_API_KEY
-
-        # 映射音色（支持直接传入通义千问音色）
-        speaker = VOICE_MAP.get(voice, voice or DEFAULT_VOICE)
+    批量合成 [(文本, 音色), ...]，按完成顺序产出 (下标, 音频地址)，失败的条目地址为 None
 
-        callback = _QwenTtsCollector()
-        qwen_tts = QwenTtsRealtime(
-            model=DEFAULT_MODEL,
-            callback=callback,
-            url=DEFAULT_WS_URL
-        )
+    - 同一批里文本和音色都相同的条目只合成一次
+    - 最多 TTS_BATCH_CONCURRENCY 条同时合成（走同一个缓存和连接池）
+    - 调用方提前关闭生成器时取消尚未完成的合成
+    """
+    audio_format = audio_format or output_format()
+    semaphore = asyncio.Semaphore(max(1, settings.TTS_BATCH_CONCURRENCY))
 
-        qwen_tts.connect()
-        qwen_tts.update_session(
-            voice=speaker,
-            response_format=DEFAULT_AUDIO_FORMAT,
-            mode="commit"
-        )
+    groups: Dict[Tuple[str, str], List[int]] = {}
+    for index, (text, voice) in enumerate(items):
+        groups.setdefault((normalize_tts_text(text), _speaker(voice)), []).append(index)
 
-        qwen_tts.append_text(text)
-        qwen_tts.commit()
+    async def synthesize(indexes: List[int]) -> Tuple[List[int], Optional[str]]:
+        text, voice = items[indexes[0]]
+        async with semaphore:
+            return indexes, await text_to_speech(text, voice, delivery, audio_format)
 
-        finished = callback.wait(timeout=DEFAULT_TIMEOUT_SEC)
-        qwen_tts.finish()
+    tasks = [asyncio.create_task(synthesize(indexes)) for indexes in groups.values()]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            indexes, url = await next_done
+            for index in indexes:
+                yield index, url
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _speaker(voice: str) -> str:
+    # 映射音色（支持直接传入通义千问音色）
+    return VOICE_MAP.get(voice, voice or DEFAULT_VOICE)
+
+
+async def _synthesize(text: str, voice: str, audio_format: TtsOutputFormat) -> Optional[bytes]:
+    """先查 TTS 缓存，未命中再合成并写入缓存（缓存按格式区分）"""
+    key = tts_cache_key(text, _speaker(voice), settings.QWEN_TTS_MODEL, audio_format.key)
+    audio_data = await get_cached_audio(key)
+    if audio_data is not None:
+        print(f"TTS cache hit for '{text[:30]}...'")
+        return audio_data
+
+    audio_data = await _qwen_tts(text, voice, audio_format)
+    if audio_data:
+        await set_cached_audio(key, audio_data)
+    return audio_data
+
+
+def _run_synthesis(
+    text: str,
+    voice: str,
+    callback: "_QwenTtsCollector",
+    audio_format: TtsOutputFormat = DEFAULT_OUTPUT_FORMAT
+) -> None:
+    """
+    在线程池线程中执行一次合成（复用连接池中的会话），音频收集在 callback 中
 
-        if not finished or callback.error:
-            raise RuntimeError(callback.error or "TTS timeout")
+    取消时提前返回；超时 / 出错时抛出 RuntimeError
+    """
+    speaker = _speaker(voice)
+    key = (speaker, audio_format.key)
+    session_config = {"voice": speaker, "response_format": audio_format}
+    pool = get_tts_pool()
+
+    for attempt in range(2):
+        connection = pool.acquire(key, session_config)
+        reused = connection.uses > 0
+        connection.bind(callback)
+        reusable = False
+        try:
+            if callback.cancelled:
+                reusable = True
+                return
+
+            try:
+                connection.client.append_text(text)
+                connection.client.commit()
+                finished = callback.wait(timeout=DEFAULT_TIMEOUT_SEC)
+            except Exception as e:
+                callback.error = str(e)
+                finished = False
+
+            if callback.cancelled:
+                # 停止服务端继续合成，不再占用配额；连接不放回池中
+                connection.client.cancel_response()
+                return
+
+            if callback.error and reused and attempt == 0 and not callback.audio():
+                # 空闲期间被服务端关闭的连接，换新连接重试一次
+                print(f"[TTS Pool] Stale connection ({callback.error}), reconnecting")
+                callback.reset()
+                continue
+
+            if not finished or callback.error:
+                raise RuntimeError(callback.error or "TTS timeout")
+
+            reusable = True
+            return
+
+        finally:
+            pool.release(connection, reusable)
+
+
+async def _qwen_tts(
+    text: str,
+    voice: str,
+    audio_format: TtsOutputFormat = DEFAULT_OUTPUT_FORMAT
+) -> Optional[bytes]:
+    """
+    使用 DashScope SDK 调用通义千问实时语音合成
+    """
+    callback = _QwenTtsCollector()
 
-        pcm_audio = callback.audio()
-        if not pcm_audio:
+    def sync_tts():
+        _run_synthesis(text, voice, callback, audio_format)
+        raw_audio = callback.audio()
+        if not raw_audio:
             return None
-
-        return _pcm_to_wav(pcm_audio)
+        return _finish_audio(raw_audio, audio_format)
 
     try:
         loop = asyncio.get_running_loop()
@@ -158,6 +365,69 @@ async def _qwen_tts(text: str, voice: str) -> Optional[bytes]:
             print(f"TTS returned empty audio for '{text[:30]}...'")
             return None
 
+    except asyncio.CancelledError:
+        # 取消 await 不会停止线程，通知线程关闭连接后立即返回
+        callback.cancel()
+        print(f"TTS cancelled for '{text[:30]}...'")
+        raise
+
     except Exception as e:
         print(f"Qwen TTS error: {e}")
         return None
+
+
+async def text_to_speech_stream(
+    text: str,
+    voice: str = "en-US-female",
+    audio_format: Optional[TtsOutputFormat] = None,
+    with_header: bool = True
+) -> AsyncGenerator[bytes, None]:
+    """
+    流式合成：收到一段音频就产出一段，首段延迟即首个 audio.delta 的延迟
+
+    wav 格式 with_header=True 时输出流式 WAV（首段带长度未知的 WAV 头），
+    否则为裸 PCM（16-bit / 单声道）；mp3 / opus 直接转发服务端的编码数据。
+    缓存命中时一次产出完整音频；合成完成后写入 TTS 缓存。
+    首段之前失败时抛出异常，之后失败时提前结束
+    """
+    if not settings.DASHSCOPE_API_KEY:
+        return
+
+    audio_format = audio_format or output_format()
+    is_wav = audio_format.codec == "wav"
+    key = tts_cache_key(text, _speaker(voice), settings.QWEN_TTS_MODEL, audio_format.key)
+    cached = await get_cached_audio(key)
+    if cached is not None:
+        print(f"TTS cache hit for '{text[:30]}...'")
+        yield _wav_frames(cached) if is_wav and not with_header else cached
+        return
+
+    loop = asyncio.get_running_loop()
+    chunks: asyncio.Queue = asyncio.Queue()
+    callback = _QwenTtsCollector(
+        on_chunk=lambda pcm: loop.call_soon_threadsafe(chunks.put_nowait, pcm)
+    )
+    future = loop.run_in_executor(None, _run_synthesis, text, voice, callback, audio_format)
+    # 合成线程结束时放入结束标记；数据段都先于结束标记入队
+    future.add_done_callback(lambda _: chunks.put_nowait(None))
+
+    prefix = _wav_header(audio_format.sample_rate) if is_wav and with_header else b""
+    try:
+        while True:
+            chunk = await chunks.get()
+            if chunk is None:
+                break
+            yield prefix + chunk
+            prefix = b""
+
+        await future
+        raw_audio = callback.audio()
+        if raw_audio:
+            print(f"TTS stream success: {len(raw_audio)} bytes for '{text[:30]}...'")
+            await set_cached_audio(key, _finish_audio(raw_audio, audio_format))
+
+    finally:
+        if not future.done():
+            # 客户端断开：通知合成线程取消并关闭连接
+            callback.cancel()
+            print(f"TTS stream cancelled for '{text[:30]}...'")
@@ -0,0 +1,76 @@
+"""
+场景分析结果缓存
+
+同一张照片经常被重复分析（超时重试、从相册重新打开、来回切换 CEFR 等级），
+缓存键 = 压缩后图片的 SHA-256 + cefr_level + Prompt 版本 + 阶段
+
+另存一条 原始上传 SHA-256 -> 压缩后图片摘要 的别名：
+同一文件再次上传时先查别名，结果已缓存就不必再解码、缩放、重新编码
+"""
+import asyncio
+import hashlib
+from typing import Any, Optional
+
+from app.core.cache import LRUCache, SQLiteCache, TieredCache
+from app.core.config import settings
+from app.services.qwen_vl import PROMPT_VERSION
+
+
+CACHE_HEADER = "X-Cache"
+
+_cache: Optional[TieredCache] = None
+
+
+def _get_cache() -> TieredCache:
+    global _cache
+    if _cache is None:
+        disk = None
+        if settings.ANALYSIS_CACHE_SQLITE_PATH:
+            disk = SQLiteCache(
+                settings.ANALYSIS_CACHE_SQLITE_PATH,
+                max_bytes=settings.ANALYSIS_CACHE_SQLITE_MAX_BYTES,
+                ttl_sec=settings.ANALYSIS_CACHE_TTL_SEC,
+            )
+        memory = LRUCache(
+            max_items=settings.ANALYSIS_CACHE_MAX_ITEMS,
+            max_bytes=settings.ANALYSIS_CACHE_MAX_BYTES,
+            ttl_sec=settings.ANALYSIS_CACHE_TTL_SEC,
+        )
+        _cache = TieredCache(memory, disk)
+    return _cache
+
+
+def image_digest(image_data: bytes) -> str:
+    return hashlib.sha256(image_data).hexdigest()
+
+
+async def upload_digest(buffer: Any) -> str:
+    """原始上传（bytes 或 mmap）的摘要；大文件哈希放到线程池"""
+    return await asyncio.to_thread(image_digest, buffer)
+
+
+def analysis_cache_key(digest: str, cefr_level: Optional[str], stage: str) -> str:
+    return f"{stage}:{PROMPT_VERSION}:{cefr_level or ''}:{digest}"
+
+
+def upload_alias_key(raw_digest: str) -> str:
+    return analysis_cache_key(raw_digest, None, "upload")
+
+
+async def get_cached_analysis(key: str) -> Optional[Any]:
+    return await _get_cache().get(key)
+
+
+async def set_cached_analysis(key: str, value: Any) -> None:
+    await _get_cache().set(key, value)
+
+
+def cache_status(hit: bool) -> str:
+    return "HIT" if hit else "MISS"
+
+
+def close_analysis_cache() -> None:
+    global _cache
+    if _cache is not None:
+        _cache.close()
+        _cache = None
@@ -0,0 +1,272 @@
+"""
+异步场景分析任务
+
+App 切到后台时 /scenes/analyze/stream 的连接会断开，生成器随之结束，
+已经付费的千问 VL 结果就丢了。任务模式下：
+1. POST 只负责把压缩后的图片写入 SQLite 队列，立即返回 job_id
+2. 后台 worker 从队列取任务运行分析流水线，与 HTTP 连接无关
+3. 客户端随时查询结果，或订阅该任务的 SSE 事件（先重放再跟随）
+
+同一图片 + 等级的未失败任务会被复用，已完成的分析不会因为断线重试被重新计算
+"""
+import asyncio
+import time
+from typing import Any, AsyncGenerator, Dict, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.job_queue import DONE, FAILED, Job, SQLiteJobQueue
+from app.core.singleflight import Broadcast
+from app.services.analysis_cache import image_digest
+from app.services.image_preprocess import PreparedImage
+from app.services.scene_analysis import ANALYSIS_FAILED_MESSAGE, stream_scene_analysis_shared
+
+
+# 任务排队 / 运行中且尚无实时事件时，SSE 轮询任务状态的间隔
+_POLL_INTERVAL_SEC = 0.5
+# worker 空闲时清理过期任务的最小间隔
+_PURGE_INTERVAL_SEC = 10 * 60
+
+_queue: Optional[SQLiteJobQueue] = None
+_workers: List[asyncio.Task] = []
+_wakeup: Optional[asyncio.Event] = None
+# 正在运行的任务 -> 事件广播，供 SSE 订阅
+_live: Dict[str, Broadcast] = {}
+# 本进程正在运行的任务，由心跳刷新租约
+_running: Set[str] = set()
+_heartbeat_task: Optional[asyncio.Task] = None
+_last_purge = 0.0
+
+
+def _get_queue() -> SQLiteJobQueue:
+    global _queue
+    if _queue is None:
+        _queue = SQLiteJobQueue(
+            settings.ANALYSIS_JOB_DB_PATH,
+            ttl_sec=settings.ANALYSIS_JOB_TTL_SEC,
+        )
+    return _queue
+
+
+def _wake_workers() -> None:
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+def _dedupe_key(raw_digest: str, cefr_level: Optional[str]) -> str:
+    return f"{raw_digest}:{cefr_level or ''}"
+
+
+async def find_analysis_job(raw_digest: str, cefr_level: Optional[str]) -> Optional[str]:
+    """同一上传 + 等级的未失败任务，重复提交时不必再预处理图片"""
+    return await _get_queue().find(_dedupe_key(raw_digest, cefr_level))
+
+
+async def submit_analysis_job(
+    prepared: PreparedImage,
+    cefr_level: Optional[str],
+    raw_digest: str
+) -> Tuple[str, bool]:
+    """
+    提交分析任务（按原始上传摘要去重）
+
+    Returns:
+        (job_id, 是否新建；False 表示复用了已有任务)
+    """
+    digest = image_digest(prepared.data)
+    job_id, created = await _get_queue().enqueue(
+        dedupe_key=_dedupe_key(raw_digest, cefr_level),
+        params={"cefr_level": cefr_level, "mime_type": prepared.mime_type, "digest": digest},
+        payload=bytes(prepared.data),
+    )
+    if created:
+        _wake_workers()
+    return job_id, created
+
+
+async def get_analysis_job(job_id: str) -> Optional[Job]:
+    return await _get_queue().get(job_id)
+
+
+async def _run_job(job: Job) -> None:
+    params = job.params
+    prepared = PreparedImage(data=job.payload or b"", mime_type=params["mime_type"])
+    broadcast = Broadcast(
+        stream_scene_analysis_shared(
+            prepared, params.get("cefr_level"), params.get("digest")
+        )
+    )
+    _live[job.id] = broadcast
+
+    result: Dict[str, Any] = {}
+    error: Optional[str] = None
+    try:
+        async for event in broadcast.subscribe():
+            if event["type"] == "basic":
+                result.update(event["data"])
+            elif event["type"] == "expressions":
+                result.update(event["data"])
+            elif event["type"] == "error":
+                error = event.get("message") or ANALYSIS_FAILED_MESSAGE
+    except Exception as e:
+        print(f"[Jobs] Job {job.id} failed: {e}")
+        error = str(e)
+
+    try:
+        if error is None and "expressions" in result:
+            await _get_queue().complete(job.id, result)
+        else:
+            await _get_queue().fail(job.id, error or ANALYSIS_FAILED_MESSAGE)
+    finally:
+        # 结果落盘后再移除实时广播，订阅者不会看到“运行中但无事件”的空窗
+        _live.pop(job.id, None)
+
+
+async def _maybe_purge() -> None:
+    """清理过期任务，并回收租约过期（所在进程已退出）的任务"""
+    global _last_purge
+    now = time.monotonic()
+    if now - _last_purge < min(_PURGE_INTERVAL_SEC, settings.ANALYSIS_JOB_LEASE_SEC):
+        return
+    _last_purge = now
+    try:
+        recovered = await _get_queue().recover(settings.ANALYSIS_JOB_LEASE_SEC)
+        if recovered:
+            print(f"[Jobs] Requeued {recovered} jobs with expired lease")
+        purged = await _get_queue().purge()
+        if purged:
+            print(f"[Jobs] Purged {purged} expired jobs")
+    except Exception as e:
+        print(f"[Jobs] Purge failed: {e}")
+
+
+async def _heartbeat_loop() -> None:
+    """定期刷新本进程运行中任务的 updated_at，避免被其他进程当作遗留任务回收"""
+    interval = settings.ANALYSIS_JOB_LEASE_SEC / 3
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await _get_queue().heartbeat(list(_running))
+        except Exception as e:
+            print(f"[Jobs] Heartbeat failed: {e}")
+
+
+async def _worker(index: int) -> None:
+    queue = _get_queue()
+    while True:
+        try:
+            job = await queue.claim()
+        except Exception as e:
+            print(f"[Jobs] Worker {index} claim failed: {e}")
+            job = None
+
+        if job is None:
+            await _maybe_purge()
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=_POLL_INTERVAL_SEC * 10)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        print(f"[Jobs] Worker {index} running job {job.id}")
+        _running.add(job.id)
+        try:
+            await _run_job(job)
+        except Exception as e:
+            # worker 不能因为单个任务退出，否则队列会在所有 worker 退出后停滞
+            print(f"[Jobs] Worker {index} job {job.id} crashed: {e}")
+            try:
+                await queue.fail(job.id, ANALYSIS_FAILED_MESSAGE)
+            except Exception as fail_error:
+                # 仍为 running，租约过期后由 recover 重新入队
+                print(f"[Jobs] Worker {index} could not mark job {job.id} failed: {fail_error}")
+        # 被取消（停机）时保留在 _running 中，由 stop_analysis_workers 放回队列
+        _running.discard(job.id)
+
+
+async def start_analysis_workers() -> None:
+    """启动 worker（应用启动时调用），并把租约已过期的遗留任务重新入队"""
+    global _wakeup, _heartbeat_task
+    if _workers:
+        return
+
+    _wakeup = asyncio.Event()
+    # 只回收租约过期的任务：同一个库上其他仍在运行的进程的任务不受影响
+    recovered = await _get_queue().recover(settings.ANALYSIS_JOB_LEASE_SEC)
+    if recovered:
+        print(f"[Jobs] Requeued {recovered} unfinished jobs")
+
+    _heartbeat_task = asyncio.create_task(_heartbeat_loop())
+    for index in range(settings.ANALYSIS_JOB_WORKERS):
+        _workers.append(asyncio.create_task(_worker(index)))
+
+
+async def stop_analysis_workers() -> None:
+    """停止 worker 并关闭队列；本进程运行中的任务放回队列"""
+    global _queue, _wakeup, _heartbeat_task
+    tasks = list(_workers)
+    if _heartbeat_task is not None:
+        tasks.append(_heartbeat_task)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _workers.clear()
+    _heartbeat_task = None
+    _live.clear()
+    _wakeup = None
+
+    if _queue is not None:
+        try:
+            requeued = await _queue.requeue(list(_running))
+            if requeued:
+                print(f"[Jobs] Requeued {requeued} running jobs on shutdown")
+        except Exception as e:
+            print(f"[Jobs] Requeue on shutdown failed: {e}")
+        _running.clear()
+        _queue.close()
+        _queue = None
+
+
+def _finished_events(job: Job) -> List[Dict[str, Any]]:
+    if job.status == FAILED:
+        return [{"type": "error", "message": job.error or ANALYSIS_FAILED_MESSAGE}]
+
+    result = dict(job.result or {})
+    expressions = result.pop("expressions", None)
+    return [
+        {"type": "basic", "data": result},
+        {"type": "expressions", "data": {"expressions": expressions}},
+        {"type": "done"},
+    ]
+
+
+async def stream_analysis_job(job_id: str) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    订阅任务事件，事件格式与 /scenes/analyze/stream 相同，另有:
+    - {"type": "status", "status": "queued"} - 任务排队中
+
+    断开订阅不影响任务本身
+    """
+    notified_queued = False
+    while True:
+        broadcast = _live.get(job_id)
+        if broadcast is not None:
+            async for event in broadcast.subscribe():
+                yield event
+            return
+
+        job = await get_analysis_job(job_id)
+        if job is None:
+            yield {"type": "error", "message": "任务不存在"}
+            return
+
+        if job.status in (DONE, FAILED):
+            for event in _finished_events(job):
+                yield event
+            return
+
+        if not notified_queued:
+            notified_queued = True
+            yield {"type": "status", "status": job.status}
+
+        await asyncio.sleep(_POLL_INTERVAL_SEC)
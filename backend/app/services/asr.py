@@ -7,9 +7,9 @@ import asyncio
 from typing import Optional
 
 import dashscope
-from dashscope import Generation
 
 from app.core.config import settings
+from app.services.dashscope_client import DashScopeError, get_dashscope_client, response_text
 
 
 async def add_punctuation(text: str, language: str = "en") -> str:
@@ -30,13 +30,10 @@ async def add_punctuation(text: str, language: str = "en") -> str:
         print("[ASR] No DASHSCOPE_API_KEY configured")
         return text
 
-    def sync_call():
-        dashscope.api_key = settings.DASHSCOPE_API_KEY
-
-        if language == "zh":
-            system_prompt = "你是一个文本格式化助手。请给用户的文本添加正确的标点符号（句号、问号、逗号等）。只输出格式化后的文本，不要添加任何解释。"
-        else:
-            system_prompt = """You are a text punctuation assistant. Your task is to add proper punctuation marks to the user's text.
+    if language == "zh":
+        system_prompt = "你是一个文本格式化助手。请给用户的文本添加正确的标点符号（句号、问号、逗号等）。只输出格式化后的文本，不要添加任何解释。"
+    else:
+        system_prompt = """You are a text punctuation assistant. Your task is to add proper punctuation marks to the user's text.
 
 Rules:
 1. Add periods (.) at the end of statements
@@ -48,35 +45,27 @@ Rules:
 
 IMPORTANT: Only output the punctuated text, nothing else. Do not add quotation marks around the result."""
 
-        try:
-            response = Generation.call(
-                model='qwen-plus',
-                messages=[
-                    {'role': 'system', 'content': system_prompt},
-                    {'role': 'user', 'content': text}
-                ]
-            )
-
-            if response.status_code == 200:
-                result = response.output.get('text', text)
-                # 移除可能添加的引号
-                result = result.strip('"\'')
-                print(f"[ASR] Punctuation added: '{text}' -> '{result}'")
-                return result
-            else:
-                print(f"[ASR] Punctuation API error: {response.message}")
-                return text
-
-        except Exception as e:
-            print(f"[ASR] Punctuation error: {e}")
-            return text
-
     try:
-        loop = asyncio.get_running_loop()
-        result = await loop.run_in_executor(None, sync_call)
+        response = await get_dashscope_client().generation(
+            model='qwen-plus',
+            messages=[
+                {'role': 'system', 'content': system_prompt},
+                {'role': 'user', 'content': text}
+            ]
+        )
+
+        result = response_text(response) or text
+        # 移除可能添加的引号
+        result = result.strip('"\'')
+        print(f"[ASR] Punctuation added: '{text}' -> '{result}'")
         return result
+
+    except DashScopeError as e:
+        print(f"[ASR] Punctuation API error: {e.message}")
+        return text
+
     except Exception as e:
-        print(f"[ASR] Async error: {e}")
+        print(f"[ASR] Punctuation error: {e}")
         return text
 
 
@@ -0,0 +1,188 @@
+"""
+合成音频的本地存储（按内容寻址）
+
+以前合成的音频都以 data:audio/wav;base64,... 内联在 JSON / SSE 里：
+体积膨胀 1/3、每次都要序列化，AVPlayer 也无法缓存或按 Range 读取。
+url 交付模式下音频写入本地目录，文件名为内容的 sha256，
+响应里只带 /api/tts/audio/{audio_id}?expires=...&sig=...，由 GET 接口按 ETag / Range 返回
+
+地址是短期有效的：expires 之后失效（TTS_AUDIO_URL_TTL_SEC），sig 为 SECRET_KEY 的 HMAC，
+文件名可由内容推出，不签名的话任何人拿到 audio_id 都能一直访问
+
+同一段音频只存一份；超过 TTS_AUDIO_STORE_TTL_SEC 未写入的文件、
+或总大小超过 TTS_AUDIO_STORE_MAX_BYTES 时最旧的文件会被清理
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import re
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+from app.core.config import settings
+
+
+DELIVERY_DATA_URL = "data_url"
+DELIVERY_URL = "url"
+DELIVERY_BYTES = "bytes"  # WebSocket 二进制帧
+
+# 扩展名 -> MIME 类型
+AUDIO_MIME_TYPES = {
+    "wav": "audio/wav",
+    "mp3": "audio/mpeg",
+    "opus": "audio/opus",
+}
+
+_AUDIO_ID = re.compile(r"^[0-9a-f]{32}\.(wav|mp3|opus)$")
+
+# 写入时清理过期文件的最小间隔
+_PURGE_INTERVAL_SEC = 10 * 60
+_last_purge = 0.0
+
+
+def _store_dir() -> Path:
+    return Path(settings.TTS_AUDIO_STORE_DIR)
+
+
+def resolve_delivery(delivery: Optional[str]) -> str:
+    return delivery or settings.TTS_AUDIO_DELIVERY
+
+
+def _signature(audio_id: str, expires: int) -> str:
+    message = f"{audio_id}:{expires}".encode("utf-8")
+    return hmac.new(settings.SECRET_KEY.encode("utf-8"), message, hashlib.sha256).hexdigest()[:32]
+
+
+def audio_url(audio_id: str) -> str:
+    """音频的签名访问地址，TTS_AUDIO_URL_TTL_SEC 后失效；未配置 PUBLIC_BASE_URL 时为相对路径"""
+    expires = int(time.time()) + settings.TTS_AUDIO_URL_TTL_SEC
+    return (
+        f"{settings.PUBLIC_BASE_URL.rstrip('/')}/api/tts/audio/{audio_id}"
+        f"?expires={expires}&sig={_signature(audio_id, expires)}"
+    )
+
+
+def verify_audio_url(audio_id: str, expires: Optional[int], sig: Optional[str]) -> bool:
+    """校验 audio_url 生成的签名且未过期"""
+    if expires is None or not sig or expires < time.time():
+        return False
+    return hmac.compare_digest(sig, _signature(audio_id, expires))
+
+
+def _save_sync(data: bytes, extension: str) -> str:
+    audio_id = f"{hashlib.sha256(data).hexdigest()[:32]}.{extension}"
+    directory = _store_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / audio_id
+
+    if path.exists():
+        # 内容相同无需重写，只刷新过期时间
+        os.utime(path)
+    else:
+        tmp_path = path.with_name(f".{audio_id}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    return audio_id
+
+
+def _purge_sync() -> int:
+    directory = _store_dir()
+    if not directory.is_dir():
+        return 0
+
+    now = time.time()
+    files = []
+    removed = 0
+    for path in directory.iterdir():
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        if not _AUDIO_ID.match(path.name):
+            # 临时文件可能正在被其他进程写入，只清理早已中断遗留的
+            if path.name.startswith(".") and now - stat.st_mtime > settings.TTS_AUDIO_STORE_TTL_SEC:
+                path.unlink(missing_ok=True)
+            continue
+        if now - stat.st_mtime > settings.TTS_AUDIO_STORE_TTL_SEC:
+            path.unlink(missing_ok=True)
+            removed += 1
+        else:
+            files.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= settings.TTS_AUDIO_STORE_MAX_BYTES:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+        removed += 1
+    return removed
+
+
+async def _maybe_purge() -> None:
+    global _last_purge
+    now = time.monotonic()
+    if now - _last_purge < _PURGE_INTERVAL_SEC:
+        return
+    _last_purge = now
+    try:
+        removed = await asyncio.to_thread(_purge_sync)
+        if removed:
+            print(f"[AudioStore] Purged {removed} files")
+    except Exception as e:
+        print(f"[AudioStore] Purge failed: {e}")
+
+
+async def save_audio(data: bytes, extension: str = "wav") -> str:
+    """写入音频，返回 audio_id（内容哈希 + 扩展名）"""
+    audio_id = await asyncio.to_thread(_save_sync, data, extension)
+    await _maybe_purge()
+    return audio_id
+
+
+def audio_path(audio_id: str) -> Optional[Path]:
+    """audio_id 对应的文件；格式非法或文件不存在时返回 None"""
+    if not _AUDIO_ID.match(audio_id):
+        return None
+    path = _store_dir() / audio_id
+    return path if path.is_file() else None
+
+
+def to_data_url(data: bytes, mime_type: str = "audio/wav") -> str:
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode('utf-8')}"
+
+
+def decode_data_url(url: str) -> Optional[Tuple[bytes, str]]:
+    """data URL -> (音频字节, MIME 类型)；不是 data URL 时返回 None"""
+    if not url.startswith("data:") or "," not in url:
+        return None
+    header, encoded = url.split(",", 1)
+    mime_type = header[len("data:"):].split(";", 1)[0] or "application/octet-stream"
+    return base64.b64decode(encoded), mime_type
+
+
+def extension_for(mime_type: str) -> str:
+    for extension, known in AUDIO_MIME_TYPES.items():
+        if known == mime_type:
+            return extension
+    return "wav"
+
+
+async def deliver_audio(data: bytes, delivery: Optional[str] = None, mime_type: str = "audio/wav") -> str:
+    """按交付方式把音频字节转换成 data URL 或音频库地址"""
+    if resolve_delivery(delivery) == DELIVERY_URL:
+        return audio_url(await save_audio(data, extension_for(mime_type)))
+    return to_data_url(data, mime_type)
+
+
+async def redeliver_audio(url: Optional[str], delivery: Optional[str] = None) -> Optional[str]:
+    """缓存里保存的 data URL 按本次请求的交付方式转换（如开场白音频）"""
+    if not url or resolve_delivery(delivery) != DELIVERY_URL:
+        return url
+    decoded = decode_data_url(url)
+    if decoded is None:
+        return url
+    return await deliver_audio(decoded[0], DELIVERY_URL, decoded[1])
@@ -1,8 +1,6 @@
-import dashscope
-from dashscope import Generation
-from typing import List, Dict, AsyncGenerator, Tuple
+from typing import List, Dict, AsyncGenerator, Optional, Tuple
 
-from app.core.config import settings
+from app.services.dashscope_client import DashScopeError, get_dashscope_client, response_text
 
 
 CHAT_SYSTEM_PROMPT = """You are a friendly English learning assistant helping the user practice spoken English.
@@ -28,6 +26,34 @@ CHAT_SYSTEM_PROMPT = """You are a friendly English learning assistant helping th
 - If the user makes grammar mistakes, gently correct them with a better phrasing"""
 
 
+# 较早的对话折叠成摘要后附加在系统提示末尾
+SUMMARY_SECTION = """
+
+## Earlier Conversation Summary
+{summary}"""
+
+
+# 合并模式：一次生成英文回复 + 中文翻译，省去单独的翻译调用
+TRANSLATION_MARKER = "<<<ZH>>>"
+
+COMBINED_TRANSLATION_SECTION = """
+
+## Translation (overrides the "English only" rule above)
+After your complete English reply, output a new line containing only """ + TRANSLATION_MARKER + """, then the Simplified Chinese translation of your reply.
+Do not put any Chinese before """ + TRANSLATION_MARKER + """ and do not add anything after the translation."""
+
+
+SUMMARIZE_PROMPT = """Summarize the earlier part of an English practice conversation between a learner (User) and an AI partner (AI).
+
+Previous summary (may be empty):
+{previous}
+
+New turns to fold in:
+{turns}
+
+Write one concise English paragraph (under {max_words} words) that keeps names, facts the user shared, topics discussed, open questions and recurring grammar mistakes. Output only the summary."""
+
+
 async def chat_with_scene(
     message: str,
     scene_tag: str,
@@ -36,13 +62,14 @@ async def chat_with_scene(
     roles: List[str],
     user_role: str,
     ai_role: str,
-    history: List[Dict[str, str]]
-) -> str:
+    history: List[Dict[str, str]],
+    summary: Optional[str] = None
+) -> Optional[str]:
     """
     基于场景进行对话
-    """
-    dashscope.api_key = settings.DASHSCOPE_API_KEY
 
+    失败时返回 None（由调用方给出兜底回复，兜底回复不应记入会话）
+    """
     # 构建系统提示
     system_prompt = CHAT_SYSTEM_PROMPT.format(
         scene_tag=scene_tag,
@@ -53,40 +80,22 @@ async def chat_with_scene(
         ai_role=ai_role
     )
 
-    # 构建消息历史
-    messages = [
-        {"role": "system", "content": system_prompt}
-    ]
-
-    # 添加历史消息
-    for msg in history:
-        role = "user" if msg.get("is_user") else "assistant"
-        messages.append({
-            "role": role,
-            "content": msg.get("content", "")
-        })
-
-    # 添加当前消息
-    messages.append({
-        "role": "user",
-        "content": message
-    })
+    messages = _build_messages(system_prompt, history, message, summary)
 
     try:
-        response = Generation.call(
+        response = await get_dashscope_client().generation(
             model="qwen-turbo",
             messages=messages
         )
+        return response_text(response)
 
-        if response.status_code != 200:
-            print(f"Chat API error: {response.message}")
-            return "Sorry, I couldn't process your message. (抱歉，我无法处理您的消息。)"
-
-        return response.output.text
+    except DashScopeError as e:
+        print(f"Chat API error: {e.message}")
+        return None
 
     except Exception as e:
         print(f"Chat failed: {e}")
-        return "Sorry, something went wrong. (抱歉，出了点问题。)"
+        return None
 
 
 async def chat_with_scene_stream(
@@ -97,19 +106,23 @@ async def chat_with_scene_stream(
     roles: List[str],
     user_role: str,
     ai_role: str,
-    history: List[Dict[str, str]]
+    history: List[Dict[str, str]],
+    summary: Optional[str] = None,
+    with_translation: bool = False
 ) -> AsyncGenerator[Tuple[str, str], None]:
     """
-    基于场景进行对话（服务端一次性生成，非真正流式）
+    基于场景进行对话（流式，逐 token 返回）
+
+    with_translation=True 时同一次生成带出中文翻译（合并模式）
 
     Yields:
         Tuple[str, str]: (event_type, content)
+        - ("delta", "新增文本") - 每收到一段模型输出推送一次，只含英文回复
         - ("final", "完整回复")
+        - ("translation", "中文翻译") - 仅合并模式，且模型按格式输出时
         - ("done", "")
         - ("error", "错误信息")
     """
-    dashscope.api_key = settings.DASHSCOPE_API_KEY
-
     system_prompt = CHAT_SYSTEM_PROMPT.format(
         scene_tag=scene_tag,
         scene_tag_cn=scene_tag_cn,
@@ -119,39 +132,12 @@ async def chat_with_scene_stream(
         ai_role=ai_role
     )
 
-    messages = [{"role": "system", "content": system_prompt}]
-
-    for msg in history:
-        role = "user" if msg.get("is_user") else "assistant"
-        messages.append({
-            "role": role,
-            "content": msg.get("content", "")
-        })
-
-    messages.append({
-        "role": "user",
-        "content": message
-    })
-
-    try:
-        response = Generation.call(
-            model="qwen-turbo",
-            messages=messages
-        )
-
-        if response.status_code != 200:
-            yield ("error", f"API error: {response.message}")
-            return
-
-        full_text = getattr(response.output, "text", "") or ""
-        if full_text:
-            yield ("final", full_text)
-
-        yield ("done", "")
-
-    except Exception as e:
-        print(f"Stream chat failed: {e}")
-        yield ("error", str(e))
+    async for event in _stream_reply(
+        _build_messages(system_prompt, history, message, summary, with_translation),
+        "Stream chat",
+        with_translation
+    ):
+        yield event
 
 
 # 自由对话系统提示
@@ -180,20 +166,41 @@ FREE_CHAT_SYSTEM_PROMPT = """You are a friendly and patient English learning ass
 
 async def free_chat_stream(
     message: str,
-    history: List[Dict[str, str]]
+    history: List[Dict[str, str]],
+    summary: Optional[str] = None,
+    with_translation: bool = False
 ) -> AsyncGenerator[Tuple[str, str], None]:
     """
-    自由对话（无场景限制）- 流式
+    自由对话（无场景限制）- 流式，逐 token 返回
 
     Yields:
         Tuple[str, str]: (event_type, content)
+        - ("delta", "新增文本")
         - ("final", "完整回复")
+        - ("translation", "中文翻译") - 仅合并模式
         - ("done", "")
         - ("error", "错误信息")
     """
-    dashscope.api_key = settings.DASHSCOPE_API_KEY
+    async for event in _stream_reply(
+        _build_messages(FREE_CHAT_SYSTEM_PROMPT, history, message, summary, with_translation),
+        "Free chat stream",
+        with_translation
+    ):
+        yield event
+
 
-    messages = [{"role": "system", "content": FREE_CHAT_SYSTEM_PROMPT}]
+def _build_messages(
+    system_prompt: str,
+    history: List[Dict[str, str]],
+    message: str,
+    summary: Optional[str] = None,
+    with_translation: bool = False
+) -> List[Dict[str, str]]:
+    if with_translation:
+        system_prompt += COMBINED_TRANSLATION_SECTION
+    if summary:
+        system_prompt += SUMMARY_SECTION.format(summary=summary)
+    messages = [{"role": "system", "content": system_prompt}]
 
     for msg in history:
         role = "user" if msg.get("is_user") else "assistant"
@@ -206,23 +213,133 @@ async def free_chat_stream(
         "role": "user",
         "content": message
     })
+    return messages
+
+
+class _TranslationSplitter:
+    """
+    合并模式输出的增量拆分：TRANSLATION_MARKER 之前是英文回复，之后是中文翻译
 
+    分隔符可能被拆在两段输出里，疑似分隔符开头的结尾部分先暂存，确认后再推送
+    """
+
+    def __init__(self) -> None:
+        self._pending = ""
+        self.reply_parts: List[str] = []
+        self.translation_parts: List[str] = []
+        self.in_translation = False
+
+    def feed(self, text: str) -> str:
+        """输入一段模型输出，返回可以推送的英文部分"""
+        if self.in_translation:
+            self.translation_parts.append(text)
+            return ""
+
+        buffer = self._pending + text
+        index = buffer.find(TRANSLATION_MARKER)
+        if index >= 0:
+            self.in_translation = True
+            self._pending = ""
+            self.translation_parts.append(buffer[index + len(TRANSLATION_MARKER):])
+            out = buffer[:index]
+        else:
+            keep = 0
+            for size in range(min(len(TRANSLATION_MARKER) - 1, len(buffer)), 0, -1):
+                if buffer.endswith(TRANSLATION_MARKER[:size]):
+                    keep = size
+                    break
+            out = buffer[:len(buffer) - keep]
+            self._pending = buffer[len(buffer) - keep:]
+
+        self.reply_parts.append(out)
+        return out
+
+    def flush(self) -> str:
+        """输出结束：暂存的部分不是分隔符，归还给英文回复"""
+        out, self._pending = self._pending, ""
+        self.reply_parts.append(out)
+        return out
+
+    def reply(self) -> str:
+        return "".join(self.reply_parts).strip()
+
+    def translation(self) -> str:
+        return "".join(self.translation_parts).strip()
+
+
+async def _stream_reply(
+    messages: List[Dict[str, str]],
+    label: str,
+    with_translation: bool = False
+) -> AsyncGenerator[Tuple[str, str], None]:
+    """
+    调用 qwen-turbo 增量输出：先逐段推送 delta，结束后推送完整文本（兼容只处理 final 的调用方）
+
+    with_translation=True 时 delta / final 只含英文回复，翻译单独以 ("translation", ...) 推送
+    """
+    splitter = _TranslationSplitter() if with_translation else None
+    parts: List[str] = []
     try:
-        response = Generation.call(
+        async for chunk in get_dashscope_client().stream_generation(
             model="qwen-turbo",
             messages=messages
-        )
-
-        if response.status_code != 200:
-            yield ("error", f"API error: {response.message}")
-            return
+        ):
+            delta = response_text(chunk)
+            if delta and splitter is not None:
+                delta = splitter.feed(delta)
+            if delta:
+                parts.append(delta)
+                yield ("delta", delta)
+
+        if splitter is not None:
+            rest = splitter.flush()
+            if rest:
+                yield ("delta", rest)
+            full_text = splitter.reply()
+        else:
+            full_text = "".join(parts)
 
-        full_text = getattr(response.output, "text", "") or ""
         if full_text:
             yield ("final", full_text)
+        if splitter is not None and splitter.translation():
+            yield ("translation", splitter.translation())
 
         yield ("done", "")
 
+    except DashScopeError as e:
+        yield ("error", f"API error: {e.message}")
+
     except Exception as e:
-        print(f"Free chat stream failed: {e}")
+        print(f"{label} failed: {e}")
         yield ("error", str(e))
+
+
+async def summarize_conversation(
+    previous_summary: Optional[str],
+    turns: List[Dict[str, str]],
+    max_words: int
+) -> Optional[str]:
+    """
+    把较早的对话轮次合并进滚动摘要（后台调用，不在对话请求路径上）
+    """
+    lines = [
+        f"{'User' if msg.get('is_user') else 'AI'}: {msg.get('content', '')}"
+        for msg in turns
+    ]
+    prompt = SUMMARIZE_PROMPT.format(
+        previous=previous_summary or "",
+        turns="\n".join(lines),
+        max_words=max_words
+    )
+
+    try:
+        response = await get_dashscope_client().generation(
+            model="qwen-turbo",
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0,
+        )
+        return response_text(response).strip() or None
+
+    except Exception as e:
+        print(f"Summarize conversation failed: {e}")
+        return None
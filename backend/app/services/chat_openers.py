@@ -0,0 +1,241 @@
+"""
+对话开场白缓存
+
+练习对话的第一轮（客户端固定发送 OPENER_PROMPT、history 为空）对同一场景 + 角色组合
+几乎一样，每个用户却都要重新调用 qwen-turbo、翻译和 TTS。
+开场白按规范化后的场景信息 + 角色对缓存（文本、翻译、音频一起），
+并在保存场景（create_scene）时后台预热，进入对话即可立即返回。
+请求的音频格式与缓存的不同时，按格式另外合成并缓存该格式的音频；
+生成时翻译或语音失败的开场白仍缓存文本，之后命中时重试缺失的部分
+"""
+import asyncio
+import hashlib
+import json
+from typing import Any, Dict, List, Optional
+
+from app.core.cache import LRUCache, SQLiteCache, TieredCache
+from app.core.config import settings
+from app.core.singleflight import SingleFlight
+from app.services.aliyun_tts import TtsOutputFormat, output_format, text_to_speech
+from app.services.audio_store import DELIVERY_DATA_URL
+from app.services.chat import CHAT_SYSTEM_PROMPT, chat_with_scene_stream
+from app.services.translation import translate_to_zh
+
+
+# 与 iOS 客户端 ChatView.sendInitialMessage 发送的内容一致
+OPENER_PROMPT = "Start the conversation with one friendly, natural opening line that fits our scene."
+
+OPENER_VOICE = "en-US-female"
+
+# Prompt 变化时自动使缓存失效
+_PROMPT_VERSION = hashlib.sha256(
+    (CHAT_SYSTEM_PROMPT + OPENER_PROMPT).encode("utf-8")
+).hexdigest()[:12]
+
+_cache: Optional[TieredCache] = None
+_flights = SingleFlight()
+
+
+def _get_cache() -> TieredCache:
+    global _cache
+    if _cache is None:
+        disk = None
+        if settings.OPENER_CACHE_SQLITE_PATH:
+            disk = SQLiteCache(
+                settings.OPENER_CACHE_SQLITE_PATH,
+                max_bytes=settings.OPENER_CACHE_SQLITE_MAX_BYTES,
+                ttl_sec=settings.OPENER_CACHE_TTL_SEC,
+            )
+        memory = LRUCache(
+            max_items=settings.OPENER_CACHE_MAX_ITEMS,
+            max_bytes=settings.OPENER_CACHE_MAX_BYTES,
+            ttl_sec=settings.OPENER_CACHE_TTL_SEC,
+        )
+        _cache = TieredCache(memory, disk)
+    return _cache
+
+
+def _normalize(value: Any) -> str:
+    return " ".join(str(value or "").split()).lower()
+
+
+def is_opener_request(message: str, history: List[Dict[str, Any]]) -> bool:
+    return not history and message.strip() == OPENER_PROMPT
+
+
+def opener_key(context: Dict[str, Any]) -> str:
+    """场景信息 + 角色列表 + 角色对规范化后的缓存键（角色列表也写进了生成开场白的 prompt）"""
+    parts: List[Any] = [
+        _normalize(context.get(field))
+        for field in ("scene_tag", "scene_tag_cn", "category", "user_role", "ai_role")
+    ]
+    parts.append([_normalize(role) for role in context.get("roles") or []])
+    digest = hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+    return f"opener:{_PROMPT_VERSION}:{digest}"
+
+
+def _audio_key(key: str, audio_format: TtsOutputFormat) -> str:
+    return f"{key}:audio:{audio_format.key}"
+
+
+async def _generate_opener(
+    context: Dict[str, Any],
+    audio_format: TtsOutputFormat
+) -> Optional[Dict[str, Any]]:
+    reply = None
+    combined_translation = None
+    async for event_type, content in chat_with_scene_stream(
+        message=OPENER_PROMPT,
+        history=[],
+        with_translation=settings.CHAT_COMBINED_TRANSLATION,
+        **context
+    ):
+        if event_type == "final":
+            reply = content
+        elif event_type == "translation":
+            combined_translation = content
+        elif event_type == "error":
+            print(f"[Opener] Generation failed: {content}")
+            return None
+    if not reply:
+        return None
+
+    opener = {
+        "reply": reply,
+        "translation": combined_translation,
+        "audio_url": None,
+        "audio_format": audio_format.key,
+    }
+    return await _complete_opener(opener_key(context), opener, audio_format)
+
+
+async def _complete_opener(
+    key: str,
+    opener: Dict[str, Any],
+    audio_format: TtsOutputFormat
+) -> Dict[str, Any]:
+    """
+    生成缺失的翻译 / 音频并写入缓存；失败的部分保持为空，下次命中时再重试
+    已有的音频保留原格式，缺失时按本次请求的格式合成
+    """
+    has_audio = bool(opener.get("audio_url"))
+
+    async def translation() -> Optional[str]:
+        return opener.get("translation") or await translate_to_zh(opener["reply"], None)
+
+    async def audio() -> Optional[str]:
+        if has_audio:
+            return opener["audio_url"]
+        # 音频以 data URL 缓存（比音频库文件保留得久），返回时再按请求的交付方式转换
+        return await text_to_speech(opener["reply"], OPENER_VOICE, DELIVERY_DATA_URL, audio_format)
+
+    # 翻译和语音互不依赖，并行生成；缺失的部分不影响缓存文本
+    translated, audio_url = await asyncio.gather(translation(), audio(), return_exceptions=True)
+    opener = {
+        **opener,
+        "translation": translated if isinstance(translated, str) else None,
+        "audio_url": audio_url if isinstance(audio_url, str) else None,
+        "audio_format": opener.get("audio_format") if has_audio else audio_format.key,
+    }
+    await _get_cache().set(key, opener)
+    return opener
+
+
+async def _opener_audio(key: str, reply: str, audio_format: TtsOutputFormat) -> Optional[str]:
+    """开场白在指定格式下的音频（data URL），按格式缓存"""
+    audio_key = _audio_key(key, audio_format)
+    cached = await _get_cache().get(audio_key)
+    if cached is not None:
+        return cached.get("audio_url")
+
+    async def synthesize() -> Optional[str]:
+        audio_url = await text_to_speech(reply, OPENER_VOICE, DELIVERY_DATA_URL, audio_format)
+        if audio_url:
+            await _get_cache().set(audio_key, {"audio_url": audio_url})
+        return audio_url
+
+    return await _flights.do(audio_key, synthesize)
+
+
+async def get_opener(
+    context: Dict[str, Any],
+    audio_format: Optional[TtsOutputFormat] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    取开场白：{"reply", "translation", "audio_url", "audio_format"}，未命中时生成并缓存
+    同一组合并发请求（包括预热）共享同一次生成；audio_url 为 audio_format 格式的 data URL，
+    默认见 TTS_OUTPUT_FORMAT / TTS_OUTPUT_SAMPLE_RATE
+    """
+    audio_format = audio_format or output_format()
+    key = opener_key(context)
+    opener = await _get_cache().get(key)
+    if opener is None:
+        opener = await _flights.do(key, lambda: _generate_opener(context, audio_format))
+    elif not opener.get("translation") or not opener.get("audio_url"):
+        # 生成时翻译或语音失败（如预热时的临时错误），命中时重试缺失的部分
+        cached = opener
+        opener = await _flights.do(key, lambda: _complete_opener(key, cached, audio_format))
+    if not opener or opener.get("audio_format") == audio_format.key:
+        return opener
+
+    try:
+        audio_url = await _opener_audio(key, opener["reply"], audio_format)
+    except Exception as e:
+        print(f"[Opener] TTS failed: {e}")
+        audio_url = None
+    return {**opener, "audio_url": audio_url, "audio_format": audio_format.key}
+
+
+def scene_contexts(
+    scene_tag: str,
+    scene_tag_cn: str,
+    category: str,
+    expressions: Dict[str, Any]
+) -> List[Dict[str, Any]]:
+    """
+    按客户端的格式（"RoleEn (RoleCn)"）列出场景的角色对组合，
+    最多 OPENER_PREWARM_MAX_PAIRS 组
+    """
+    roles = [
+        f"{role.get('role_en', '')} ({role.get('role_cn', '')})"
+        for role in (expressions or {}).get("roles", [])
+    ]
+    pairs = []
+    for distance in range(1, len(roles)):
+        for i in range(len(roles) - distance):
+            pairs.append((roles[i], roles[i + distance]))
+            pairs.append((roles[i + distance], roles[i]))
+
+    return [
+        {
+            "scene_tag": scene_tag,
+            "scene_tag_cn": scene_tag_cn,
+            "category": category,
+            "roles": roles,
+            "user_role": user_role,
+            "ai_role": ai_role,
+        }
+        for user_role, ai_role in pairs[:settings.OPENER_PREWARM_MAX_PAIRS]
+    ]
+
+
+async def prewarm_openers(contexts: List[Dict[str, Any]]) -> None:
+    """后台预热开场白（有界并发），失败只记录日志"""
+    semaphore = asyncio.Semaphore(settings.OPENER_PREWARM_CONCURRENCY)
+
+    async def warm(context: Dict[str, Any]) -> None:
+        async with semaphore:
+            try:
+                await get_opener(context)
+            except Exception as e:
+                print(f"[Opener] Prewarm failed: {e}")
+
+    await asyncio.gather(*(warm(context) for context in contexts))
+    print(f"[Opener] Prewarmed {len(contexts)} openers")
+
+
+def close_opener_cache() -> None:
+    global _cache
+    if _cache is not None:
+        _cache.close()
+        _cache = None
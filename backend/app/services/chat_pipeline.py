@@ -0,0 +1,329 @@
+"""
+对话回复的 SSE 事件流水线（/chat/stream 与 /chat/free/stream 共用）
+
+模型逐 token 输出时按句切分，每凑够一句立即提交 TTS，多句并发合成，
+音频按句子顺序推送：第一句开始播放时，后面的句子还在生成 / 合成中
+
+完整回复生成后，翻译等后处理（Enrichment）与 TTS 并发执行，各自带超时，
+哪个先完成先推送，慢的任务不会拖住其他事件
+"""
+import asyncio
+import re
+from collections import deque
+from dataclasses import dataclass
+from typing import (
+    Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple,
+    Union
+)
+
+from app.core.config import settings
+from app.services.aliyun_tts import TtsOutputFormat, text_to_speech, text_to_speech_bytes
+from app.services.audio_store import DELIVERY_BYTES
+from app.services.translation import translate_to_zh
+
+
+# 句末标点（可带右引号 / 右括号），后面须跟空白，避免切开 3.5 之类的数字
+_SENTENCE_END = re.compile(r"[.!?…]+[\"')\]]*\s+")
+
+# 常见缩写，句点后不切分（只比较句末最后一个词，"best." 不算 "st."）
+_ABBREVIATIONS = frozenset(
+    ("mr.", "mrs.", "ms.", "dr.", "st.", "vs.", "etc.", "e.g.", "i.e.", "a.m.", "p.m.")
+)
+
+
+def _ends_with_abbreviation(candidate: str) -> bool:
+    words = candidate.split()
+    if not words:
+        return False
+    return words[-1].strip("\"'()[]").lower() in _ABBREVIATIONS
+
+
+class SentenceSplitter:
+    """
+    增量分句：feed() 返回已完整的句子，flush() 返回剩余文本
+
+    过短的句子（如 "Oh!"）与下一句合并，减少 TTS 调用次数
+    """
+
+    def __init__(self, min_chars: int = 0) -> None:
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self._buffer):
+            end = match.end()
+            candidate = self._buffer[start:end].strip()
+            if len(candidate) < self.min_chars:
+                continue
+            if _ends_with_abbreviation(candidate):
+                continue
+            sentences.append(candidate)
+            start = end
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> Optional[str]:
+        rest = self._buffer.strip()
+        self._buffer = ""
+        return rest or None
+
+
+def _extract_english(text: str) -> str:
+    """
+    从混合文本中提取英文部分
+    例如: "Hello! (你好！)" -> "Hello!"
+    """
+    # 移除括号及其内容（中文翻译）
+    result = re.sub(r'\([^)]*[\u4e00-\u9fff][^)]*\)', '', text)
+    result = re.sub(r'（[^）]*[\u4e00-\u9fff][^）]*）', '', result)
+    return result.strip()
+
+
+class _OrderedAudio:
+    """
+    按句子顺序产出结果的并发 TTS 任务队列
+
+    delivery 为 "bytes" 时合成原始音频字节（WebSocket 以二进制帧发送），
+    否则按 text_to_speech 的交付方式返回 data URL 或音频库地址
+    """
+
+    def __init__(
+        self,
+        voice: str,
+        delivery: Optional[str] = None,
+        audio_format: Optional[TtsOutputFormat] = None
+    ) -> None:
+        self.voice = voice
+        self.delivery = delivery
+        self.audio_format = audio_format
+        self.binary = delivery == DELIVERY_BYTES
+        self._semaphore = asyncio.Semaphore(settings.CHAT_TTS_CONCURRENCY)
+        self._pending: Deque[Tuple[int, str, asyncio.Task]] = deque()
+        self._count = 0
+
+    async def _tts(self, text: str) -> Union[str, bytes, None]:
+        if self.binary:
+            return await text_to_speech_bytes(text, self.voice, self.audio_format)
+        return await text_to_speech(text, self.voice, self.delivery, self.audio_format)
+
+    async def _synthesize(self, text: str) -> Union[str, bytes, None]:
+        async with self._semaphore:
+            try:
+                return await asyncio.wait_for(self._tts(text), settings.CHAT_TTS_TIMEOUT_SEC)
+            except asyncio.TimeoutError:
+                # 超时的句子跳过，不阻塞后面已合成好的句子
+                print(f"[TTS] Timeout for '{text[:30]}...'")
+                return None
+            except Exception as e:
+                print(f"[TTS] Error: {e}")
+                return None
+
+    def add(self, sentence: Optional[str]) -> None:
+        english_text = _extract_english(sentence or "")
+        if len(english_text) <= 3:
+            return
+        task = asyncio.create_task(self._synthesize(english_text))
+        self._pending.append((self._count, english_text, task))
+        self._count += 1
+
+    def head(self) -> Optional[asyncio.Task]:
+        return self._pending[0][2] if self._pending else None
+
+    def ready(self) -> List[Dict[str, Any]]:
+        """取出队首已完成的音频事件（保持顺序）"""
+        events = []
+        while self._pending and self._pending[0][2].done():
+            index, text, task = self._pending.popleft()
+            event = self._event(index, text, task)
+            if event:
+                events.append(event)
+        return events
+
+    def _event(self, index: int, text: str, task: asyncio.Task) -> Optional[Dict[str, Any]]:
+        if task.cancelled() or task.exception() is not None:
+            return None
+        audio = task.result()
+        if not audio:
+            return None
+        if self.binary:
+            codec = self.audio_format.codec if self.audio_format else None
+            return {"type": "audio", "data": audio, "format": codec, "text": text, "index": index}
+        return {"type": "audio", "url": audio, "text": text, "index": index}
+
+    def cancel(self) -> None:
+        for _, _, task in self._pending:
+            task.cancel()
+        self._pending.clear()
+
+
+@dataclass
+class Enrichment:
+    """
+    完整回复生成后的后处理任务
+
+    run: 输入完整回复，返回结果
+    to_event: 把结果转换成 SSE 事件，返回 None 表示不推送
+    timeout: 超时秒数，超时只丢弃该任务的结果
+    """
+    name: str
+    run: Callable[[str], Awaitable[Any]]
+    to_event: Callable[[Any], Optional[Dict[str, Any]]]
+    timeout: float
+
+
+def default_enrichments(session_id: Optional[str]) -> List[Enrichment]:
+    return [
+        Enrichment(
+            name="translation",
+            run=lambda text: translate_to_zh(text, session_id),
+            to_event=lambda translation: (
+                {"type": "translation", "content": translation} if translation else None
+            ),
+            timeout=settings.CHAT_TRANSLATION_TIMEOUT_SEC,
+        ),
+    ]
+
+
+class _FanOut:
+    """并发执行的后处理任务，完成即产出事件"""
+
+    def __init__(self) -> None:
+        self.tasks: Set[asyncio.Task] = set()
+
+    async def _run(self, enrichment: Enrichment, text: str) -> Optional[Dict[str, Any]]:
+        try:
+            result = await asyncio.wait_for(enrichment.run(text), enrichment.timeout)
+            return enrichment.to_event(result)
+        except asyncio.TimeoutError:
+            print(f"[Chat] {enrichment.name} timed out after {enrichment.timeout}s")
+        except Exception as e:
+            print(f"[Chat] {enrichment.name} failed: {e}")
+        return None
+
+    def start(self, enrichments: List[Enrichment], text: str) -> None:
+        for enrichment in enrichments:
+            self.tasks.add(asyncio.create_task(self._run(enrichment, text)))
+
+    def ready(self) -> List[Dict[str, Any]]:
+        events = []
+        for task in [task for task in self.tasks if task.done()]:
+            self.tasks.discard(task)
+            if not task.cancelled() and task.result():
+                events.append(task.result())
+        return events
+
+    def cancel(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        self.tasks.clear()
+
+
+async def reply_events(
+    reply_stream: AsyncIterator[Tuple[str, str]],
+    session_id: Optional[str],
+    voice: str = "en-US-female",
+    enrichments: Optional[List[Enrichment]] = None,
+    audio_delivery: Optional[str] = None,
+    translation_in_reply: bool = False,
+    audio_format: Optional[TtsOutputFormat] = None
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    把 chat 服务的 (event_type, content) 流转换成 SSE 事件 dict
+
+    enrichments 默认为翻译；音频与后处理事件之间不保证先后顺序
+    audio_delivery 为 "bytes" 时音频事件带原始音频字节 "data"，代替 "url"
+    audio_format: 语音输出格式，默认见 TTS_OUTPUT_FORMAT
+    translation_in_reply=True（合并模式）时翻译来自回复流本身的 ("translation", ...)，
+    不再运行名为 translation 的后处理；模型没按格式输出翻译时再回退到单独翻译
+
+    事件:
+    - {"type": "text_delta", "content": "新增文本"}
+    - {"type": "audio", "url": "...", "text": "句子", "index": 0} - 按句子顺序推送
+    - {"type": "text_full", "content": "完整文本"}
+    - {"type": "translation", "content": "中文翻译"}
+    - {"type": "done"} - 所有音频和后处理事件推送完之后
+    - {"type": "error", "content": "错误信息"}
+    """
+    splitter = SentenceSplitter(min_chars=settings.CHAT_TTS_MIN_SENTENCE_CHARS)
+    audio = _OrderedAudio(voice, audio_delivery, audio_format)
+    fan_out = _FanOut()
+    if enrichments is None:
+        enrichments = default_enrichments(session_id)
+    deferred: List[Enrichment] = []
+    if translation_in_reply:
+        deferred = [e for e in enrichments if e.name == "translation"]
+        enrichments = [e for e in enrichments if e.name != "translation"]
+    full_text: Optional[str] = None
+    events = reply_stream.__aiter__()
+    next_event: Optional[asyncio.Future] = asyncio.ensure_future(events.__anext__())
+    finished = False
+
+    try:
+        # 等待下一段模型输出、队首音频或任一后处理任务，谁先到先推送谁
+        while next_event is not None or audio.head() is not None or fan_out.tasks:
+            waiters = set(fan_out.tasks)
+            if next_event is not None:
+                waiters.add(next_event)
+            head = audio.head()
+            if head is not None:
+                waiters.add(head)
+            await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+
+            for event in audio.ready():
+                yield event
+            for event in fan_out.ready():
+                yield event
+
+            if next_event is None or not next_event.done():
+                continue
+
+            try:
+                event_type, content = next_event.result()
+            except StopAsyncIteration:
+                next_event = None
+                continue
+            next_event = asyncio.ensure_future(events.__anext__())
+
+            if event_type == "delta":
+                # 模型输出到即推送
+                yield {"type": "text_delta", "content": content}
+                for sentence in splitter.feed(content):
+                    audio.add(sentence)
+
+            elif event_type == "final":
+                # 发送完整文本（覆盖已推送的 text_delta）
+                yield {"type": "text_full", "content": content}
+                audio.add(splitter.flush())
+                fan_out.start(enrichments, content)
+                full_text = content
+
+            elif event_type == "translation":
+                # 合并模式：翻译随回复一起生成
+                yield {"type": "translation", "content": content}
+                deferred = []
+
+            elif event_type == "done":
+                finished = True
+                if deferred and full_text:
+                    print("[Chat] Combined reply had no translation, falling back")
+                    fan_out.start(deferred, full_text)
+                    deferred = []
+
+            elif event_type == "error":
+                yield {"type": "error", "content": content}
+
+        if finished:
+            yield {"type": "done"}
+
+    finally:
+        audio.cancel()
+        fan_out.cancel()
+        if next_event is not None:
+            next_event.cancel()
+            await asyncio.gather(next_event, return_exceptions=True)
+        aclose = getattr(events, "aclose", None)
+        if aclose is not None:
+            await aclose()
@@ -0,0 +1,209 @@
+"""
+对话会话存储（按 session_id）
+
+以前客户端每轮都上传完整 history，请求体随对话长度线性增长。
+会话保存在服务端（内存 LRU + 可选 SQLite 持久层）：
+- context: 场景信息（自由对话为 None）
+- history: [{"content": "...", "is_user": bool}]
+客户端之后每轮只需发送 session_id + 新消息；
+已有会话时以服务端为准，请求中的 history 只用于建立新会话（或会话过期后重建）
+
+长对话压缩：最近的消息原样保留，较早的消息在两轮对话之间由后台任务
+折叠进滚动摘要（summary），发送给模型的 prompt 大小不随轮数增长
+- history: 尚未折叠的消息
+- summary / folded: 摘要，以及已折叠进摘要的消息条数
+"""
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.cache import LRUCache, SQLiteCache, TieredCache
+from app.core.config import settings
+from app.services.chat import summarize_conversation
+
+
+_store: Optional[TieredCache] = None
+# session_id -> 进行中的摘要任务，每个会话同时只有一个
+_compactions: Dict[str, asyncio.Task] = {}
+
+
+def _get_store() -> TieredCache:
+    global _store
+    if _store is None:
+        disk = None
+        if settings.CHAT_SESSION_SQLITE_PATH:
+            disk = SQLiteCache(
+                settings.CHAT_SESSION_SQLITE_PATH,
+                max_bytes=settings.CHAT_SESSION_SQLITE_MAX_BYTES,
+                ttl_sec=settings.CHAT_SESSION_TTL_SEC,
+            )
+        memory = LRUCache(
+            max_items=settings.CHAT_SESSION_MAX_ITEMS,
+            max_bytes=settings.CHAT_SESSION_MAX_BYTES,
+            ttl_sec=settings.CHAT_SESSION_TTL_SEC,
+        )
+        _store = TieredCache(memory, disk)
+    return _store
+
+
+def _session_key(session_id: str) -> str:
+    return f"chat:{session_id}"
+
+
+async def load_session(
+    session_id: Optional[str],
+    context: Optional[Dict[str, Any]] = None,
+    history: Optional[List[Dict[str, Any]]] = None,
+    message: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    取出会话并与请求合并
+
+    - 请求带了场景信息时覆盖已存的 context
+    - 服务端已有会话时忽略请求中的 history：服务端历史含客户端看不到的轮次
+      （如开场白的隐藏提示），较早的消息也已折叠进摘要，两者无法按下标对齐
+    - 没有会话时用请求中的 history 建立；客户端的 history 通常已包含本轮消息
+      （message），去掉以免 record_turn 再追加一次
+
+    Returns:
+        {"context": dict | None, "history": [...], "summary": str | None, "folded": int}
+    """
+    session: Dict[str, Any] = {"context": None, "history": [], "summary": None, "folded": 0}
+    stored = None
+    if session_id:
+        stored = await _get_store().get(_session_key(session_id))
+        if stored:
+            session.update(stored)
+            # 内存层保存的是同一个对象，复制后再修改
+            session["history"] = list(stored.get("history") or [])
+
+    if context is not None:
+        session["context"] = context
+    if history and not stored:
+        seed = list(history)
+        last = seed[-1]
+        if message is not None and last.get("is_user") and last.get("content") == message:
+            seed.pop()
+        session["history"] = seed
+    return session
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中文约 1 字 1 token，英文约 4 字符 1 token"""
+    cjk = sum(1 for c in text if "\u4e00" <= c <= "\u9fff")
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+def prompt_history(session: Dict[str, Any]) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    """
+    本轮发送给模型的上下文：(摘要, 预算内的最近消息)
+
+    摘要还没追上时，超出 CHAT_HISTORY_TOKEN_BUDGET 的最旧消息直接不发送，
+    保证 prompt 大小有上限
+    """
+    budget = settings.CHAT_HISTORY_TOKEN_BUDGET
+    kept: List[Dict[str, Any]] = []
+    used = 0
+    for msg in reversed(session["history"]):
+        cost = estimate_tokens(msg.get("content", ""))
+        if kept and used + cost > budget:
+            break
+        kept.append(msg)
+        used += cost
+    kept.reverse()
+    return session.get("summary"), kept
+
+
+async def record_turn(
+    session_id: Optional[str],
+    session: Dict[str, Any],
+    message: str,
+    reply: str
+) -> None:
+    """
+    把一轮对话追加到会话并保存；没有 session_id 时不保存
+
+    本轮生成期间后台摘要可能已经保存了新的 summary / folded，保存前重新读取，
+    只追加本轮的两条消息，不用请求开始时的快照覆盖摘要结果
+    """
+    if not session_id:
+        return
+
+    key = _session_key(session_id)
+    stored = await _get_store().get(key)
+    if stored:
+        latest = {**stored, "history": list(stored.get("history") or [])}
+        if session.get("context") is not None:
+            latest["context"] = session["context"]
+    else:
+        latest = {**session, "history": list(session["history"])}
+
+    history = latest["history"]
+    history.append({"content": message, "is_user": True})
+    history.append({"content": reply, "is_user": False})
+    # 摘要一直失败时的兜底：只保留最近的消息，避免单个会话无限增长
+    overflow = len(history) - settings.CHAT_SESSION_MAX_MESSAGES
+    if overflow > 0:
+        del history[:overflow]
+        latest["folded"] = latest.get("folded", 0) + overflow
+
+    await _get_store().set(key, latest)
+    _schedule_compaction(session_id, latest)
+
+
+def _needs_compaction(session: Dict[str, Any]) -> bool:
+    history = session["history"]
+    keep = settings.CHAT_HISTORY_KEEP_RECENT
+    if len(history) <= keep:
+        return False
+    if len(history) >= keep + settings.CHAT_HISTORY_COMPACT_BATCH:
+        return True
+    tokens = sum(estimate_tokens(msg.get("content", "")) for msg in history)
+    return tokens > settings.CHAT_HISTORY_TOKEN_BUDGET
+
+
+def _schedule_compaction(session_id: str, session: Dict[str, Any]) -> None:
+    if session_id in _compactions or not _needs_compaction(session):
+        return
+    task = asyncio.create_task(_compact(session_id))
+    _compactions[session_id] = task
+    task.add_done_callback(lambda _: _compactions.pop(session_id, None))
+
+
+async def _compact(session_id: str) -> None:
+    """把最近 CHAT_HISTORY_KEEP_RECENT 条之前的消息折叠进摘要"""
+    try:
+        snapshot = await load_session(session_id)
+        count = len(snapshot["history"]) - settings.CHAT_HISTORY_KEEP_RECENT
+        if count <= 0:
+            return
+        turns = snapshot["history"][:count]
+
+        summary = await summarize_conversation(
+            snapshot["summary"], turns, settings.CHAT_SUMMARY_MAX_WORDS
+        )
+        if not summary:
+            return
+
+        # 摘要期间可能又追加了新的轮次，重新读取后只移除已折叠的消息
+        latest = await load_session(session_id)
+        if latest["folded"] != snapshot["folded"] or latest["history"][:count] != turns:
+            return
+
+        latest["history"] = latest["history"][count:]
+        latest["summary"] = summary
+        latest["folded"] += count
+        await _get_store().set(_session_key(session_id), latest)
+        print(f"[Chat] Session {session_id[:8]} folded {count} messages into summary")
+
+    except Exception as e:
+        print(f"[Chat] Compaction failed for {session_id[:8]}: {e}")
+
+
+def close_chat_sessions() -> None:
+    global _store
+    for task in _compactions.values():
+        task.cancel()
+    _compactions.clear()
+    if _store is not None:
+        _store.close()
+        _store = None
@@ -0,0 +1,309 @@
+"""
+DashScope 异步 HTTP 客户端
+
+所有调用通义千问（文本 / 多模态）的服务共用一个 httpx.AsyncClient：
+- 连接池复用 keep-alive 连接，避免每次调用重新握手
+- 按模型限制并发，防止单个慢模型占满上游配额
+- 统一的连接 / 读取超时
+- 内联图片（InlineImage）在发送请求体时分块 base64 编码，不拼接完整 data URL
+"""
+import asyncio
+import base64
+import json
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+
+import httpx
+
+from app.core.config import settings
+
+
+TEXT_GENERATION_PATH = "/services/aigc/text-generation/generation"
+MULTIMODAL_GENERATION_PATH = "/services/aigc/multimodal-generation/generation"
+
+
+class DashScopeError(Exception):
+    """DashScope 返回非 200 状态"""
+
+    def __init__(self, status_code: int, code: str = "", message: str = "") -> None:
+        super().__init__(f"{status_code} {code}: {message}".strip())
+        self.status_code = status_code
+        self.code = code
+        self.message = message
+
+
+# base64 每 3 字节输入对应 4 字节输出，按 3 的倍数分块编码
+_BASE64_CHUNK = 3 * 64 * 1024
+
+
+class InlineImage:
+    """
+    消息中的内联图片，用法：{"image": InlineImage(data, "image/jpeg")}
+
+    data 可以是 bytes 或 mmap，发送时按块编码为 data URL，
+    峰值内存只有一个编码块，而不是原图 + base64 + data URL 三份
+    """
+
+    def __init__(self, data: Any, mime_type: str = "image/jpeg") -> None:
+        self.data = data
+        self.mime_type = mime_type
+
+    @property
+    def prefix(self) -> bytes:
+        return f"data:{self.mime_type};base64,".encode("ascii")
+
+    @property
+    def encoded_length(self) -> int:
+        return len(self.prefix) + (len(self.data) + 2) // 3 * 4
+
+    def iter_encoded(self):
+        yield self.prefix
+        view = memoryview(self.data)
+        try:
+            for start in range(0, len(view), _BASE64_CHUNK):
+                yield base64.b64encode(view[start:start + _BASE64_CHUNK])
+        finally:
+            view.release()
+
+
+def _replace_inline_images(
+    messages: List[Dict[str, Any]]
+) -> Tuple[List[Dict[str, Any]], Dict[str, InlineImage]]:
+    """把消息中的 InlineImage 换成占位符，返回新消息和 占位符 -> 图片"""
+    images: Dict[str, InlineImage] = {}
+    replaced = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            parts = []
+            for part in content:
+                image = part.get("image") if isinstance(part, dict) else None
+                if isinstance(image, InlineImage):
+                    token = f"inline-image-{uuid.uuid4().hex}"
+                    images[token] = image
+                    part = {**part, "image": token}
+                parts.append(part)
+            message = {**message, "content": parts}
+        replaced.append(message)
+    return replaced, images
+
+
+def _encode_body(body: Dict[str, Any]) -> Tuple[Union[bytes, AsyncIterator[bytes]], int]:
+    """
+    序列化请求体；包含内联图片时返回分块生成器和预先算好的长度
+
+    明确给出 Content-Length，避免 httpx 改用 chunked 传输
+    """
+    messages, images = _replace_inline_images(body["input"]["messages"])
+    text = json.dumps(
+        {**body, "input": {**body["input"], "messages": messages}}, ensure_ascii=False
+    )
+    if not images:
+        data = text.encode("utf-8")
+        return data, len(data)
+
+    segments: List[Union[bytes, InlineImage]] = []
+    rest = text
+    for token, image in images.items():
+        before, rest = rest.split(token, 1)
+        segments.append(before.encode("utf-8"))
+        segments.append(image)
+    segments.append(rest.encode("utf-8"))
+
+    length = sum(
+        segment.encoded_length if isinstance(segment, InlineImage) else len(segment)
+        for segment in segments
+    )
+
+    async def chunks() -> AsyncIterator[bytes]:
+        for segment in segments:
+            if isinstance(segment, InlineImage):
+                for chunk in segment.iter_encoded():
+                    yield chunk
+            else:
+                yield segment
+
+    return chunks(), length
+
+
+class DashScopeClient:
+    def __init__(self) -> None:
+        self._client = httpx.AsyncClient(
+            base_url=settings.DASHSCOPE_BASE_URL,
+            limits=httpx.Limits(
+                max_connections=settings.DASHSCOPE_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.DASHSCOPE_MAX_KEEPALIVE,
+            ),
+            timeout=httpx.Timeout(
+                settings.DASHSCOPE_READ_TIMEOUT,
+                connect=settings.DASHSCOPE_CONNECT_TIMEOUT,
+            ),
+        )
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _semaphore(self, model: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(model)
+        if semaphore is None:
+            limit = settings.DASHSCOPE_MODEL_CONCURRENCY.get(
+                model, settings.DASHSCOPE_DEFAULT_CONCURRENCY
+            )
+            semaphore = asyncio.Semaphore(limit)
+            self._semaphores[model] = semaphore
+        return semaphore
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {settings.DASHSCOPE_API_KEY}",
+            "Content-Type": "application/json",
+        }
+
+    async def _post(
+        self,
+        path: str,
+        model: str,
+        messages: List[Dict[str, Any]],
+        parameters: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        body = {
+            "model": model,
+            "input": {"messages": messages},
+            "parameters": parameters,
+        }
+        content, length = _encode_body(body)
+        headers = {**self._headers(), "Content-Length": str(length)}
+        async with self._semaphore(model):
+            response = await self._client.post(path, content=content, headers=headers)
+
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = {"message": response.text}
+
+        if response.status_code != 200:
+            raise DashScopeError(
+                response.status_code,
+                payload.get("code", ""),
+                payload.get("message", ""),
+            )
+        return payload
+
+    async def _stream(
+        self,
+        path: str,
+        model: str,
+        messages: List[Dict[str, Any]],
+        parameters: Dict[str, Any],
+    ) -> AsyncIterator[Dict[str, Any]]:
+        body = {
+            "model": model,
+            "input": {"messages": messages},
+            "parameters": {**parameters, "incremental_output": True},
+        }
+        content, length = _encode_body(body)
+        headers = {
+            **self._headers(),
+            "Content-Length": str(length),
+            "Accept": "text/event-stream",
+            "X-DashScope-SSE": "enable",
+        }
+        async with self._semaphore(model):
+            async with self._client.stream("POST", path, content=content, headers=headers) as response:
+                if response.status_code != 200:
+                    raw = await response.aread()
+                    try:
+                        payload = json.loads(raw)
+                    except ValueError:
+                        payload = {"message": raw.decode("utf-8", "replace")}
+                    raise DashScopeError(
+                        response.status_code,
+                        payload.get("code", ""),
+                        payload.get("message", ""),
+                    )
+
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    payload = json.loads(line[5:])
+                    if payload.get("code") and not payload.get("output"):
+                        raise DashScopeError(
+                            response.status_code,
+                            payload.get("code", ""),
+                            payload.get("message", ""),
+                        )
+                    yield payload
+
+    async def generation(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        **parameters: Any,
+    ) -> Dict[str, Any]:
+        """纯文本模型调用（qwen-turbo / qwen-plus）"""
+        return await self._post(TEXT_GENERATION_PATH, model, messages, parameters)
+
+    async def multimodal(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        **parameters: Any,
+    ) -> Dict[str, Any]:
+        """多模态模型调用（qwen-vl-max）"""
+        return await self._post(MULTIMODAL_GENERATION_PATH, model, messages, parameters)
+
+    def stream_generation(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        **parameters: Any,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """纯文本模型流式调用，每个事件只包含新增文本（incremental_output）"""
+        return self._stream(TEXT_GENERATION_PATH, model, messages, parameters)
+
+    def stream_multimodal(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        **parameters: Any,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """多模态模型流式调用，每个事件只包含新增文本（incremental_output）"""
+        return self._stream(MULTIMODAL_GENERATION_PATH, model, messages, parameters)
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+def response_text(payload: Dict[str, Any]) -> str:
+    """
+    从 DashScope 返回中取出文本
+
+    兼容 result_format=text（output.text）和 message（output.choices）两种格式
+    """
+    output = payload.get("output") or {}
+    if output.get("text") is not None:
+        return output["text"]
+
+    choices = output.get("choices") or []
+    if not choices:
+        return ""
+
+    content = (choices[0].get("message") or {}).get("content", "")
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+_client: Optional[DashScopeClient] = None
+
+
+def get_dashscope_client() -> DashScopeClient:
+    global _client
+    if _client is None:
+        _client = DashScopeClient()
+    return _client
+
+
+async def close_dashscope_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
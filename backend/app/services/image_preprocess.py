@@ -0,0 +1,132 @@
+"""
+图片预处理 - 上传给千问 VL 前统一压缩
+
+手机照片通常 3-12 MB，而模型只需要 1-2 MP：
+- 按 EXIF 方向旋转
+- 长边缩放到 IMAGE_MAX_EDGE
+- 重新编码为 JPEG / WebP
+解码和缩放是 CPU 密集操作，放到独立线程池执行，不阻塞事件循环
+
+输入可以是 bytes，也可以是上传文件的只读 mmap：Pillow 直接从映射读取，
+原图不会整张复制进 Python 内存
+"""
+import asyncio
+import io
+import mmap
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional, Union
+
+from PIL import Image, ImageOps
+
+from app.core.config import settings
+
+try:
+    # HEIC 支持为可选依赖
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except ImportError:
+    pass
+
+
+_MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+    "PNG": "image/png",
+}
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+ImageBuffer = Union[bytes, mmap.mmap]
+
+
+@dataclass
+class PreparedImage:
+    data: ImageBuffer
+    mime_type: str
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_PREPROCESS_WORKERS,
+            thread_name_prefix="image-preprocess",
+        )
+    return _executor
+
+
+def _preprocess_sync(data: ImageBuffer, content_type: Optional[str]) -> PreparedImage:
+    max_edge = settings.IMAGE_MAX_EDGE
+    output_format = settings.IMAGE_OUTPUT_FORMAT.upper()
+
+    if isinstance(data, mmap.mmap):
+        # mmap 本身是文件对象，避免 BytesIO 复制
+        data.seek(0)
+        source = data
+    else:
+        source = io.BytesIO(data)
+
+    with Image.open(source) as image:
+        source_format = image.format
+        original_size = image.size
+        orientation = image.getexif().get(0x0112, 1)
+
+        # JPEG 可在解码阶段直接降采样，大幅减少解码开销
+        width, height = original_size
+        scale = max_edge / max(width, height)
+        if scale < 1:
+            image.draft("RGB", (int(width * scale), int(height * scale)))
+
+        transposed = ImageOps.exif_transpose(image)
+        if transposed.mode not in ("RGB", "L"):
+            transposed = transposed.convert("RGB")
+
+        transposed.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        buffer = io.BytesIO()
+        save_kwargs = {"quality": settings.IMAGE_QUALITY}
+        if output_format == "JPEG":
+            save_kwargs["optimize"] = True
+        transposed.save(buffer, format=output_format, **save_kwargs)
+        encoded = buffer.getvalue()
+
+    # 原图已经足够小且无需旋转时，重新编码反而变大，保留原图
+    unchanged = orientation == 1 and max(original_size) <= max_edge
+    if unchanged and source_format == output_format and len(encoded) >= len(data):
+        return PreparedImage(data=data, mime_type=content_type or _MIME_TYPES[output_format])
+
+    return PreparedImage(data=encoded, mime_type=_MIME_TYPES.get(output_format, "image/jpeg"))
+
+
+async def preprocess_image(data: ImageBuffer, content_type: Optional[str] = None) -> PreparedImage:
+    """
+    压缩上传图片；无法解码时（如缺少 HEIC 支持）原样返回
+    """
+    try:
+        loop = asyncio.get_running_loop()
+        prepared = await loop.run_in_executor(
+            _get_executor(), _preprocess_sync, data, content_type
+        )
+        print(f"[Image] Preprocessed {len(data)} -> {len(prepared.data)} bytes")
+        return prepared
+    except Exception as e:
+        print(f"[Image] Preprocess failed, using original: {e}")
+        return PreparedImage(data=data, mime_type=content_type or "image/jpeg")
+
+
+def release_buffer(buffer: ImageBuffer) -> None:
+    """关闭上传文件的 mmap；仍有导出的缓冲区引用时交给垃圾回收"""
+    if isinstance(buffer, mmap.mmap):
+        try:
+            buffer.close()
+        except BufferError:
+            pass
+
+
+def shutdown_image_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
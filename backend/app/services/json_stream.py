@@ -0,0 +1,154 @@
+"""
+增量 JSON 解析 - 模型流式输出时尽早取出已完成的字段
+
+只关心最外层对象：
+- 顶层字段的值一旦完整，产出 ("field", key, value)
+- 顶层数组的每个元素一旦完整，产出 ("item", key, index, value)
+JSON 之前的说明文字、```json 代码块标记会被忽略
+"""
+import json
+from typing import Any, List, Optional, Tuple
+
+
+ParseEvent = Tuple[Any, ...]
+
+
+class IncrementalJSONParser:
+    def __init__(self) -> None:
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.done = False
+
+        # 顶层对象状态
+        self._expect_key = False
+        self._key_start: Optional[int] = None
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+
+        # 顶层数组元素状态
+        self._array_key: Optional[str] = None
+        self._item_start: Optional[int] = None
+        self._item_index = 0
+
+    @property
+    def text(self) -> str:
+        return self._buffer
+
+    def feed(self, chunk: str) -> List[ParseEvent]:
+        self._buffer += chunk
+        events: List[ParseEvent] = []
+        buffer = self._buffer
+
+        while self._pos < len(buffer) and not self.done:
+            i = self._pos
+            c = buffer[i]
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._on_string_end(i, events)
+                continue
+
+            if self._depth == 0:
+                if c == "{":
+                    self._depth = 1
+                    self._expect_key = True
+                continue
+
+            if c.isspace():
+                continue
+
+            if c == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect_key:
+                    self._key_start = i
+                else:
+                    self._mark_value_start(i)
+            elif c in "{[":
+                self._mark_value_start(i)
+                if self._depth == 1 and c == "[":
+                    self._array_key = self._key
+                    self._item_start = None
+                    self._item_index = 0
+                self._depth += 1
+            elif c in "}]":
+                self._on_close(i, c, events)
+            elif c == ",":
+                self._on_comma(i, events)
+            elif c == ":":
+                if self._depth == 1:
+                    self._expect_key = False
+            else:
+                # 数字 / true / false / null
+                self._mark_value_start(i)
+
+        return events
+
+    def _mark_value_start(self, i: int) -> None:
+        if self._depth == 1 and not self._expect_key and self._value_start is None:
+            self._value_start = i
+        elif self._depth == 2 and self._array_key is not None and self._item_start is None:
+            self._item_start = i
+
+    def _on_string_end(self, i: int, events: List[ParseEvent]) -> None:
+        if self._depth == 1:
+            if self._key_start is not None:
+                self._key = json.loads(self._buffer[self._key_start:i + 1])
+                self._key_start = None
+            elif self._value_start is not None:
+                self._emit_field(i + 1, events)
+        elif self._depth == 2 and self._item_start is not None:
+            self._emit_item(i + 1, events)
+
+    def _on_close(self, i: int, c: str, events: List[ParseEvent]) -> None:
+        if self._depth == 2 and self._item_start is not None:
+            # 数组最后一个元素是数字等字面量
+            self._emit_item(i, events)
+
+        self._depth -= 1
+
+        if self._depth == 0:
+            if self._value_start is not None:
+                self._emit_field(i, events)
+            self.done = True
+        elif self._depth == 1:
+            if c == "]":
+                self._array_key = None
+            if self._value_start is not None:
+                self._emit_field(i + 1, events)
+        elif self._depth == 2 and self._item_start is not None:
+            self._emit_item(i + 1, events)
+
+    def _on_comma(self, i: int, events: List[ParseEvent]) -> None:
+        if self._depth == 1:
+            if self._value_start is not None:
+                self._emit_field(i, events)
+            self._expect_key = True
+            self._key = None
+        elif self._depth == 2 and self._item_start is not None:
+            self._emit_item(i, events)
+
+    def _emit_field(self, end: int, events: List[ParseEvent]) -> None:
+        raw = self._buffer[self._value_start:end]
+        self._value_start = None
+        try:
+            events.append(("field", self._key, json.loads(raw)))
+        except ValueError:
+            pass
+
+    def _emit_item(self, end: int, events: List[ParseEvent]) -> None:
+        raw = self._buffer[self._item_start:end]
+        self._item_start = None
+        try:
+            events.append(("item", self._array_key, self._item_index, json.loads(raw)))
+        except ValueError:
+            pass
+        self._item_index += 1
@@ -1,21 +1,49 @@
-import json
-import base64
-from typing import Optional, Dict, Any
-import dashscope
-from dashscope import MultiModalConversation, Generation
+import hashlib
+from typing import Optional, Dict, Any, AsyncGenerator, AsyncIterator, Tuple
 
-from app.core.config import settings
-from app.schemas.scene import SceneAnalyzeResponse
+from pydantic import TypeAdapter
 
+from app.schemas.scene import Expressions, SceneLevelContent, SceneVision
+from app.services.dashscope_client import InlineImage, get_dashscope_client, response_text
+from app.services.json_stream import IncrementalJSONParser
+from app.services.structured_output import parse_structured
 
-# 第一阶段 Prompt：基础信息（场景、词汇、描述）
-ANALYZE_BASIC_PROMPT = """你是一个专业的英语学习助手。请分析用户上传的照片，生成基础英语学习内容。
+
+# 视觉识别 Prompt：与 CEFR 等级无关，每张图片只需调用一次千问 VL
+VISION_PROMPT = """你是一个专业的图像识别助手。请分析用户上传的照片，输出客观的识别结果。
 
 ## 任务要求
 
 1. **场景识别**：识别照片中的核心场景，输出1个场景标签
 2. **物品识别**：识别场景中2-5个关键物品
-3. **场景描述**：用英语描述照片内容，不超过50个单词，并提供中文翻译
+3. **场景描述**：用英语客观描述照片内容，不超过80个单词
+
+## 输出格式
+请严格按照以下 JSON 格式输出（不要输出其他任何内容）：
+
+{
+  "scene_tag": "场景英文标签",
+  "scene_tag_cn": "场景中文标签",
+  "objects": [
+    {"en": "英文", "cn": "中文"}
+  ],
+  "description": "英文描述",
+  "category": "分类（学习/生活/旅行/美食/其他）"
+}"""
+
+
+# 第一阶段 Prompt：按 CEFR 等级生成词汇和描述（纯文本，基于视觉识别结果）
+LEVEL_CONTENT_PROMPT = """你是一个专业的英语学习助手。根据以下照片识别结果，生成基础英语学习内容。
+
+## 照片识别结果
+- 场景：{scene_tag} ({scene_tag_cn})
+- 物品：{objects}
+- 场景描述：{description}
+
+## 任务要求
+
+1. **词汇**：为识别出的每个物品给出英文、中文、音标和词性，物品保持与识别结果一致
+2. **场景描述**：用英语描述照片内容，不超过50个单词，并提供中文翻译
 
 ## 难度要求
 请使用 {cefr_level} 水平的词汇和句型。
@@ -24,16 +52,13 @@ ANALYZE_BASIC_PROMPT = """你是一个专业的英语学习助手。请分析用
 请严格按照以下 JSON 格式输出（不要输出其他任何内容）：
 
 {{
-  "scene_tag": "场景英文标签",
-  "scene_tag_cn": "场景中文标签",
   "object_tags": [
     {{"en": "英文", "cn": "中文", "phonetic": "音标", "pos": "词性"}}
   ],
   "description": {{
     "en": "英文描述",
     "cn": "中文描述"
-  }},
-  "category": "分类（学习/生活/旅行/美食/其他）"
+  }}
 }}"""
 
 
@@ -68,89 +93,133 @@ GENERATE_EXPRESSIONS_PROMPT = """你是一个专业的英语学习助手。根
 }}"""
 
 
-# 完整 Prompt（保留兼容性）
-ANALYZE_PROMPT = """你是一个专业的英语学习助手。请分析用户上传的照片，并生成英语学习内容。
+# Prompt 版本：任一 Prompt 变化时自动使分析缓存失效
+PROMPT_VERSION = hashlib.sha256(
+    (VISION_PROMPT + LEVEL_CONTENT_PROMPT + GENERATE_EXPRESSIONS_PROMPT).encode("utf-8")
+).hexdigest()[:12]
 
-## 任务要求
 
-1. **场景识别**：识别照片中的核心场景，输出1个场景标签
-2. **物品识别**：识别场景中2-5个关键物品
-3. **场景描述**：用英语描述照片内容，不超过50个单词，并提供中文翻译
-4. **口语例句**：根据场景推断4个典型角色，每个角色生成2句在此场景下常用的口语表达
+# 预编译的校验器，模块加载时构建一次
+VISION_ADAPTER = TypeAdapter(SceneVision)
+LEVEL_CONTENT_ADAPTER = TypeAdapter(SceneLevelContent)
+EXPRESSIONS_ADAPTER = TypeAdapter(Expressions)
 
-## 难度要求
-请使用 {cefr_level} 水平的词汇和句型。
 
-## 输出格式
-请严格按照以下 JSON 格式输出（不要输出其他任何内容）：
+async def _stream_json(
+    chunks: AsyncIterator[Dict[str, Any]],
+    adapter: TypeAdapter,
+    label: str
+) -> AsyncGenerator[Tuple[Any, ...], None]:
+    """
+    边接收模型增量输出边解析 JSON
 
-{{
-  "scene_tag": "场景英文标签",
-  "scene_tag_cn": "场景中文标签",
-  "object_tags": [
-    {{"en": "英文", "cn": "中文", "phonetic": "音标", "pos": "词性"}}
-  ],
-  "description": {{
-    "en": "英文描述",
-    "cn": "中文描述"
-  }},
-  "expressions": {{
-    "roles": [
-      {{
-        "role_en": "角色英文名",
-        "role_cn": "角色中文名",
-        "sentences": [
-          {{"en": "英文例句", "cn": "中文翻译"}}
-        ]
-      }}
-    ]
-  }},
-  "category": "分类（学习/生活/旅行/美食/其他）"
-}}"""
+    Yields:
+        - ("field", key, value) - 顶层字段完成
+        - ("item", key, index, value) - 顶层数组元素完成
+        - ("result", dict | None) - 完整结果
+    """
+    parser = IncrementalJSONParser()
+    try:
+        async for chunk in chunks:
+            for event in parser.feed(response_text(chunk)):
+                yield event
+    except Exception as e:
+        # 输出中断时尽量利用已收到的部分，由容错解析补全
+        print(f"{label} failed: {e}")
+        if "{" not in parser.text:
+            yield ("result", None)
+            return
 
+    yield ("result", await parse_structured(parser.text, adapter, label))
 
-async def analyze_image_basic(image_data: bytes, cefr_level: str = "B1") -> Optional[Dict[str, Any]]:
-    """
-    第一阶段：使用千问 VL 分析图片，返回基础信息（场景、词汇、描述）
-    不包含口语例句，速度更快
-    """
-    dashscope.api_key = settings.DASHSCOPE_API_KEY
 
-    image_base64 = base64.b64encode(image_data).decode("utf-8")
+async def _collect_result(events: AsyncGenerator[Tuple[Any, ...], None]) -> Optional[Dict[str, Any]]:
+    result = None
+    async for event in events:
+        if event[0] == "result":
+            result = event[1]
+    return result
+
+
+def recognize_scene_stream(
+    image_data: Any,
+    mime_type: str = "image/jpeg"
+) -> AsyncGenerator[Tuple[Any, ...], None]:
+    """
+    视觉识别（流式）：千问 VL 识别场景、物品和客观描述，与 CEFR 等级无关
 
+    image_data 可以是 bytes 或 mmap，发送时分块 base64 编码
+    """
     messages = [
         {
             "role": "user",
             "content": [
-                {"image": f"data:image/jpeg;base64,{image_base64}"},
-                {"text": ANALYZE_BASIC_PROMPT.format(cefr_level=cefr_level)}
+                {"image": InlineImage(image_data, mime_type)},
+                {"text": VISION_PROMPT}
             ]
         }
     ]
 
-    try:
-        response = MultiModalConversation.call(
-            model="qwen-vl-max",
-            messages=messages
-        )
+    chunks = get_dashscope_client().stream_multimodal(
+        model="qwen-vl-max",
+        messages=messages
+    )
+    return _stream_json(chunks, VISION_ADAPTER, "Scene recognition")
 
-        if response.status_code != 200:
-            print(f"Qwen VL API error: {response.message}")
-            return None
 
-        content = response.output.choices[0].message.content[0]["text"]
+async def recognize_scene(image_data: Any, mime_type: str = "image/jpeg") -> Optional[Dict[str, Any]]:
+    """
+    视觉识别：返回 {scene_tag, scene_tag_cn, objects, description, category}
+    """
+    return await _collect_result(recognize_scene_stream(image_data, mime_type))
 
-        start = content.find("{")
-        end = content.rfind("}") + 1
-        if start != -1 and end > start:
-            json_str = content[start:end]
-            return json.loads(json_str)
 
-        return None
+def generate_level_content_stream(
+    vision: Dict[str, Any],
+    cefr_level: str = "B1"
+) -> AsyncGenerator[Tuple[Any, ...], None]:
+    """
+    按 CEFR 等级生成词汇和描述（流式，纯文本模型）
+    """
+    objects = ", ".join(
+        f"{obj.get('en', '')} ({obj.get('cn', '')})" for obj in vision.get("objects", [])
+    )
+    prompt = LEVEL_CONTENT_PROMPT.format(
+        scene_tag=vision.get("scene_tag", ""),
+        scene_tag_cn=vision.get("scene_tag_cn", ""),
+        objects=objects,
+        description=vision.get("description", ""),
+        cefr_level=cefr_level
+    )
 
-    except Exception as e:
-        print(f"Image analysis (basic) failed: {e}")
-        return None
+    chunks = get_dashscope_client().stream_generation(
+        model="qwen-turbo",
+        messages=[{"role": "user", "content": prompt}]
+    )
+    return _stream_json(chunks, LEVEL_CONTENT_ADAPTER, "Generate level content")
+
+
+async def generate_level_content(
+    vision: Dict[str, Any],
+    cefr_level: str = "B1"
+) -> Optional[Dict[str, Any]]:
+    """
+    按 CEFR 等级生成词汇和描述：返回 {object_tags, description}
+    """
+    return await _collect_result(generate_level_content_stream(vision, cefr_level))
+
+
+def merge_basic(vision: Dict[str, Any], level_content: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    合并视觉识别结果和等级内容，得到第一阶段基础信息
+    """
+    return {
+        "scene_tag": vision.get("scene_tag", ""),
+        "scene_tag_cn": vision.get("scene_tag_cn", ""),
+        "object_tags": level_content.get("object_tags", []),
+        "description": level_content.get("description", {}),
+        "category": vision.get("category", ""),
+    }
 
 
 async def generate_expressions(
@@ -163,8 +232,6 @@ async def generate_expressions(
     """
     第二阶段：基于场景信息生成口语例句（纯文本模型，更快）
     """
-    dashscope.api_key = settings.DASHSCOPE_API_KEY
-
     prompt = GENERATE_EXPRESSIONS_PROMPT.format(
         scene_tag=scene_tag,
         scene_tag_cn=scene_tag_cn,
@@ -178,78 +245,31 @@ async def generate_expressions(
     ]
 
     try:
-        response = Generation.call(
+        response = await get_dashscope_client().generation(
             model="qwen-turbo",
             messages=messages
         )
 
-        if response.status_code != 200:
-            print(f"Qwen API error: {response.message}")
-            return None
-
-        content = response.output.text
-
-        start = content.find("{")
-        end = content.rfind("}") + 1
-        if start != -1 and end > start:
-            json_str = content[start:end]
-            return json.loads(json_str)
-
-        return None
+        return await parse_structured(
+            response_text(response), EXPRESSIONS_ADAPTER, "Generate expressions"
+        )
 
     except Exception as e:
         print(f"Generate expressions failed: {e}")
         return None
 
 
-async def analyze_image(image_data: bytes, cefr_level: str = "B1") -> Optional[SceneAnalyzeResponse]:
+async def generate_expressions_for_vision(
+    vision: Dict[str, Any],
+    cefr_level: str = "B1"
+) -> Optional[Dict[str, Any]]:
     """
-    使用千问 VL 多模态模型分析图片
+    基于视觉识别结果生成口语例句，不依赖等级内容，可与其并行
     """
-    dashscope.api_key = settings.DASHSCOPE_API_KEY
-
-    # 将图片转为 base64
-    image_base64 = base64.b64encode(image_data).decode("utf-8")
-
-    # 构建消息
-    messages = [
-        {
-            "role": "user",
-            "content": [
-                {
-                    "image": f"data:image/jpeg;base64,{image_base64}"
-                },
-                {
-                    "text": ANALYZE_PROMPT.format(cefr_level=cefr_level)
-                }
-            ]
-        }
-    ]
-
-    try:
-        response = MultiModalConversation.call(
-            model="qwen-vl-max",
-            messages=messages
-        )
-
-        if response.status_code != 200:
-            print(f"Qwen VL API error: {response.message}")
-            return None
-
-        # 解析返回内容
-        content = response.output.choices[0].message.content[0]["text"]
-
-        # 尝试提取 JSON
-        # 有时模型会在 JSON 前后加入其他文本
-        start = content.find("{")
-        end = content.rfind("}") + 1
-        if start != -1 and end > start:
-            json_str = content[start:end]
-            data = json.loads(json_str)
-            return SceneAnalyzeResponse(**data)
-
-        return None
-
-    except Exception as e:
-        print(f"Image analysis failed: {e}")
-        return None
+    return await generate_expressions(
+        scene_tag=vision.get("scene_tag", ""),
+        scene_tag_cn=vision.get("scene_tag_cn", ""),
+        category=vision.get("category", ""),
+        description_en=vision.get("description", ""),
+        cefr_level=cefr_level
+    )
@@ -0,0 +1,340 @@
+"""
+场景分析流水线
+
+1. 视觉识别（千问 VL）：与 CEFR 等级无关，按图片摘要缓存，每张图片只调用一次
+2. 等级内容（qwen-turbo）：按 CEFR 等级生成词汇和描述
+3. 口语例句（qwen-turbo）：只依赖视觉识别结果，与第 2 步并行
+切换 A2 / B1 / B2 时只需重新调用纯文本模型
+
+相同图片 + 等级的并发请求（弱网下客户端重试）通过 single-flight 共享同一次分析
+"""
+import asyncio
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, List, Optional, Tuple
+
+from app.core.singleflight import SingleFlight
+from app.services.analysis_cache import (
+    analysis_cache_key, get_cached_analysis, image_digest, set_cached_analysis,
+    upload_alias_key, upload_digest
+)
+from app.services.image_preprocess import ImageBuffer, PreparedImage, preprocess_image, release_buffer
+from app.services.qwen_vl import (
+    generate_expressions, generate_expressions_for_vision, generate_level_content,
+    generate_level_content_stream, merge_basic, recognize_scene, recognize_scene_stream
+)
+
+
+# 视觉识别阶段流式推送的字段（与等级无关）
+VISION_FIELDS = ("scene_tag", "scene_tag_cn", "category")
+
+ANALYSIS_FAILED_MESSAGE = "图片分析失败，请重试"
+
+_flights = SingleFlight()
+
+
+def _flight_key(mode: str, digest: str, cefr_level: Optional[str]) -> str:
+    return f"{mode}:{digest}:{cefr_level or ''}"
+
+
+async def load_cached_stages(digest: str, cefr_level: Optional[str]) -> Dict[str, Any]:
+    """
+    读取某等级已缓存的阶段结果：{"basic": ..., "expressions": ...}，未命中的阶段不出现
+    """
+    cached: Dict[str, Any] = {}
+    basic = await get_cached_analysis(analysis_cache_key(digest, cefr_level, "basic"))
+    if basic is not None:
+        cached["basic"] = basic
+        expressions = await get_cached_analysis(analysis_cache_key(digest, cefr_level, "expressions"))
+        if expressions is not None:
+            cached["expressions"] = expressions
+    return cached
+
+
+def full_result(cached: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """两个阶段都已缓存时拼出完整结果"""
+    if "basic" not in cached or "expressions" not in cached:
+        return None
+    return {**cached["basic"], "expressions": cached["expressions"]}
+
+
+async def cached_upload(raw_digest: str, cefr_level: Optional[str]) -> Tuple[Optional[str], Dict[str, Any]]:
+    """
+    按原始上传摘要查缓存，不做预处理
+
+    Returns:
+        (压缩后图片摘要，没见过该上传时为 None, 已缓存的阶段结果)
+    """
+    digest = await get_cached_analysis(upload_alias_key(raw_digest))
+    if digest is None:
+        return None, {}
+    return digest, await load_cached_stages(digest, cefr_level)
+
+
+async def prepare_upload(
+    buffer: ImageBuffer,
+    content_type: Optional[str],
+    raw_digest: str
+) -> Tuple[PreparedImage, str]:
+    """
+    预处理上传图片，并记下 原始摘要 -> 压缩后摘要 的别名
+
+    返回的图片不引用上传文件的 mmap（原图未压缩时复制一份），调用方可以立即关闭映射
+    """
+    prepared = await preprocess_image(buffer, content_type)
+    if prepared.data is buffer and not isinstance(buffer, bytes):
+        prepared = PreparedImage(data=bytes(buffer), mime_type=prepared.mime_type)
+    digest = image_digest(prepared.data)
+    await set_cached_analysis(upload_alias_key(raw_digest), digest)
+    return prepared, digest
+
+
+async def _get_vision(prepared: PreparedImage, digest: str) -> Optional[Dict[str, Any]]:
+    key = analysis_cache_key(digest, None, "vision")
+    vision = await get_cached_analysis(key)
+    if vision is None:
+        vision = await recognize_scene(prepared.data, prepared.mime_type)
+        if vision:
+            await set_cached_analysis(key, vision)
+    return vision
+
+
+async def _generate_expressions(
+    source: Dict[str, Any],
+    cefr_level: Optional[str],
+    digest: str,
+    from_basic: bool = False
+) -> Optional[Dict[str, Any]]:
+    if from_basic:
+        expressions = await generate_expressions(
+            scene_tag=source.get("scene_tag", ""),
+            scene_tag_cn=source.get("scene_tag_cn", ""),
+            category=source.get("category", ""),
+            description_en=source.get("description", {}).get("en", ""),
+            cefr_level=cefr_level
+        )
+    else:
+        expressions = await generate_expressions_for_vision(source, cefr_level)
+
+    if expressions:
+        await set_cached_analysis(analysis_cache_key(digest, cefr_level, "expressions"), expressions)
+    return expressions
+
+
+async def analyze_scene(
+    prepared: PreparedImage,
+    cefr_level: Optional[str]
+) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """
+    完整分析（非流式）
+
+    Returns:
+        (结果 dict 或 None, 是否完全命中缓存)
+    """
+    digest = image_digest(prepared.data)
+    return await _flights.do(
+        _flight_key("full", digest, cefr_level),
+        lambda: _analyze_scene(prepared, cefr_level, digest),
+    )
+
+
+async def _analyze_scene(
+    prepared: PreparedImage,
+    cefr_level: Optional[str],
+    digest: str
+) -> Tuple[Optional[Dict[str, Any]], bool]:
+    cached = await load_cached_stages(digest, cefr_level)
+    basic = cached.get("basic")
+    expressions = cached.get("expressions")
+    if basic is not None and expressions is not None:
+        return {**basic, "expressions": expressions}, True
+
+    if basic is not None:
+        expressions = await _generate_expressions(basic, cefr_level, digest, from_basic=True)
+    else:
+        vision = await _get_vision(prepared, digest)
+        if not vision:
+            return None, False
+
+        level_content, expressions = await asyncio.gather(
+            generate_level_content(vision, cefr_level),
+            _generate_expressions(vision, cefr_level, digest),
+        )
+        if not level_content:
+            return None, False
+
+        basic = merge_basic(vision, level_content)
+        await set_cached_analysis(analysis_cache_key(digest, cefr_level, "basic"), basic)
+
+    if not expressions:
+        return None, False
+    return {**basic, "expressions": expressions}, False
+
+
+def stream_scene_analysis_shared(
+    prepared: Optional[PreparedImage],
+    cefr_level: Optional[str],
+    digest: Optional[str] = None,
+    cached: Optional[Dict[str, Any]] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    流式分析（single-flight）：相同图片 + 等级正在分析时，直接订阅进行中的分析，
+    先重放已产生的事件，再接收后续事件
+
+    cached 含全部阶段时不会用到图片，prepared 可为 None（需传入 digest）
+
+    所有订阅者都断开后取消分析（已完成的阶段已写入缓存）；
+    需要在断开后继续执行的场景使用异步任务接口
+    """
+    digest = digest or image_digest(prepared.data)
+    return _flights.stream(
+        _flight_key("stream", digest, cefr_level),
+        lambda: stream_scene_analysis(prepared, cefr_level, digest, cached),
+        cancel_when_idle=True,
+    )
+
+
+async def stream_scene_analysis(
+    prepared: Optional[PreparedImage],
+    cefr_level: Optional[str],
+    digest: Optional[str] = None,
+    cached: Optional[Dict[str, Any]] = None
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    流式分析，产出 SSE 事件 dict（由调用方序列化）
+
+    事件顺序:
+    - scene_tag / scene_tag_cn / category - 视觉识别字段
+    - object_tag（每个物品一次）/ description - 等级内容字段
+    - basic - 第一阶段完整结果
+    - expressions - 口语例句
+    - done / error
+    """
+    digest = digest or image_digest(prepared.data)
+    if cached is None:
+        cached = await load_cached_stages(digest, cefr_level)
+
+    basic = cached.get("basic")
+    expressions = cached.get("expressions")
+    expressions_task: Optional[asyncio.Task] = None
+
+    try:
+        if basic is None:
+            vision_key = analysis_cache_key(digest, None, "vision")
+            vision = await get_cached_analysis(vision_key)
+            if vision is None:
+                async for event in recognize_scene_stream(prepared.data, prepared.mime_type):
+                    if event[0] == "result":
+                        vision = event[1]
+                    elif event[0] == "field" and event[1] in VISION_FIELDS:
+                        yield {"type": event[1], "data": event[2]}
+                if vision:
+                    await set_cached_analysis(vision_key, vision)
+            else:
+                for field in VISION_FIELDS:
+                    yield {"type": field, "data": vision.get(field, "")}
+
+            if not vision:
+                yield {"type": "error", "message": ANALYSIS_FAILED_MESSAGE}
+                return
+
+            # 口语例句只依赖视觉识别结果，与等级内容并行生成
+            if expressions is None:
+                expressions_task = asyncio.create_task(
+                    _generate_expressions(vision, cefr_level, digest)
+                )
+
+            level_content = None
+            async for event in generate_level_content_stream(vision, cefr_level):
+                if event[0] == "result":
+                    level_content = event[1]
+                elif event[0] == "item" and event[1] == "object_tags":
+                    yield {"type": "object_tag", "index": event[2], "data": event[3]}
+                elif event[0] == "field" and event[1] == "description":
+                    yield {"type": "description", "data": event[2]}
+
+            if not level_content:
+                yield {"type": "error", "message": ANALYSIS_FAILED_MESSAGE}
+                return
+
+            basic = merge_basic(vision, level_content)
+            await set_cached_analysis(analysis_cache_key(digest, cefr_level, "basic"), basic)
+
+        yield {"type": "basic", "data": basic}
+
+        if expressions is None:
+            if expressions_task is not None:
+                expressions = await expressions_task
+            else:
+                expressions = await _generate_expressions(basic, cefr_level, digest, from_basic=True)
+
+        if expressions:
+            yield {"type": "expressions", "data": {"expressions": expressions}}
+
+        yield {"type": "done"}
+
+    finally:
+        if expressions_task is not None and not expressions_task.done():
+            expressions_task.cancel()
+
+
+async def analyze_batch(
+    images: List[Tuple[ImageBuffer, Optional[str]]],
+    cefr_level: Optional[str],
+    concurrency: int
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    批量分析（相册导入），有界并发，按完成顺序产出事件
+
+    images: [(图片 bytes 或上传文件的 mmap, content_type)]，mmap 在分析完成后关闭
+
+    事件:
+    - {"type": "result", "index": i, "data": {...}, "cached": bool}
+    - {"type": "error", "index": i, "message": "..."}
+    - {"type": "progress", "completed": n, "failed": k, "total": N}
+    - {"type": "done"}
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    total = len(images)
+
+    async def run(index: int, buffer: ImageBuffer, content_type: Optional[str]) -> Dict[str, Any]:
+        try:
+            async with semaphore:
+                raw_digest = await upload_digest(buffer)
+                _, cached = await cached_upload(raw_digest, cefr_level)
+                result, hit = full_result(cached), True
+                if result is None:
+                    prepared, _ = await prepare_upload(buffer, content_type, raw_digest)
+                    result, hit = await analyze_scene(prepared, cefr_level)
+            if not result:
+                return {"type": "error", "index": index, "message": ANALYSIS_FAILED_MESSAGE}
+            return {"type": "result", "index": index, "data": result, "cached": hit}
+        except Exception as e:
+            print(f"Batch analysis #{index} failed: {e}")
+            return {"type": "error", "index": index, "message": str(e)}
+        finally:
+            release_buffer(buffer)
+
+    tasks = [
+        asyncio.create_task(run(index, buffer, content_type))
+        for index, (buffer, content_type) in enumerate(images)
+    ]
+
+    completed = 0
+    failed = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            event = await next_done
+            completed += 1
+            if event["type"] == "error":
+                failed += 1
+
+            yield event
+            yield {"type": "progress", "completed": completed, "failed": failed, "total": total}
+
+        yield {"type": "done"}
+
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        for buffer, _ in images:
+            release_buffer(buffer)
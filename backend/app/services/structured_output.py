@@ -0,0 +1,196 @@
+"""
+模型 JSON 输出的容错解析
+
+千问偶尔输出 ```json 代码块、尾逗号，或者因长度限制被截断。
+与其让客户端重新调用一次昂贵的千问 VL，不如：
+1. 修复常见格式问题后再解析
+2. 用预编译的 pydantic TypeAdapter 校验
+3. 缺失 / 不合法的顶层字段只用纯文本模型补全该字段
+"""
+import json
+from typing import Any, Dict, List, Optional, Set
+
+from pydantic import TypeAdapter, ValidationError
+
+from app.services.dashscope_client import get_dashscope_client, response_text
+
+
+_FIELD_REPAIR_PROMPT = """下面是一段不完整的 JSON 数据：
+
+{partial}
+
+请补全以下字段：{fields}
+各字段需符合的 JSON Schema：
+
+{schema}
+
+只输出包含这些字段的 JSON 对象，不要输出其他任何内容。"""
+
+
+def repair_json_text(content: str) -> Optional[str]:
+    """
+    修复模型输出中的常见 JSON 问题：
+    - 前后说明文字和 ``` 代码块标记
+    - 对象 / 数组的尾逗号
+    - 输出被截断（补齐字符串引号和括号）
+    """
+    start = content.find("{")
+    if start == -1:
+        return None
+
+    out: List[str] = []
+    stack: List[str] = []
+    in_string = False
+    escape = False
+
+    for c in content[start:]:
+        if in_string:
+            out.append(c)
+            if escape:
+                escape = False
+            elif c == "\\":
+                escape = True
+            elif c == '"':
+                in_string = False
+            continue
+
+        if c == '"':
+            in_string = True
+        elif c in "{[":
+            stack.append("}" if c == "{" else "]")
+        elif c in "}]":
+            _strip_trailing_comma(out)
+            if not stack:
+                break
+            stack.pop()
+            out.append(c)
+            if not stack:
+                break
+            continue
+        out.append(c)
+
+    if in_string:
+        if escape:
+            out.pop()
+        out.append('"')
+
+    text = "".join(out).rstrip()
+    if stack:
+        text = _drop_incomplete_tail(text, stack[-1]) + "".join(reversed(stack))
+
+    return text
+
+
+def _drop_incomplete_tail(text: str, closer: str) -> str:
+    """截断在冒号或 key 之后时，补 null 或丢弃不完整的键值对"""
+    if text.endswith(":"):
+        return text + " null"
+
+    text = text.rstrip(",").rstrip()
+    if closer == "}" and text.endswith('"'):
+        open_quote = text.rfind('"', 0, len(text) - 1)
+        before = text[:open_quote].rstrip()
+        if open_quote != -1 and before.endswith((",", "{")):
+            return before.rstrip(",").rstrip()
+    return text
+
+
+def _strip_trailing_comma(out: List[str]) -> None:
+    i = len(out) - 1
+    while i >= 0 and out[i].isspace():
+        i -= 1
+    if i >= 0 and out[i] == ",":
+        del out[i]
+
+
+def parse_model_json(content: str) -> Optional[Dict[str, Any]]:
+    """
+    从模型输出中取出 JSON 对象，必要时修复后再解析
+    """
+    start = content.find("{")
+    end = content.rfind("}") + 1
+    if start != -1 and end > start:
+        try:
+            data = json.loads(content[start:end])
+            if isinstance(data, dict):
+                return data
+        except ValueError:
+            pass
+
+    repaired = repair_json_text(content)
+    if repaired is None:
+        return None
+
+    try:
+        data = json.loads(repaired)
+    except ValueError as e:
+        print(f"[StructuredOutput] Unrepairable JSON: {e}")
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _invalid_fields(error: ValidationError) -> Set[str]:
+    fields = set()
+    for item in error.errors():
+        loc = item.get("loc") or ()
+        if loc and isinstance(loc[0], str):
+            fields.add(loc[0])
+    return fields
+
+
+async def _request_fields(
+    partial: Dict[str, Any],
+    fields: Set[str],
+    adapter: TypeAdapter
+) -> Dict[str, Any]:
+    schema = adapter.json_schema()
+    properties = schema.get("properties", {})
+    field_schema = {
+        "properties": {name: properties.get(name, {}) for name in sorted(fields)},
+        "$defs": schema.get("$defs", {}),
+    }
+    prompt = _FIELD_REPAIR_PROMPT.format(
+        partial=json.dumps(partial, ensure_ascii=False),
+        fields=", ".join(sorted(fields)),
+        schema=json.dumps(field_schema, ensure_ascii=False),
+    )
+
+    response = await get_dashscope_client().generation(
+        model="qwen-turbo",
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0,
+    )
+    patch = parse_model_json(response_text(response)) or {}
+    return {name: patch[name] for name in fields if name in patch}
+
+
+async def parse_structured(
+    content: str,
+    adapter: TypeAdapter,
+    label: str
+) -> Optional[Dict[str, Any]]:
+    """
+    解析并校验模型输出，返回校验后的 dict；无法解析或补全失败时返回 None
+    """
+    data = parse_model_json(content)
+    if data is None:
+        print(f"{label}: no JSON object in model output")
+        return None
+
+    try:
+        return adapter.dump_python(adapter.validate_python(data))
+    except ValidationError as e:
+        fields = _invalid_fields(e)
+
+    if not fields:
+        print(f"{label}: model output failed validation")
+        return None
+
+    # 只补全缺失 / 不合法的字段，避免重新调用整个流程
+    print(f"{label}: re-requesting fields {sorted(fields)}")
+    try:
+        patch = await _request_fields(data, fields, adapter)
+        return adapter.dump_python(adapter.validate_python({**data, **patch}))
+    except Exception as e:
+        print(f"{label}: field repair failed: {e}")
+        return None
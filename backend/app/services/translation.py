@@ -2,10 +2,7 @@ import hashlib
 import time
 from typing import Dict, Optional, Tuple
 
-import dashscope
-from dashscope import Generation
-
-from app.core.config import settings
+from app.services.dashscope_client import DashScopeError, get_dashscope_client, response_text
 
 _TRANSLATION_PROMPT = """You are a professional translator.
 Translate the user's text into Simplified Chinese.
@@ -67,7 +64,6 @@ async def translate_to_zh(text: str, session_id: Optional[str]) -> Optional[str]
     if not text or not text.strip():
         return None
 
-    dashscope.api_key = settings.DASHSCOPE_API_KEY
     normalized = _normalize_text(text)
     key = _cache_key(normalized)
     session_key = session_id or "default"
@@ -82,7 +78,7 @@ async def translate_to_zh(text: str, session_id: Optional[str]) -> Optional[str]
         return cached_text
 
     try:
-        response = Generation.call(
+        response = await get_dashscope_client().generation(
             model="qwen-turbo",
             messages=[
                 {"role": "system", "content": _TRANSLATION_PROMPT},
@@ -91,15 +87,15 @@ async def translate_to_zh(text: str, session_id: Optional[str]) -> Optional[str]
             temperature=0,
         )
 
-        if response.status_code != 200:
-            print(f"Translate API error: {response.message}")
-            return None
-
-        translation = _clean_translation(getattr(response.output, "text", "") or "")
+        translation = _clean_translation(response_text(response))
         if translation:
             session_cache[key] = (translation, _now())
         return translation or None
 
+    except DashScopeError as e:
+        print(f"Translate API error: {e.message}")
+        return None
+
     except Exception as e:
         print(f"Translate failed: {e}")
         return None
@@ -0,0 +1,101 @@
+"""
+TTS 音频缓存
+
+同样的句子会被反复合成：场景表达、词汇卡片的单词、相同的开场白……
+缓存键 = hash(规范化文本, 音色, 模型, 音频格式)，值为合成好的音频字节：
+- 内存 LRU，按总字节数限制
+- 可选磁盘目录（TTS_CACHE_DIR），进程重启后仍然命中
+笔记卡片上重复播放同一个单词不会再次调用 DashScope
+"""
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+from app.core.cache import FileCache, LRUCache
+from app.core.config import settings
+
+
+_memory: Optional[LRUCache] = None
+_disk: Optional[FileCache] = None
+
+
+def _get_memory() -> LRUCache:
+    global _memory
+    if _memory is None:
+        _memory = LRUCache(
+            max_items=settings.TTS_CACHE_MAX_ITEMS,
+            max_bytes=settings.TTS_CACHE_MAX_BYTES,
+            ttl_sec=settings.TTS_CACHE_TTL_SEC,
+            sizeof=len,
+        )
+    return _memory
+
+
+def _get_disk() -> Optional[FileCache]:
+    global _disk
+    if _disk is None and settings.TTS_CACHE_DIR:
+        _disk = FileCache(
+            settings.TTS_CACHE_DIR,
+            max_bytes=settings.TTS_CACHE_DISK_MAX_BYTES,
+            ttl_sec=settings.TTS_CACHE_TTL_SEC,
+            suffix=".audio",
+        )
+    return _disk
+
+
+def normalize_tts_text(text: str) -> str:
+    """合并空白；大小写和标点影响语调，保留"""
+    return " ".join(text.split())
+
+
+def tts_cache_key(text: str, speaker: str, model: str, audio_format: str) -> str:
+    parts = [normalize_tts_text(text), speaker, model, audio_format]
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+async def get_cached_audio(key: str) -> Optional[bytes]:
+    audio = _get_memory().get(key)
+    if audio is not None:
+        return audio
+
+    disk = _get_disk()
+    if disk is None:
+        return None
+    try:
+        audio = await disk.get(key)
+    except Exception as e:
+        print(f"[TTS Cache] Disk read failed: {e}")
+        return None
+    if audio is not None:
+        _get_memory().set(key, audio)
+    return audio
+
+
+async def set_cached_audio(key: str, audio: bytes) -> None:
+    _get_memory().set(key, audio)
+
+    disk = _get_disk()
+    if disk is None:
+        return
+    try:
+        await disk.set(key, audio)
+    except Exception as e:
+        print(f"[TTS Cache] Disk write failed: {e}")
+
+
+def tts_cache_stats() -> Dict[str, Any]:
+    disk = _get_disk()
+    return {
+        "memory": _get_memory().stats(),
+        "disk": disk.stats() if disk is not None else None,
+    }
+
+
+def close_tts_cache() -> None:
+    global _memory, _disk
+    if _memory is not None:
+        print(f"[TTS Cache] Closed: {tts_cache_stats()}")
+    if _disk is not None:
+        _disk.close()
+    _memory = None
+    _disk = None
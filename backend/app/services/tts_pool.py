@@ -0,0 +1,218 @@
+"""
+QwenTtsRealtime 连接池
+
+以前每次合成都新建 websocket：TLS 握手 + connect() + update_session()，
+合成完再 finish() 关闭，短句的大部分耗时花在建连上。
+commit 模式下同一会话可以连续 append_text + commit 多次，
+这里按 (音色, 音频格式) 保留已配置好会话的空闲连接：
+- 取用时检查连接仍然存活、未超过空闲时间和最长寿命，否则关闭重建
+- 合成出错 / 被取消 / 超时的连接直接丢弃，不放回池中
+- 复用的连接发送失败（服务端已关闭）时由调用方换新连接重试
+- 后台任务每隔 QWEN_TTS_POOL_IDLE_SEC / 2 关闭失效 / 空闲过久的连接，
+  不再被取用的 (音色, 格式) 组合不会一直占着连接
+
+SDK 的回调在构造时绑定，每条连接用一个转发回调，取用期间指向本次调用的收集器
+"""
+import asyncio
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import dashscope
+from dashscope.audio.qwen_tts_realtime import QwenTtsRealtime, QwenTtsRealtimeCallback
+
+from app.core.config import settings
+
+
+PoolKey = Tuple[str, str]
+
+
+class _Dispatcher(QwenTtsRealtimeCallback):
+    """把 SDK 回调转发给当前使用这条连接的收集器"""
+
+    def __init__(self, connection: "PooledConnection") -> None:
+        super().__init__()
+        self.connection = connection
+        self.target: Optional[QwenTtsRealtimeCallback] = None
+
+    def on_close(self, close_status_code, close_msg) -> None:
+        self.connection.alive = False
+        target = self.target
+        if target is not None:
+            target.on_close(close_status_code, close_msg)
+
+    def on_event(self, response: dict) -> None:
+        if response.get("type") == "error":
+            # 会话级错误后连接状态不可知，不再复用
+            self.connection.alive = False
+        target = self.target
+        if target is not None:
+            target.on_event(response)
+
+
+class PooledConnection:
+    def __init__(self, key: PoolKey, session_config: Dict[str, Any]) -> None:
+        self.key = key
+        self.session_config = session_config
+        self.dispatcher = _Dispatcher(self)
+        self.client: Optional[QwenTtsRealtime] = None
+        self.alive = False
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.uses = 0
+
+    def open(self) -> None:
+        dashscope.api_key = settings.DASHSCOPE_API_KEY
+        self.client = QwenTtsRealtime(
+            model=settings.QWEN_TTS_MODEL,
+            callback=self.dispatcher,
+            url=settings.QWEN_TTS_WS_URL
+        )
+        self.client.connect()
+        self.alive = True
+        self.client.update_session(mode="commit", **self.session_config)
+
+    def bind(self, callback: QwenTtsRealtimeCallback) -> None:
+        self.dispatcher.target = callback
+        self.uses += 1
+
+    def unbind(self) -> None:
+        self.dispatcher.target = None
+        self.last_used = time.monotonic()
+
+    def healthy(self, now: float) -> bool:
+        if not self.alive or self.client is None:
+            return False
+        sock = getattr(self.client.ws, "sock", None)
+        if not (sock and sock.connected):
+            return False
+        if now - self.last_used > settings.QWEN_TTS_POOL_IDLE_SEC:
+            return False
+        return now - self.created_at <= settings.QWEN_TTS_POOL_MAX_AGE_SEC
+
+    def close(self) -> None:
+        self.alive = False
+        if self.client is not None:
+            try:
+                self.client.close()
+            except Exception as e:
+                print(f"[TTS Pool] Close failed: {e}")
+
+
+class TtsConnectionPool:
+    """线程安全：acquire / release 在执行合成的线程池线程里调用"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._idle: Dict[PoolKey, List[PooledConnection]] = {}
+        self.created = 0
+        self.reused = 0
+
+    def _take_idle(self, key: PoolKey) -> Tuple[Optional[PooledConnection], List[PooledConnection]]:
+        now = time.monotonic()
+        stale: List[PooledConnection] = []
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                # 最近用过的连接最可能仍然存活
+                connection = idle.pop()
+                if connection.healthy(now):
+                    return connection, stale
+                stale.append(connection)
+        return None, stale
+
+    def acquire(self, key: PoolKey, session_config: Dict[str, Any]) -> PooledConnection:
+        """取一条已配置会话的连接，没有可用的空闲连接时新建（阻塞）"""
+        connection, stale = self._take_idle(key)
+        for old in stale:
+            old.close()
+        if connection is not None:
+            self.reused += 1
+            return connection
+
+        connection = PooledConnection(key, session_config)
+        try:
+            connection.open()
+        except Exception:
+            connection.close()
+            raise
+        self.created += 1
+        return connection
+
+    def release(self, connection: PooledConnection, reusable: bool) -> None:
+        connection.unbind()
+        if reusable and settings.QWEN_TTS_POOL_MAX_IDLE_PER_KEY > 0:
+            with self._lock:
+                idle = self._idle.setdefault(connection.key, [])
+                if len(idle) < settings.QWEN_TTS_POOL_MAX_IDLE_PER_KEY and connection.healthy(time.monotonic()):
+                    idle.append(connection)
+                    return
+        connection.close()
+
+    def evict_idle(self) -> int:
+        """关闭已失效 / 空闲过久的连接（由后台任务定期调用）"""
+        now = time.monotonic()
+        stale: List[PooledConnection] = []
+        with self._lock:
+            for key, idle in list(self._idle.items()):
+                keep = [c for c in idle if c.healthy(now)]
+                stale.extend(c for c in idle if c not in keep)
+                if keep:
+                    self._idle[key] = keep
+                else:
+                    del self._idle[key]
+        for connection in stale:
+            connection.close()
+        return len(stale)
+
+    def close(self) -> None:
+        with self._lock:
+            connections = [c for idle in self._idle.values() for c in idle]
+            self._idle.clear()
+        for connection in connections:
+            connection.close()
+
+
+_pool: Optional[TtsConnectionPool] = None
+_pool_lock = threading.Lock()
+_reaper: Optional[asyncio.Task] = None
+
+
+def get_tts_pool() -> TtsConnectionPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = TtsConnectionPool()
+        return _pool
+
+
+async def _reap_idle() -> None:
+    interval = max(settings.QWEN_TTS_POOL_IDLE_SEC / 2, 1.0)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            # 关闭 websocket 可能阻塞，放到线程池执行
+            evicted = await asyncio.to_thread(get_tts_pool().evict_idle)
+            if evicted:
+                print(f"[TTS Pool] Evicted {evicted} idle connections")
+        except Exception as e:
+            print(f"[TTS Pool] Eviction failed: {e}")
+
+
+def start_tts_pool_reaper() -> None:
+    """启动空闲连接清理任务（应用启动时调用）"""
+    global _reaper
+    if _reaper is None or _reaper.done():
+        _reaper = asyncio.create_task(_reap_idle())
+
+
+def close_tts_pool() -> None:
+    global _pool, _reaper
+    if _reaper is not None:
+        _reaper.cancel()
+        _reaper = None
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+        print(f"[TTS Pool] Closed (created {pool.created}, reused {pool.reused})")
@@ -0,0 +1,141 @@
+"""
+测试场景分析缓存：通用缓存组件的淘汰 / 过期，以及按图片 + 等级、按原始上传摘要命中
+"""
+import asyncio
+import io
+import os
+import sys
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+from PIL import Image
+
+from app.core import cache as cache_module
+from app.core.cache import LRUCache, SQLiteCache, TieredCache
+from app.core.config import settings
+from app.services import analysis_cache, scene_analysis
+from app.services.analysis_cache import upload_digest
+from app.services.scene_analysis import analyze_scene, cached_upload, full_result, prepare_upload
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    return now
+
+
+def test_lru_limits_and_ttl(clock):
+    lru = LRUCache(max_items=2, max_bytes=10, ttl_sec=60, sizeof=len)
+    lru.set("a", "aaaa")
+    lru.set("b", "bbbb")
+    assert lru.get("a") == "aaaa"  # a 变为最近使用
+    lru.set("c", "cc")
+    assert lru.get("b") is None and lru.get("a") == "aaaa"
+
+    lru.set("d", "dddddd")  # 超出字节上限，淘汰最久未用的
+    assert lru.total_bytes <= 10 and lru.get("d") == "dddddd"
+    lru.set("huge", "x" * 11)  # 单个值超过上限时不缓存
+    assert lru.get("huge") is None
+
+    clock[0] += 61
+    assert lru.get("d") is None
+
+
+def test_sqlite_persistence_ttl_and_eviction(tmp_path, clock):
+    path = str(tmp_path / "cache.db")
+    disk = SQLiteCache(path, max_bytes=10, ttl_sec=60)
+    asyncio.run(disk.set("a", b"aaaa"))
+    disk.close()
+
+    # 重新打开（进程重启）仍能命中
+    disk = SQLiteCache(path, max_bytes=10, ttl_sec=60)
+    assert asyncio.run(disk.get("a")) == b"aaaa"
+
+    clock[0] += 1
+    asyncio.run(disk.set("b", b"bbbb"))
+    clock[0] += 1
+    assert asyncio.run(disk.get("a")) == b"aaaa"  # a 的访问时间比 b 新
+    clock[0] += 1
+    asyncio.run(disk.set("c", b"cccc"))  # 超出 10 字节，淘汰最久未访问的 b
+    assert asyncio.run(disk.get("b")) is None
+    assert asyncio.run(disk.get("a")) == b"aaaa"
+
+    clock[0] += 61
+    assert asyncio.run(disk.get("c")) is None
+    disk.close()
+
+
+def test_tiered_promotes_disk_hits(tmp_path):
+    path = str(tmp_path / "cache.db")
+    writer = TieredCache(LRUCache(max_items=10), SQLiteCache(path, max_bytes=0))
+    asyncio.run(writer.set("k", {"v": [1, "二"]}))
+    writer.close()
+
+    reader = TieredCache(LRUCache(max_items=10), SQLiteCache(path, max_bytes=0))
+    assert reader.memory.get("k") is None
+    assert asyncio.run(reader.get("k")) == {"v": [1, "二"]}
+    assert reader.memory.get("k") == {"v": [1, "二"]}
+    reader.close()
+
+
+class FakeModels:
+    def __init__(self):
+        self.calls = []
+
+    async def recognize_scene(self, image_data, mime_type):
+        self.calls.append("vision")
+        return {"scene_tag": "Cafe", "scene_tag_cn": "咖啡馆", "category": "生活", "objects": ["cup"]}
+
+    async def generate_level_content(self, vision, cefr_level):
+        self.calls.append(f"level:{cefr_level}")
+        return {"object_tags": [{"en": "cup", "cn": "杯子"}], "description": {"en": cefr_level, "cn": "描述"}}
+
+    async def generate_expressions_for_vision(self, vision, cefr_level):
+        self.calls.append(f"expressions:{cefr_level}")
+        return {"roles": []}
+
+
+@pytest.fixture
+def models(monkeypatch, tmp_path):
+    fake = FakeModels()
+    monkeypatch.setattr(settings, "ANALYSIS_CACHE_SQLITE_PATH", str(tmp_path / "analysis.db"))
+    for name in ("recognize_scene", "generate_level_content", "generate_expressions_for_vision"):
+        monkeypatch.setattr(scene_analysis, name, getattr(fake, name))
+    analysis_cache.close_analysis_cache()
+    yield fake
+    analysis_cache.close_analysis_cache()
+
+
+def _jpeg() -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (64, 48), "red").save(out, "JPEG")
+    return out.getvalue()
+
+
+def test_vision_is_shared_across_levels_and_uploads_hit_by_raw_digest(models):
+    upload = _jpeg()
+
+    async def run():
+        raw = await upload_digest(upload)
+        assert await cached_upload(raw, "B1") == (None, {})
+
+        prepared, digest = await prepare_upload(upload, "image/jpeg", raw)
+        b1, hit = await analyze_scene(prepared, "B1")
+        assert not hit and b1["description"]["en"] == "B1"
+
+        # 切换等级只重新生成文本，视觉识别命中缓存
+        a2, hit = await analyze_scene(prepared, "A2")
+        assert not hit and a2["scene_tag"] == "Cafe"
+
+        # 同一文件再次上传：按原始摘要直接取到完整结果，无需预处理
+        cached_digest, cached = await cached_upload(raw, "B1")
+        assert cached_digest == digest and full_result(cached) == b1
+        again, hit = await analyze_scene(prepared, "B1")
+        assert hit and again == b1
+
+    asyncio.run(run())
+    assert models.calls.count("vision") == 1
+    assert sorted(call for call in models.calls if call != "vision") == [
+        "expressions:A2", "expressions:B1", "level:A2", "level:B1"
+    ]
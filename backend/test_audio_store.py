@@ -0,0 +1,85 @@
+"""
+测试音频库：签名地址过期校验、ETag / Range 响应、清理时跳过正在写入的临时文件
+"""
+import asyncio
+import os
+import sys
+import time
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+from app.services import audio_store
+
+
+AUDIO = bytes(range(256)) * 4
+
+
+@pytest.fixture(autouse=True)
+def store(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "TTS_AUDIO_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "PUBLIC_BASE_URL", "")
+    return tmp_path
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+def _saved_url():
+    return asyncio.run(audio_store.deliver_audio(AUDIO, audio_store.DELIVERY_URL, "audio/wav"))
+
+
+def test_signed_url_serves_ranges_and_etag(client):
+    url = _saved_url()
+    assert url.startswith("/api/tts/audio/") and "sig=" in url
+
+    r = client.get(url)
+    assert r.status_code == 200 and r.content == AUDIO
+    etag = r.headers["etag"]
+    assert r.headers["cache-control"].startswith("private")
+
+    r = client.get(url, headers={"If-None-Match": etag})
+    assert r.status_code == 304
+
+    r = client.get(url, headers={"Range": "bytes=0-1"})
+    assert r.status_code == 206 and r.content == AUDIO[:2]
+    assert r.headers["content-range"] == f"bytes 0-1/{len(AUDIO)}"
+
+    r = client.get(url, headers={"Range": "bytes=-10"})
+    assert r.status_code == 206 and r.content == AUDIO[-10:]
+
+    # If-Range 与 ETag 不一致时返回完整内容
+    r = client.get(url, headers={"Range": "bytes=0-1", "If-Range": '"other"'})
+    assert r.status_code == 200 and len(r.content) == len(AUDIO)
+
+
+def test_unsigned_tampered_or_expired_url_is_rejected(client, monkeypatch):
+    url = _saved_url()
+    path = url.split("?", 1)[0]
+    assert client.get(path).status_code == 403
+    assert client.get(url[:-1] + ("0" if url[-1] != "0" else "1")).status_code == 403
+
+    monkeypatch.setattr(settings, "TTS_AUDIO_URL_TTL_SEC", -1)
+    assert client.get(_saved_url()).status_code == 403
+
+
+def test_purge_skips_in_progress_temp_files(store, monkeypatch):
+    audio_id = audio_store._save_sync(AUDIO, "wav")
+    writing = store / f".{audio_id}.123.tmp"
+    writing.write_bytes(b"partial")
+    stale = store / ".abandoned.456.tmp"
+    stale.write_bytes(b"partial")
+    old = time.time() - settings.TTS_AUDIO_STORE_TTL_SEC - 10
+    os.utime(stale, (old, old))
+
+    # 只超出大小上限：删除音频文件，正在写入的临时文件不动
+    monkeypatch.setattr(settings, "TTS_AUDIO_STORE_MAX_BYTES", 1)
+    assert audio_store._purge_sync() == 1
+    assert writing.exists()
+    assert not stale.exists()
+    assert not (store / audio_id).exists()
@@ -0,0 +1,105 @@
+"""
+测试开场白缓存：缓存键包含角色列表，生成时失败的翻译 / 语音在之后命中时补齐
+"""
+import asyncio
+import os
+import sys
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+
+from app.core.config import settings
+from app.services import chat_openers
+from app.services.aliyun_tts import TtsOutputFormat
+
+
+CONTEXT = {
+    "scene_tag": "Hotel",
+    "scene_tag_cn": "酒店",
+    "category": "旅行",
+    "roles": ["Receptionist (前台)", "Guest (客人)"],
+    "user_role": "Guest (客人)",
+    "ai_role": "Receptionist (前台)",
+}
+
+
+class FakeServices:
+    def __init__(self):
+        self.replies = 0
+        self.tts = []
+        self.tts_failures = 0
+
+    async def chat_stream(self, **kwargs):
+        self.replies += 1
+        yield "final", f"Welcome! reply {self.replies}"
+
+    async def translate(self, text, session_id):
+        return "欢迎"
+
+    async def text_to_speech(self, text, voice, delivery, audio_format):
+        self.tts.append(audio_format.key)
+        if self.tts_failures:
+            self.tts_failures -= 1
+            raise RuntimeError("TTS unavailable")
+        return f"data:{audio_format.mime_type};base64,AAA="
+
+
+@pytest.fixture
+def services(monkeypatch):
+    fake = FakeServices()
+    monkeypatch.setattr(settings, "OPENER_CACHE_SQLITE_PATH", "")
+    monkeypatch.setattr(settings, "TTS_OUTPUT_FORMAT", "wav")
+    monkeypatch.setattr(settings, "TTS_OUTPUT_SAMPLE_RATE", 24000)
+    monkeypatch.setattr(chat_openers, "chat_with_scene_stream", fake.chat_stream)
+    monkeypatch.setattr(chat_openers, "translate_to_zh", fake.translate)
+    monkeypatch.setattr(chat_openers, "text_to_speech", fake.text_to_speech)
+    chat_openers.close_opener_cache()
+    yield fake
+    chat_openers.close_opener_cache()
+
+
+def test_missing_audio_is_retried_on_next_hit(services):
+    services.tts_failures = 1
+
+    async def run():
+        first = await chat_openers.get_opener(CONTEXT)
+        assert first["audio_url"] is None and first["translation"] == "欢迎"
+        second = await chat_openers.get_opener(CONTEXT)
+        third = await chat_openers.get_opener(CONTEXT)
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+    # 文本只生成一次，语音在第二次命中时补齐并写回缓存
+    assert services.replies == 1
+    assert second["reply"] == first["reply"] and second["audio_url"].startswith("data:audio/wav")
+    assert third == second
+    assert len(services.tts) == 2
+
+
+def test_key_includes_role_list(services):
+    other_scene = {**CONTEXT, "roles": CONTEXT["roles"] + ["Manager (经理)"]}
+    assert chat_openers.opener_key(CONTEXT) != chat_openers.opener_key(other_scene)
+    assert chat_openers.opener_key(CONTEXT) == chat_openers.opener_key(
+        {**CONTEXT, "roles": [" receptionist  (前台)", "GUEST (客人)"]}
+    )
+
+    async def run():
+        await chat_openers.get_opener(CONTEXT)
+        await chat_openers.get_opener(other_scene)
+
+    asyncio.run(run())
+    assert services.replies == 2
+
+
+def test_other_format_is_synthesized_once(services):
+    mp3 = TtsOutputFormat("mp3", 24000)
+
+    async def run():
+        await chat_openers.get_opener(CONTEXT)
+        first = await chat_openers.get_opener(CONTEXT, mp3)
+        second = await chat_openers.get_opener(CONTEXT, mp3)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first["audio_url"].startswith("data:audio/mpeg") and first == second
+    assert services.tts == ["wav-24000", "mp3-24000"]
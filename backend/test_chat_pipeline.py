@@ -0,0 +1,57 @@
+"""
+测试流式对话的增量分句：普通句末单词不被当成缩写，缩写后不切分
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app.services.chat_pipeline import SentenceSplitter
+
+
+def _split(text, chunk=7, min_chars=0):
+    """按固定长度分块喂入，模拟模型逐 token 输出"""
+    splitter = SentenceSplitter(min_chars=min_chars)
+    sentences = []
+    for i in range(0, len(text), chunk):
+        sentences.extend(splitter.feed(text[i:i + chunk]))
+    rest = splitter.flush()
+    if rest:
+        sentences.append(rest)
+    return sentences
+
+
+def test_word_endings_are_not_abbreviations():
+    text = "Sure, let me check the rooms. We have two left. Breakfast is the best. Anything else?"
+    assert _split(text) == [
+        "Sure, let me check the rooms.",
+        "We have two left.",
+        "Breakfast is the best.",
+        "Anything else?",
+    ]
+
+    words = ["first", "guest", "must", "items", "problems"]
+    text = " ".join(f"This is the {word}." for word in words)
+    assert _split(text) == [f"This is the {word}." for word in words]
+
+
+def test_abbreviations_do_not_split():
+    text = "Ask Dr. Smith at 9 a.m. tomorrow. Mrs. Brown (e.g. the manager) will help. OK!"
+    assert _split(text) == [
+        "Ask Dr. Smith at 9 a.m. tomorrow.",
+        "Mrs. Brown (e.g. the manager) will help.",
+        "OK!",
+    ]
+
+
+def test_short_sentences_merge():
+    assert _split("Oh! That sounds great. Yes.", min_chars=8) == [
+        "Oh! That sounds great.",
+        "Yes.",
+    ]
+
+
+if __name__ == "__main__":
+    test_word_endings_are_not_abbreviations()
+    test_abbreviations_do_not_split()
+    test_short_sentences_merge()
+    print("chat_pipeline 测试通过")
@@ -0,0 +1,119 @@
+"""
+测试对话会话存储：开场白隐藏轮次 + 折叠摘要后，客户端上传的 history 不会让消息丢失或重复
+"""
+import asyncio
+import os
+import sys
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+
+from app.core.config import settings
+from app.services import chat_sessions
+from app.services.chat_openers import OPENER_PROMPT
+
+
+async def _fake_summary(previous, turns, max_words):
+    return f"{previous or ''}[{len(turns)} folded]"
+
+
+@pytest.fixture(autouse=True)
+def sessions(monkeypatch, tmp_path):
+    """临时 SQLite 路径 + 小的折叠阈值；结束后关闭会话存储，不影响其他测试"""
+    monkeypatch.setattr(settings, "CHAT_SESSION_SQLITE_PATH", str(tmp_path / "sessions.db"))
+    monkeypatch.setattr(settings, "CHAT_HISTORY_KEEP_RECENT", 4)
+    monkeypatch.setattr(settings, "CHAT_HISTORY_COMPACT_BATCH", 2)
+    monkeypatch.setattr(settings, "CHAT_HISTORY_TOKEN_BUDGET", 10000)
+    monkeypatch.setattr(chat_sessions, "summarize_conversation", _fake_summary)
+    chat_sessions.close_chat_sessions()
+    yield
+    chat_sessions.close_chat_sessions()
+
+
+async def _wait_compaction():
+    while chat_sessions._compactions:
+        await asyncio.gather(*chat_sessions._compactions.values(), return_exceptions=True)
+
+
+async def _run_turn(session_id, client_history, message, reply):
+    """模拟旧客户端：每轮上传完整历史（含本轮消息，不含开场白的隐藏提示）"""
+    client_history.append({"content": message, "is_user": True})
+    session = await chat_sessions.load_session(
+        session_id, {"scene_tag": "Cafe"}, list(client_history), message
+    )
+    await chat_sessions.record_turn(session_id, session, message, reply)
+    client_history.append({"content": reply, "is_user": False})
+    await _wait_compaction()
+
+
+async def _opener_and_fold():
+    session_id = "test-opener-fold"
+    # 开场白：隐藏提示只在服务端会话里，客户端只显示回复
+    session = await chat_sessions.load_session(session_id, {"scene_tag": "Cafe"}, [], OPENER_PROMPT)
+    await chat_sessions.record_turn(session_id, session, OPENER_PROMPT, "opener")
+    client_history = [{"content": "opener", "is_user": False}]
+
+    for i in range(6):
+        await _run_turn(session_id, client_history, f"user {i}", f"reply {i}")
+
+    stored = await chat_sessions.load_session(session_id)
+    assert stored["summary"], "应已触发折叠"
+    contents = [msg["content"] for msg in stored["history"]]
+    kept = len(contents)
+    expected = [OPENER_PROMPT, "opener"] + [
+        text for i in range(6) for text in (f"user {i}", f"reply {i}")
+    ]
+    # 未折叠部分是完整序列的结尾，既没有丢失也没有重复
+    assert stored["folded"] + kept == len(expected), (stored["folded"], contents)
+    assert contents == expected[-kept:], contents
+
+    # 折叠之后客户端仍上传完整历史，服务端会话不受影响
+    await _run_turn(session_id, client_history, "user 6", "reply 6")
+    latest = await chat_sessions.load_session(session_id)
+    expected += ["user 6", "reply 6"]
+    contents = [msg["content"] for msg in latest["history"]]
+    assert latest["folded"] + len(contents) == len(expected), (latest["folded"], contents)
+    assert contents == expected[-len(contents):], contents
+
+
+async def _compaction_during_turn():
+    session_id = "test-compaction-race"
+    for i in range(3):
+        session = await chat_sessions.load_session(session_id, {"scene_tag": "Cafe"})
+        await chat_sessions.record_turn(session_id, session, f"user {i}", f"reply {i}")
+
+    # 第三轮保存后已安排摘要；下一轮在摘要完成前读到快照，生成回复期间摘要完成
+    assert chat_sessions._compactions
+    session = await chat_sessions.load_session(session_id, {"scene_tag": "Cafe"})
+    await _wait_compaction()
+    compacted = await chat_sessions.load_session(session_id)
+    assert compacted["folded"] == 2 and compacted["summary"]
+
+    await chat_sessions.record_turn(session_id, session, "user 3", "reply 3")
+    await _wait_compaction()
+    latest = await chat_sessions.load_session(session_id)
+    # 摘要没有被旧快照覆盖，新消息追加在未折叠部分之后
+    assert latest["summary"].startswith(compacted["summary"])
+    contents = [msg["content"] for msg in latest["history"]]
+    expected = [text for i in range(4) for text in (f"user {i}", f"reply {i}")]
+    assert latest["folded"] + len(contents) == len(expected), (latest["folded"], contents)
+    assert contents == expected[-len(contents):], contents
+
+
+async def _seed_without_duplicate():
+    # 没有服务端会话时用客户端历史建立，去掉末尾的本轮消息
+    history = [{"content": "hi", "is_user": False}, {"content": "hello", "is_user": True}]
+    session = await chat_sessions.load_session("test-seed", None, history, "hello")
+    assert [msg["content"] for msg in session["history"]] == ["hi"]
+
+
+def test_opener_turn_and_fold():
+    asyncio.run(_opener_and_fold())
+
+
+def test_compaction_during_turn_is_kept():
+    asyncio.run(_compaction_during_turn())
+
+
+def test_seed_strips_current_message():
+    asyncio.run(_seed_without_duplicate())
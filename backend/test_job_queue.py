@@ -0,0 +1,108 @@
+"""
+测试 SQLite 任务队列：多进程认领不重复、租约过期才重新入队、去重
+"""
+import asyncio
+import os
+import sys
+import threading
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+
+from app.core import job_queue
+from app.core.job_queue import DONE, FAILED, QUEUED, RUNNING, SQLiteJobQueue
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "jobs.db")
+
+
+@pytest.fixture
+def queue(db_path):
+    queue = SQLiteJobQueue(db_path)
+    yield queue
+    queue.close()
+
+
+def test_claims_are_exclusive_across_connections(db_path):
+    # 每个队列对象一条连接，模拟多个 worker 进程
+    queues = [SQLiteJobQueue(db_path) for _ in range(4)]
+    for i in range(20):
+        queues[0]._enqueue_sync(f"key-{i}", {"i": i}, b"x")
+
+    claimed = []
+    lock = threading.Lock()
+
+    def worker(queue):
+        while True:
+            job = queue._claim_sync()
+            if job is None:
+                return
+            with lock:
+                claimed.append(job.id)
+
+    threads = [threading.Thread(target=worker, args=(queue,)) for queue in queues]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for queue in queues:
+        queue.close()
+
+    assert len(claimed) == 20 and len(set(claimed)) == 20
+
+
+def test_recover_only_requeues_expired_leases(queue, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(job_queue.time, "time", lambda: now[0])
+
+    async def run():
+        live_id, _ = await queue.enqueue("live", {}, b"x")
+        dead_id, _ = await queue.enqueue("dead", {}, b"x")
+        live = await queue.claim()
+        dead = await queue.claim()
+        assert {live.id, dead.id} == {live_id, dead_id}
+
+        # 存活的 worker 持续续租，已退出的 worker 不再续租
+        now[0] += 50
+        await queue.heartbeat([live.id])
+        now[0] += 30
+        assert await queue.recover(60) == 1
+        assert (await queue.get(live.id)).status == RUNNING
+        assert (await queue.get(dead.id)).status == QUEUED
+
+        again = await queue.claim()
+        assert again.id == dead.id and again.payload == b"x"
+
+    asyncio.run(run())
+
+
+def test_requeue_and_dedupe(queue):
+    async def run():
+        job_id, created = await queue.enqueue("same", {}, b"x")
+        assert created
+        assert await queue.enqueue("same", {}, b"y") == (job_id, False)
+        assert await queue.find("same") == job_id
+
+        job = await queue.claim()
+        # 停机时把仍在运行的任务放回队列
+        assert await queue.requeue([job.id]) == 1
+        assert (await queue.get(job.id)).status == QUEUED
+
+        job = await queue.claim()
+        await queue.complete(job.id, {"ok": True})
+        done = await queue.get(job.id)
+        assert done.status == DONE and done.result == {"ok": True}
+        # 已完成的结果不会被重新计算
+        assert await queue.enqueue("same", {}, b"z") == (job_id, False)
+
+        other_id, _ = await queue.enqueue("other", {}, b"x")
+        await queue.claim()
+        await queue.fail(other_id, "boom")
+        assert (await queue.get(other_id)).status == FAILED
+        # 失败的任务可以重新提交
+        retry_id, created = await queue.enqueue("other", {}, b"x")
+        assert created and retry_id != other_id
+
+    asyncio.run(run())
@@ -0,0 +1,53 @@
+"""
+测试增量 JSON 解析：字段和数组元素完整后立即产出，与分块方式无关
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app.services.json_stream import IncrementalJSONParser
+
+
+CONTENT = (
+    '好的：\n```json\n{"scene_tag": "Cafe", "scene_tag_cn": "咖啡馆 \\"店\\"", '
+    '"object_tags": [{"en": "cup", "cn": "杯子"}, {"en": "a {brace}", "cn": "括号"}], '
+    '"scores": [1, 2.5, null], "confidence": 0.9, "description": {"en": "A [cafe]."}}\n```'
+)
+
+EXPECTED = [
+    ("field", "scene_tag", "Cafe"),
+    ("field", "scene_tag_cn", '咖啡馆 "店"'),
+    ("item", "object_tags", 0, {"en": "cup", "cn": "杯子"}),
+    ("item", "object_tags", 1, {"en": "a {brace}", "cn": "括号"}),
+    ("field", "object_tags", [{"en": "cup", "cn": "杯子"}, {"en": "a {brace}", "cn": "括号"}]),
+    ("item", "scores", 0, 1),
+    ("item", "scores", 1, 2.5),
+    ("item", "scores", 2, None),
+    ("field", "scores", [1, 2.5, None]),
+    ("field", "confidence", 0.9),
+    ("field", "description", {"en": "A [cafe]."}),
+]
+
+
+def _parse(chunk_size):
+    parser = IncrementalJSONParser()
+    events = []
+    for i in range(0, len(CONTENT), chunk_size):
+        events.extend(parser.feed(CONTENT[i:i + chunk_size]))
+    return parser, events
+
+
+def test_events_do_not_depend_on_chunking():
+    for chunk_size in (1, 3, 17, len(CONTENT)):
+        parser, events = _parse(chunk_size)
+        assert events == EXPECTED, chunk_size
+        assert parser.done
+
+
+def test_fields_are_emitted_before_the_object_closes():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"scene_tag": "Cafe", "object_tags": [{"en": "cup"}, ') == [
+        ("field", "scene_tag", "Cafe"),
+        ("item", "object_tags", 0, {"en": "cup"}),
+    ]
+    assert not parser.done
@@ -0,0 +1,68 @@
+"""
+测试模型 JSON 输出的容错解析：代码块、尾逗号、截断修复，以及只补全缺失字段
+"""
+import asyncio
+import os
+import sys
+sys.path.insert(0, os.path.dirname(__file__))
+
+from pydantic import TypeAdapter
+
+from app.schemas.scene import Expressions
+from app.services import structured_output
+from app.services.structured_output import parse_model_json, parse_structured
+
+
+ADAPTER = TypeAdapter(Expressions)
+
+
+def test_fences_and_trailing_commas():
+    content = '好的，结果如下：\n```json\n{"roles": [{"role_en": "Chef", "role_cn": "厨师", "sentences": [],},],}\n```'
+    assert parse_model_json(content) == {
+        "roles": [{"role_en": "Chef", "role_cn": "厨师", "sentences": []}]
+    }
+
+
+def test_truncated_output_is_closed():
+    # 截断在字符串中间：补引号和括号
+    assert parse_model_json('{"scene_tag": "Cafe", "description": "A busy ca') == {
+        "scene_tag": "Cafe", "description": "A busy ca"
+    }
+    # 截断在冒号之后：补 null
+    assert parse_model_json('{"scene_tag": "Cafe", "category":') == {
+        "scene_tag": "Cafe", "category": None
+    }
+    # 截断在 key 之后：丢弃不完整的键值对
+    assert parse_model_json('{"scene_tag": "Cafe", "categ') == {"scene_tag": "Cafe"}
+    # 截断在转义符之后
+    assert parse_model_json('{"text": "say \\') == {"text": "say "}
+    # 括号和引号在字符串内部时不影响结构
+    assert parse_model_json('{"text": "a } b [", "items": [1, 2') == {
+        "text": "a } b [", "items": [1, 2]
+    }
+
+
+def test_no_json_object():
+    assert parse_model_json("抱歉，我无法识别这张图片。") is None
+
+
+def test_missing_field_is_requested_alone(monkeypatch):
+    requested = []
+
+    async def fake_request_fields(partial, fields, adapter):
+        requested.append(sorted(fields))
+        return {"roles": [{"role_en": "Chef", "role_cn": "厨师", "sentences": [{"en": "Hi", "cn": "你好"}]}]}
+
+    monkeypatch.setattr(structured_output, "_request_fields", fake_request_fields)
+    result = asyncio.run(parse_structured('{"rolez": []}', ADAPTER, "test"))
+    assert requested == [["roles"]]
+    assert result["roles"][0]["sentences"] == [{"en": "Hi", "cn": "你好"}]
+
+
+def test_valid_output_needs_no_repair_call(monkeypatch):
+    async def fail(*args):
+        raise AssertionError("不应重新请求字段")
+
+    monkeypatch.setattr(structured_output, "_request_fields", fail)
+    result = asyncio.run(parse_structured('```json\n{"roles": [],}\n```', ADAPTER, "test"))
+    assert result == {"roles": []}
@@ -0,0 +1,91 @@
+"""
+测试 TTS 音频缓存：目录缓存的淘汰 / 过期，以及相同文本 + 音色 + 格式只合成一次
+"""
+import asyncio
+import os
+import sys
+import time
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+
+from app.core.cache import FileCache
+from app.core.config import settings
+from app.services import aliyun_tts, tts_cache
+from app.services.aliyun_tts import TtsOutputFormat
+from app.services.tts_cache import tts_cache_key
+
+
+def _age(path, seconds):
+    old = time.time() - seconds
+    os.utime(path, (old, old))
+
+
+def test_file_cache_evicts_least_recently_used(tmp_path):
+    disk = FileCache(str(tmp_path), max_bytes=10, suffix=".audio")
+    asyncio.run(disk.set("a", b"aaaa"))
+    asyncio.run(disk.set("b", b"bbbb"))
+    _age(tmp_path / "a.audio", 30)
+    _age(tmp_path / "b.audio", 20)
+    assert asyncio.run(disk.get("a")) == b"aaaa"  # 读取刷新 a 的访问时间
+
+    asyncio.run(disk.set("c", b"cccc"))
+    assert asyncio.run(disk.get("b")) is None
+    assert asyncio.run(disk.get("a")) == b"aaaa"
+    assert disk.stats()["bytes"] == 8
+
+    # 重新打开时扫描目录得到总大小，不计入临时文件
+    (tmp_path / ".c.1.2.tmp").write_bytes(b"partial")
+    reopened = FileCache(str(tmp_path), max_bytes=10, suffix=".audio")
+    assert asyncio.run(reopened.get("a")) == b"aaaa"
+    assert reopened.stats()["bytes"] == 8
+
+
+def test_file_cache_ttl(tmp_path):
+    disk = FileCache(str(tmp_path), max_bytes=0, ttl_sec=60)
+    asyncio.run(disk.set("k", b"audio"))
+    assert asyncio.run(disk.get("k")) == b"audio"
+    _age(tmp_path / "k", 61)
+    assert asyncio.run(disk.get("k")) is None
+    assert not (tmp_path / "k").exists()
+
+
+def test_cache_key_normalizes_whitespace_only():
+    key = tts_cache_key("Hello  there!\n", "Cherry", "model", "wav-24000")
+    assert key == tts_cache_key(" Hello there! ", "Cherry", "model", "wav-24000")
+    assert key != tts_cache_key("hello there!", "Cherry", "model", "wav-24000")
+    assert key != tts_cache_key("Hello there!", "Cherry", "model", "mp3-24000")
+
+
+@pytest.fixture
+def synthesis(monkeypatch, tmp_path):
+    calls = []
+
+    async def fake_qwen_tts(text, voice, audio_format):
+        calls.append((text, audio_format.key))
+        return f"{audio_format.key}:{text}".encode("utf-8")
+
+    monkeypatch.setattr(settings, "TTS_CACHE_DIR", str(tmp_path / "tts"))
+    monkeypatch.setattr(aliyun_tts, "_qwen_tts", fake_qwen_tts)
+    tts_cache.close_tts_cache()
+    yield calls
+    tts_cache.close_tts_cache()
+
+
+def test_synthesis_is_cached_per_format_and_survives_restart(synthesis):
+    wav = TtsOutputFormat("wav", 24000)
+    mp3 = TtsOutputFormat("mp3", 24000)
+
+    async def run():
+        first = await aliyun_tts._synthesize("Good morning.", "en-US-female", wav)
+        assert await aliyun_tts._synthesize("Good  morning.", "en-US-female", wav) == first
+        await aliyun_tts._synthesize("Good morning.", "en-US-female", mp3)
+        return first
+
+    first = asyncio.run(run())
+    assert synthesis == [("Good morning.", "wav-24000"), ("Good morning.", "mp3-24000")]
+
+    # 进程重启后内存缓存为空，仍从磁盘命中
+    tts_cache.close_tts_cache()
+    again = asyncio.run(aliyun_tts._synthesize("Good morning.", "en-US-female", wav))
+    assert again == first and len(synthesis) == 2